@@ -0,0 +1,130 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from common.infra_modules.database_module.model_database import DatabaseException, ErrorMessages
+
+
+class AsyncDatabase:
+    """
+    Asyncio facade of the database. The queries run on a dedicated pool of workers and every method returns an
+    awaitable, so a coroutine can wait for many queries at once without one thread each. Calls over the limit of the
+    queue fail at once instead of piling up, and a call that takes longer than the timeout raises DatabaseException
+    (the query running in its worker is not interrupted).
+    """
+
+    def __init__(self, db, workers: int = 4, queue_size: int = 100, timeout: float = 30.0) -> None:
+        """
+        :param db: database module or DatabaseApi to run the queries
+        :param workers: threads running queries at the same time
+        :param queue_size: calls waiting for a worker, more calls raise DatabaseException
+        :param timeout: seconds to wait for the result of a call, None to wait forever
+        """
+        self.db = db
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='async_database')
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+
+    async def run(self, function, *args):
+        """
+        Run a blocking function in the workers of the facade
+        :param function: function to run
+        :param args: arguments of the function
+        :return: result of the function
+        """
+        if not self.slots.acquire(blocking=False):
+            raise DatabaseException(ErrorMessages.QUEUE_FULL_ERROR)
+
+        try:
+            future = self.executor.submit(function, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        # The slot is released when the call finishes or is cancelled before starting
+        future.add_done_callback(lambda f: self.slots.release())
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise DatabaseException(ErrorMessages.TIMEOUT_ERROR)
+
+    async def exec_query(self, query: str, params: dict = None) -> list:
+        """
+        Execute query
+        :param query: query to exec, with the values referenced as :name
+        :param params: values of the parameters of the query
+        :return: list with data
+        """
+        return await self.run(self.db.exec_query, query, params)
+
+    async def exec_many(self, query: str, rows: list) -> int:
+        """
+        Execute query once for each row of parameters
+        :param query: query to exec, with the values referenced as :name
+        :param rows: list of dicts with the values of the parameters
+        :return: number of rows executed
+        """
+        return await self.run(self.db.exec_many, query, rows)
+
+    async def exec_statement(self, name: str, params: dict = None) -> list:
+        """
+        Execute a registered statement
+        :param name: name of the statement
+        :param params: values of the parameters of the statement
+        :return: list with data
+        """
+        return await self.run(self.db.exec_statement, name, params)
+
+    async def insert(self, table: str, data: dict) -> bool:
+        """
+        Insert row in table
+        :param table: table to insert
+        :param data: data to insert
+        :return: operation status
+        """
+        return await self.run(self.db.insert, table, data)
+
+    async def read(self, table: str, sql_filter: str) -> list:
+        """
+        Read rows in table with filter
+        :param table: table to read
+        :param sql_filter: filter to select
+        :return: row list
+        """
+        return await self.run(self.db.read, table, sql_filter)
+
+    async def update(self, table: str, data: dict, sql_filter: str) -> bool:
+        """
+        Update rows in table
+        :param table: table to update
+        :param data: data to update
+        :param sql_filter: filter to search
+        :return: operation status
+        """
+        return await self.run(self.db.update, table, data, sql_filter)
+
+    async def delete(self, table: str, sql_filter: str) -> bool:
+        """
+        Delete rows in table
+        :param table: table to delete
+        :param sql_filter: filter to search
+        :return: operation status
+        """
+        return await self.run(self.db.delete, table, sql_filter)
+
+    async def insert_many(self, table: str, rows: list, chunk_size: int = None) -> int:
+        """
+        Insert rows in table in one transaction
+        :param table: table to insert
+        :param rows: list of dicts with the same columns
+        :param chunk_size: rows sent to the database at once
+        :return: number of rows inserted
+        """
+        return await self.run(self.db.insert_many, table, rows, chunk_size)
+
+    def shutdown(self) -> None:
+        """
+        Stop the workers, the calls waiting for a worker are cancelled
+        :return: None
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
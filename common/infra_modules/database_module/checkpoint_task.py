@@ -0,0 +1,33 @@
+import logging
+
+from common.infra_tools.task_thread import TaskThread
+from common.infra_modules.database_module import MODULE_NAME
+
+
+logger = logging.getLogger(MODULE_NAME)
+
+
+class CheckpointTask(TaskThread):
+    """
+    Checkpoint the write-ahead log of the database every interval. Automatic checkpoints of sqlite do not finish while
+    a report is reading, so the log grows with every ingest; this task copies the pages released since the last run.
+    """
+
+    def __init__(self, db) -> None:
+        """
+        :param db: database implementation, DatabaseApi
+        """
+        TaskThread.__init__(self)
+        self.daemon = True
+        self.db = db
+        self.last_result = None
+
+    def task(self) -> None:
+        try:
+            self.last_result = self.db.checkpoint()
+        except Exception:
+            logger.error('Error checkpointing database', exc_info=True)
+            return
+
+        if self.last_result is not None and self.last_result['checkpointed'] < self.last_result['log']:
+            logger.debug('Checkpoint of database not finished: {}'.format(self.last_result))
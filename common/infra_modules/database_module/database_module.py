@@ -1,8 +1,25 @@
+import contextlib
+import heapq
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+
+from sqlalchemy.engine.url import make_url
+
 from common import config
+from common.app_model import AppException
 from common.infra_modules.infra_module import InfraModule
 from common.infra_tools.decorators import log_function
+from common.infra_tools.parser_tools import striplist
 from common.infra_modules.database_module import MODULE_NAME
+from common.infra_modules.database_module.async_database import AsyncDatabase
+from common.infra_modules.database_module.checkpoint_task import CheckpointTask
 from common.infra_modules.database_module.model_database import DatabaseException
+from common.infra_modules.database_module.query_cache import QueryCache
+from common.infra_modules.database_module.query_stats import QueryStats
+from common.infra_modules.database_module.views_database_module import DatabaseModuleStatsView
 from common.infra_modules.database_module.impl.database_api import DatabaseApi
 from common.infra_modules.database_module.impl.database_api_factory import DatabaseApiFactory
 
@@ -22,25 +39,235 @@ class DatabaseModule(InfraModule):
 
         self.orm_type = self.module_config.get_value(MODULE_NAME, 'orm_type')
         self.connection_database = self.module_config.get_value(MODULE_NAME, 'connection_database')
-        self.db = DatabaseApiFactory.get_connection(self.orm_type, self.connection_database)
+
+        # Pool of connections shared by the threads of the application
+        try:
+            self.pool_size = int(self.module_config.get_value(MODULE_NAME, 'pool_size'))
+        except AppException:
+            self.pool_size = 5
+        try:
+            self.pool_timeout = int(self.module_config.get_value(MODULE_NAME, 'pool_timeout'))
+        except AppException:
+            self.pool_timeout = 30
+
+        # Pragmas of sqlite connections, wal lets the reports read while the tasks write
+        try:
+            self.sqlite_profile = self.module_config.get_value(MODULE_NAME, 'sqlite_profile')
+        except AppException:
+            self.sqlite_profile = 'default'
+
+        # Read replicas of connection_database, separated by commas. Selects run in them and writes in the primary
+        try:
+            self.read_connections = [x for x in striplist(
+                self.module_config.get_value(MODULE_NAME, 'read_connection_database').split(',')) if x != '']
+        except AppException:
+            self.read_connections = list()
+        try:
+            self.replica_strategy = self.module_config.get_value(MODULE_NAME, 'replica_strategy')
+        except AppException:
+            self.replica_strategy = 'round_robin'
+
+        self.db = DatabaseApiFactory.get_connection(self.orm_type, self.connection_database, self.pool_size,
+                                                    self.pool_timeout, self.sqlite_profile, self.read_connections,
+                                                    self.replica_strategy)
+
+        try:
+            self.db.replica_pin_seconds = float(self.module_config.get_value(MODULE_NAME, 'replica_pin_seconds'))
+        except AppException:
+            pass
+
+        # Debug option to log the queries that scan big tables
+        try:
+            self.db.explain_scan_rows = int(self.module_config.get_value(MODULE_NAME, 'explain_scan_rows'))
+        except AppException:
+            self.db.explain_scan_rows = 0
+
+        # Rows sent to the database at once by the bulk operations
+        try:
+            self.db.chunk_size = int(self.module_config.get_value(MODULE_NAME, 'chunk_size'))
+        except AppException:
+            pass
+
+        # Checkpoint of the write-ahead log in background, 0 to disable
+        try:
+            checkpoint_interval = int(self.module_config.get_value(MODULE_NAME, 'checkpoint_interval'))
+        except AppException:
+            checkpoint_interval = 0
+
+        # Shards, separated by commas as key=url. Callers route the rows of a key (a country, a channel) to its own
+        # database with get_shard, the keys not listed use connection_database
+        try:
+            shards = [x for x in striplist(self.module_config.get_value(MODULE_NAME, 'shards').split(',')) if x != '']
+        except AppException:
+            shards = list()
+
+        self.shard_urls = dict()
+        self.shards = dict()
+        for shard in shards:
+            key, _, url = [x.strip() for x in shard.partition('=')]
+            if url == '' or url == self.connection_database:
+                continue
+            db = DatabaseApiFactory.get_shard_connection(self.orm_type, url, self.pool_size, self.pool_timeout,
+                                                         self.sqlite_profile)
+            db.explain_scan_rows = self.db.explain_scan_rows
+            db.chunk_size = self.db.chunk_size
+            self.shard_urls[key] = url
+            self.shards[key] = db
+
+        # Queries fanned out to every database run at the same time
+        self.shard_executor = None
+        if len(self.get_databases()) > 1:
+            self.shard_executor = ThreadPoolExecutor(max_workers=len(self.get_databases()),
+                                                     thread_name_prefix='database_shard')
+
+        self.checkpoint_tasks = list()
+        if checkpoint_interval > 0:
+            for db in self.get_databases():
+                checkpoint_task = CheckpointTask(db)
+                checkpoint_task.set_interval(checkpoint_interval)
+                checkpoint_task.set_initial_delay(checkpoint_interval)
+                checkpoint_task.start()
+                self.checkpoint_tasks.append(checkpoint_task)
+
+        # Cache of the results of select queries, 0 to disable
+        try:
+            query_cache_size = int(self.module_config.get_value(MODULE_NAME, 'query_cache_size'))
+        except AppException:
+            query_cache_size = 0
+        try:
+            query_cache_ttl = float(self.module_config.get_value(MODULE_NAME, 'query_cache_ttl'))
+        except AppException:
+            query_cache_ttl = 30.0
+
+        self.query_cache = QueryCache(query_cache_size, query_cache_ttl) if query_cache_size > 0 else None
+        self.statements = dict()
+        # Tables written by the transaction open in each thread
+        self.local = threading.local()
+
+        # Workers of the asyncio facade, created on first use
+        try:
+            self.async_workers = int(self.module_config.get_value(MODULE_NAME, 'async_workers'))
+        except AppException:
+            self.async_workers = 4
+        try:
+            self.async_queue_size = int(self.module_config.get_value(MODULE_NAME, 'async_queue_size'))
+        except AppException:
+            self.async_queue_size = 100
+        try:
+            self.async_timeout = float(self.module_config.get_value(MODULE_NAME, 'async_timeout'))
+        except AppException:
+            self.async_timeout = 30.0
+        self.async_db = None
+        self.async_db_lock = threading.Lock()
+
+        # Latency by query fingerprint (0 fingerprints to disable) and log of the queries slower than slow_query_ms
+        try:
+            query_stats_size = int(self.module_config.get_value(MODULE_NAME, 'query_stats_size'))
+        except AppException:
+            query_stats_size = 500
+        try:
+            slow_query_ms = float(self.module_config.get_value(MODULE_NAME, 'slow_query_ms'))
+        except AppException:
+            slow_query_ms = 0.0
+
+        self.query_stats = QueryStats(query_stats_size, slow_query_ms) if query_stats_size > 0 else None
+        for db in self.get_databases():
+            db.query_stats = self.query_stats
+
+        self.register_url(DatabaseModuleStatsView, '/database/stats')
 
     def exit(self) -> None:
+        for checkpoint_task in self.checkpoint_tasks:
+            checkpoint_task.shutdown()
+        if self.async_db is not None:
+            self.async_db.shutdown()
+        if self.shard_executor is not None:
+            self.shard_executor.shutdown(wait=False)
         logger.info('SHUTDOWN MODULE')
 
     #@log_function(logger)
-    def exec_query(self, query: str) -> list:
+    def exec_query(self, query: str, params: dict = None) -> list:
         """
         Execute query
-        :param query: query to exec
+        :param query: query to exec, with the values referenced as :name
+        :param params: values of the parameters of the query
         :return: list with data
         """
 
+        if QueryCache.is_select(query):
+            return self.cached_read(query, params, lambda: self.db.exec_query(query, params))
+
+        try:
+            ret = self.db.exec_query(query, params)
+            return ret
+        except DatabaseException as e:
+            logger.error('Error executing query', exc_info=True)
+            return None
+        finally:
+            self.invalidate_query(query)
+
+    def iter_query(self, query: str, params: dict = None, batch_size: int = None):
+        """
+        Execute query and yield the rows as they are read, without loading all of them in memory
+        :param query: query to exec, with the values referenced as :name
+        :param params: values of the parameters of the query
+        :param batch_size: yield lists of up to batch_size rows instead of single rows
+        :return: generator of dicts or lists of dicts
+        """
+
+        try:
+            yield from self.db.iter_query(query, params, batch_size)
+        except DatabaseException as e:
+            logger.error('Error executing query', exc_info=True)
+
+    def exec_many(self, query: str, rows: list) -> int:
+        """
+        Execute query once for each row of parameters
+        :param query: query to exec, with the values referenced as :name
+        :param rows: list of dicts with the values of the parameters
+        :return: number of rows executed
+        """
+
         try:
-            ret = self.db.exec_query(query)
+            ret = self.db.exec_many(query, rows)
             return ret
         except DatabaseException as e:
             logger.error('Error executing query', exc_info=True)
             return None
+        finally:
+            self.invalidate_query(query)
+
+    def register_statement(self, name: str, query: str) -> None:
+        """
+        Register a query to be executed by name with exec_statement
+        :param name: name of the statement
+        :param query: query with the values referenced as :name
+        :return: None
+        """
+
+        self.statements[name] = query
+        self.db.register_statement(name, query)
+
+    def exec_statement(self, name: str, params: dict = None) -> list:
+        """
+        Execute a registered statement
+        :param name: name of the statement
+        :param params: values of the parameters of the statement
+        :return: list with data
+        """
+
+        query = self.statements.get(name, '')
+        if QueryCache.is_select(query):
+            return self.cached_read(query, params, lambda: self.db.exec_statement(name, params))
+
+        try:
+            ret = self.db.exec_statement(name, params)
+            return ret
+        except DatabaseException as e:
+            logger.error('Error executing statement', exc_info=True)
+            return None
+        finally:
+            self.invalidate_query(query)
 
     @log_function(logger)
     def insert(self, table: str, data: dict) -> bool:
@@ -57,6 +284,8 @@ class DatabaseModule(InfraModule):
         except DatabaseException as e:
             logger.error('Error inserting data', exc_info=True)
             return None
+        finally:
+            self.invalidate_tables([table])
 
     @log_function(logger)
     def read(self, table: str, sql_filter: str) -> list:
@@ -67,12 +296,8 @@ class DatabaseModule(InfraModule):
         :return: row list
         """
 
-        try:
-            ret = self.db.read(table, sql_filter)
-            return ret
-        except DatabaseException as e:
-            logger.error('Error reading data', exc_info=True)
-            return None
+        query = 'SELECT * FROM {} WHERE {}'.format(table, sql_filter)
+        return self.cached_read(query, None, lambda: self.db.read(table, sql_filter))
 
     @log_function(logger)
     def update(self, table: str, data: dict, sql_filter: str) -> bool:
@@ -90,6 +315,8 @@ class DatabaseModule(InfraModule):
         except DatabaseException as e:
             logger.error('Error updating data', exc_info=True)
             return None
+        finally:
+            self.invalidate_tables([table])
 
     @log_function(logger)
     def delete(self, table: str, sql_filter: str) -> bool:
@@ -106,3 +333,329 @@ class DatabaseModule(InfraModule):
         except DatabaseException as e:
             logger.error('Error inserting data', exc_info=True)
             return None
+        finally:
+            self.invalidate_tables([table])
+
+    def insert_many(self, table: str, rows, chunk_size: int = None) -> int:
+        """
+        Insert rows in table in one transaction
+        :param table: table to insert
+        :param rows: iterable of dicts with the same columns
+        :param chunk_size: rows sent to the database at once
+        :return: number of rows inserted
+        """
+
+        try:
+            ret = self.db.insert_many(table, rows, chunk_size)
+            return ret
+        except DatabaseException as e:
+            logger.error('Error inserting data', exc_info=True)
+            return None
+        finally:
+            self.invalidate_tables([table])
+
+    def update_many(self, table: str, rows, keys: list, chunk_size: int = None) -> int:
+        """
+        Update rows in table in one transaction
+        :param table: table to update
+        :param rows: iterable of dicts with the same columns, the columns not in keys are updated
+        :param keys: columns to search the row to update
+        :param chunk_size: rows sent to the database at once
+        :return: number of rows processed
+        """
+
+        try:
+            ret = self.db.update_many(table, rows, keys, chunk_size)
+            return ret
+        except DatabaseException as e:
+            logger.error('Error updating data', exc_info=True)
+            return None
+        finally:
+            self.invalidate_tables([table])
+
+    def delete_many(self, table: str, rows, chunk_size: int = None) -> int:
+        """
+        Delete rows in table in one transaction
+        :param table: table to delete
+        :param rows: iterable of dicts with the same columns, the values to search the rows to delete
+        :param chunk_size: rows sent to the database at once
+        :return: number of rows processed
+        """
+
+        try:
+            ret = self.db.delete_many(table, rows, chunk_size)
+            return ret
+        except DatabaseException as e:
+            logger.error('Error deleting data', exc_info=True)
+            return None
+        finally:
+            self.invalidate_tables([table])
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Context manager to run the statements of the block in one transaction. The transaction is committed at the end
+        of the block and rolled back if the block raises an exception. The queries of the block do not use the query
+        cache, and the tables written are invalidated again when it finishes
+        :return: context manager
+        """
+
+        if getattr(self.local, 'tables', None) is not None:
+            with self.db.transaction():
+                yield
+            return
+
+        self.local.tables = set()
+        try:
+            with self.db.transaction():
+                yield
+        finally:
+            tables = self.local.tables
+            self.local.tables = None
+            if self.query_cache is not None and len(tables) > 0:
+                self.query_cache.invalidate(None if None in tables else tables)
+
+    def cached_read(self, query: str, params: dict, execute) -> list:
+        """
+        Result of a select from the query cache, executed and stored when it is not cached or expired
+        :param query: select query, used as key together with params
+        :param params: values of the parameters of the query
+        :param execute: function that executes the query and returns its rows
+        :return: list with data
+        """
+
+        key = None
+        if self.query_cache is not None and getattr(self.local, 'tables', None) is None:
+            key = QueryCache.key(query, params)
+
+        if key is not None:
+            rows = self.query_cache.get(key)
+            if rows is not None:
+                return rows
+            tables = QueryCache.read_tables(query)
+            # A result can not be invalidated without its tables
+            if tables is None:
+                key = None
+            else:
+                snapshot = self.query_cache.snapshot(tables)
+
+        try:
+            rows = execute()
+        except DatabaseException as e:
+            logger.error('Error reading data', exc_info=True)
+            return None
+
+        # A result read from a lagging replica would be served to every thread, the writer included
+        if key is not None and rows is not None and not self.db.replicas_lagging():
+            self.query_cache.put(key, tables, snapshot, rows)
+        return rows
+
+    def invalidate_query(self, query: str) -> None:
+        """
+        Drop the cached results of the table written by a query, or all of them if the table is not known
+        :param query: query executed
+        :return: None
+        """
+
+        if self.query_cache is None or QueryCache.is_select(query):
+            return
+
+        table = QueryCache.write_table(query)
+        self.invalidate_tables([table] if table is not None else None)
+
+    def invalidate_tables(self, tables: list = None) -> None:
+        """
+        Drop the cached results of queries that read the tables. Writes done out of this module, as other connections
+        to the same database, must call it
+        :param tables: names of the tables written, None for all the tables
+        :return: None
+        """
+
+        if self.query_cache is None:
+            return
+
+        self.query_cache.invalidate(tables)
+        if getattr(self.local, 'tables', None) is not None:
+            self.local.tables.update(tables if tables is not None else [None])
+
+    def get_shard(self, key: str) -> DatabaseApi:
+        """
+        Database of the shard of a key. Writes done in a shard must call invalidate_tables
+        :param key: shard key, as a country or a channel name
+        :return: DatabaseApi of the shard, None if the key uses the main database
+        """
+
+        return self.shards.get(key)
+
+    def get_shard_database(self, key: str) -> str:
+        """
+        :param key: shard key, as a country or a channel name
+        :return: database of the url of the shard (the file for sqlite), None if the key uses the main database
+        """
+
+        url = self.shard_urls.get(key)
+        return make_url(url).database if url is not None else None
+
+    def get_databases(self) -> list:
+        """
+        :return: list with the main database and the database of every shard, each one once
+        """
+
+        databases = [self.db]
+        for db in self.shards.values():
+            if db not in databases:
+                databases.append(db)
+        return databases
+
+    def fan_out(self, query: str, params: dict = None, order_by: str = None, reverse: bool = False,
+                limit: int = None) -> list:
+        """
+        Execute a select in the main database and every shard at the same time and merge the rows. The result is not
+        cached
+        :param query: query to exec, with the values referenced as :name
+        :param params: values of the parameters of the query
+        :param order_by: column the query is ordered by in every database, the rows are merged in that order
+        :param reverse: True if the query is ordered descending
+        :param limit: maximum number of rows returned
+        :return: list with data
+        """
+
+        databases = self.get_databases()
+        try:
+            if self.shard_executor is None:
+                results = [db.exec_query(query, params) for db in databases]
+            else:
+                results = list(self.shard_executor.map(lambda db: db.exec_query(query, params), databases))
+        except DatabaseException as e:
+            logger.error('Error executing query', exc_info=True)
+            return None
+
+        if order_by is not None:
+            rows = heapq.merge(*results, key=itemgetter(order_by), reverse=reverse)
+        else:
+            rows = itertools.chain.from_iterable(results)
+        return list(itertools.islice(rows, limit))
+
+    def fan_out_aggregate(self, query: str, params: dict = None, keys: list = (), sums: list = (), maxs: list = (),
+                          mins: list = ()) -> list:
+        """
+        Execute an aggregate select in the main database and every shard and merge the rows of the same group. Counts
+        are merged as sums, averages can not be merged and must be computed from a sum and a count
+        :param query: query to exec, grouped by the columns of keys
+        :param params: values of the parameters of the query
+        :param keys: columns of the groups
+        :param sums: columns added
+        :param maxs: columns merged with the maximum
+        :param mins: columns merged with the minimum
+        :return: list with a row for each group
+        """
+
+        rows = self.fan_out(query, params)
+        if rows is None:
+            return None
+
+        groups = OrderedDict()
+        for row in rows:
+            group = tuple(row[key] for key in keys)
+            merged = groups.get(group)
+            if merged is None:
+                groups[group] = dict(row)
+                continue
+
+            for column in sums:
+                merged[column] = (merged[column] or 0) + (row[column] or 0)
+            for column, function in itertools.chain(((x, max) for x in maxs), ((x, min) for x in mins)):
+                values = [x for x in (merged[column], row[column]) if x is not None]
+                merged[column] = function(values) if len(values) > 0 else None
+        return list(groups.values())
+
+    def iter_fan_out(self, query: str, params: dict = None, batch_size: int = None):
+        """
+        Execute a select in the main database and every shard, one after the other, and yield the rows as they are read
+        :param query: query to exec, with the values referenced as :name
+        :param params: values of the parameters of the query
+        :param batch_size: yield lists of up to batch_size rows instead of single rows
+        :return: generator of dicts or lists of dicts
+        """
+
+        try:
+            for db in self.get_databases():
+                yield from db.iter_query(query, params, batch_size)
+        except DatabaseException as e:
+            logger.error('Error executing query', exc_info=True)
+
+    def iter_table(self, table: str, key: str = 'id', columns: str = '*', batch_size: int = 1000,
+                   fan_out: bool = False):
+        """
+        Read the rows of a table in batches ordered by key, with one query per batch that starts after the last key of
+        the previous one. Unlike iter_query, no connection of the pool is kept checked out while the caller consumes
+        the rows, so slow readers of a streamed response do not make other requests wait for a connection
+        :param table: name of the table
+        :param key: unique column the batches are read by, as id or rowid
+        :param columns: columns of the rows
+        :param batch_size: number of rows of each batch
+        :param fan_out: True to read the table of the main database and then of every shard
+        :return: generator of lists of dicts
+        """
+
+        first_query = 'SELECT {key} AS keyset_key, {columns} FROM {table} ORDER BY {key} LIMIT :limit'.format(
+            key=key, columns=columns, table=table)
+        next_query = 'SELECT {key} AS keyset_key, {columns} FROM {table} WHERE {key} > :after ORDER BY {key} ' \
+                     'LIMIT :limit'.format(key=key, columns=columns, table=table)
+
+        try:
+            for db in self.get_databases() if fan_out else [self.db]:
+                rows = db.exec_query(first_query, {'limit': batch_size})
+                while len(rows) > 0:
+                    after = rows[-1]['keyset_key']
+                    for row in rows:
+                        del row['keyset_key']
+                    yield rows
+                    if len(rows) < batch_size:
+                        break
+                    rows = db.exec_query(next_query, {'after': after, 'limit': batch_size})
+        except DatabaseException as e:
+            logger.error('Error executing query', exc_info=True)
+
+    def get_async(self) -> AsyncDatabase:
+        """
+        Asyncio facade of the module, its methods return awaitables and run the queries in a pool of workers
+        :return: AsyncDatabase
+        """
+
+        with self.async_db_lock:
+            if self.async_db is None:
+                self.async_db = AsyncDatabase(self, self.async_workers, self.async_queue_size, self.async_timeout)
+            return self.async_db
+
+    def get_query_stats(self) -> dict:
+        """
+        Latency histograms by query fingerprint and last slow queries
+        :return: dict with the list of queries, the one with most total time first, and the list of slow queries
+        """
+
+        if self.query_stats is None:
+            return {'queries': list(), 'slow_queries': list(), 'slow_query_ms': 0}
+
+        return {
+            'queries': self.query_stats.get_stats(),
+            'slow_queries': self.query_stats.get_slow_queries(),
+            'slow_query_ms': self.query_stats.slow_query_ms
+        }
+
+    def reset_query_stats(self) -> None:
+        """
+        Clear the latency histograms and the slow queries
+        :return: None
+        """
+
+        if self.query_stats is not None:
+            self.query_stats.reset()
+
+    def get_query_cache_stats(self) -> dict:
+        """
+        Counters of the query cache
+        :return: dict with size, hits, misses, evictions and invalidations, empty if the cache is disabled
+        """
+
+        return self.query_cache.stats() if self.query_cache is not None else dict()
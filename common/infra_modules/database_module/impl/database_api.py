@@ -16,10 +16,52 @@ class DatabaseApi:
         self.connection_database = connection_database
 
     @abc.abstractmethod
-    def exec_query(self, query: str) -> list:
+    def exec_query(self, query: str, params: dict = None) -> list:
         """
         Execute query
-        :param query: query to exec
+        :param query: query to exec, with the values referenced as :name
+        :param params: values of the parameters of the query
+        :return: list with data
+        """
+        pass
+
+    @abc.abstractmethod
+    def iter_query(self, query: str, params: dict = None, batch_size: int = None):
+        """
+        Execute query and yield the rows as they are read from the cursor
+        :param query: query to exec, with the values referenced as :name
+        :param params: values of the parameters of the query
+        :param batch_size: yield lists of up to batch_size rows instead of single rows
+        :return: generator of dictionaries or lists of dictionaries
+        """
+        pass
+
+    @abc.abstractmethod
+    def exec_many(self, query: str, rows: list) -> int:
+        """
+        Execute query once for each row of parameters
+        :param query: query to exec, with the values referenced as :name
+        :param rows: list of dicts with the values of the parameters
+        :return: number of rows executed
+        """
+        pass
+
+    @abc.abstractmethod
+    def register_statement(self, name: str, query: str) -> None:
+        """
+        Register a query to be executed by name
+        :param name: name of the statement
+        :param query: query with the values referenced as :name
+        :return: None
+        """
+        pass
+
+    @abc.abstractmethod
+    def exec_statement(self, name: str, params: dict = None) -> list:
+        """
+        Execute a registered statement
+        :param name: name of the statement
+        :param params: values of the parameters of the statement
         :return: list with data
         """
         pass
@@ -64,3 +106,60 @@ class DatabaseApi:
         :return: operation status
         """
         pass
+
+    @abc.abstractmethod
+    def insert_many(self, table: str, rows, chunk_size: int = None) -> int:
+        """
+        Insert rows in table in one transaction
+        :param table: table to insert
+        :param rows: iterable of dicts with the same columns
+        :param chunk_size: rows sent to the database at once
+        :return: number of rows inserted
+        """
+        pass
+
+    @abc.abstractmethod
+    def update_many(self, table: str, rows, keys: list, chunk_size: int = None) -> int:
+        """
+        Update rows in table in one transaction
+        :param table: table to update
+        :param rows: iterable of dicts with the same columns, the columns not in keys are updated
+        :param keys: columns to search the row to update
+        :param chunk_size: rows sent to the database at once
+        :return: number of rows processed
+        """
+        pass
+
+    @abc.abstractmethod
+    def delete_many(self, table: str, rows, chunk_size: int = None) -> int:
+        """
+        Delete rows in table in one transaction
+        :param table: table to delete
+        :param rows: iterable of dicts with the same columns, the values to search the rows to delete
+        :param chunk_size: rows sent to the database at once
+        :return: number of rows processed
+        """
+        pass
+
+    @abc.abstractmethod
+    def transaction(self):
+        """
+        Context manager to run the statements of the block in one transaction
+        :return: context manager
+        """
+        pass
+
+    @abc.abstractmethod
+    def replicas_lagging(self) -> bool:
+        """
+        :return: True if a select may read a replica that has not received the last writes yet
+        """
+        pass
+
+    @abc.abstractmethod
+    def checkpoint(self) -> dict:
+        """
+        Copy the pages of the write-ahead log to the database without blocking readers or writers
+        :return: dict with busy, log and checkpointed pages, None if the database has no write-ahead log
+        """
+        pass
@@ -10,30 +10,66 @@ class DatabaseApiFactory:
 
     # Static access to implemented class
     _db = None
+    # Implementations of the shards by url
+    _shards = dict()
 
     @staticmethod
-    def get_connection(orm_type: str, connection_database: str) -> DatabaseApi:
+    def get_connection(orm_type: str, connection_database: str, pool_size: int = 5, pool_timeout: int = 30,
+                       sqlite_profile: str = 'default', read_connections: list = None,
+                       replica_strategy: str = 'round_robin') -> DatabaseApi:
         """
         Get orm database implementation
 
         :param orm_type: name of implementation software
         :param connection_database: url connection
+        :param pool_size: connections of the pool shared by all the threads
+        :param pool_timeout: seconds to wait for a free connection of the pool
+        :param sqlite_profile: pragmas applied to sqlite connections, default or wal
+        :param read_connections: urls of the read replicas, selects run in them and writes in connection_database
+        :param replica_strategy: choice of the replica of each select, round_robin or least_loaded
         """
 
         if DatabaseApiFactory._db is None:
-            DatabaseApiFactory._db = DatabaseApiFactory._implement(orm_type, connection_database)
+            DatabaseApiFactory._db = DatabaseApiFactory._implement(orm_type, connection_database, pool_size,
+                                                                   pool_timeout, sqlite_profile, read_connections,
+                                                                   replica_strategy)
         return DatabaseApiFactory._db
 
     @staticmethod
-    def _implement(orm_type: str, connection_database: str) -> DatabaseApi:
+    def get_shard_connection(orm_type: str, connection_database: str, pool_size: int = 5, pool_timeout: int = 30,
+                             sqlite_profile: str = 'default') -> DatabaseApi:
+        """
+        Get orm database implementation of a shard, one for each url
+
+        :param orm_type: name of implementation software
+        :param connection_database: url connection of the shard
+        :param pool_size: connections of the pool shared by all the threads
+        :param pool_timeout: seconds to wait for a free connection of the pool
+        :param sqlite_profile: pragmas applied to sqlite connections, default or wal
+        """
+
+        if connection_database not in DatabaseApiFactory._shards:
+            DatabaseApiFactory._shards[connection_database] = DatabaseApiFactory._implement(
+                orm_type, connection_database, pool_size, pool_timeout, sqlite_profile, None, 'round_robin')
+        return DatabaseApiFactory._shards[connection_database]
+
+    @staticmethod
+    def _implement(orm_type: str, connection_database: str, pool_size: int, pool_timeout: int,
+                   sqlite_profile: str, read_connections: list, replica_strategy: str) -> DatabaseApi:
         """
         Set implementation
 
         :param orm_type: name of implemented software
         :param connection_database: url connection
+        :param pool_size: connections of the pool shared by all the threads
+        :param pool_timeout: seconds to wait for a free connection of the pool
+        :param sqlite_profile: pragmas applied to sqlite connections, default or wal
+        :param read_connections: urls of the read replicas
+        :param replica_strategy: choice of the replica of each select, round_robin or least_loaded
         """
 
         if orm_type == 'sqlalchemy':
-            return DatabaseSqlAlchemy(connection_database)
+            return DatabaseSqlAlchemy(connection_database, pool_size, pool_timeout, sqlite_profile, read_connections,
+                                      replica_strategy)
         else:
             raise DatabaseException(ErrorMessages.CONFIGURATION_ERROR)
@@ -1,4 +1,11 @@
+import contextlib
+import itertools
 import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
 import sqlalchemy
 
 from common.infra_tools.decorators import log_function
@@ -16,11 +23,56 @@ class DatabaseSqlAlchemy(DatabaseApi, DatabaseGeneric):
     Class to define the specific implementation of sql alchemy
     """
 
-    def __init__(self, connection_database: str):
+    # Full scans of tables with more rows than this are logged by explain_query, 0 to disable
+    explain_scan_rows = 0
+
+    # Tables of a query with their alias, the plans of sqlite name the scanned tables by their alias
+    TABLE_ALIAS = re.compile(r'(?:\bFROM|\bJOIN|,)\s+["`\[]?(\w+)["`\]]?\s+(?:AS\s+)?(?!(?:WHERE|GROUP|ORDER|LIMIT|'
+                             r'HAVING|UNION|INTERSECT|EXCEPT|WINDOW|JOIN|INNER|LEFT|RIGHT|FULL|CROSS|NATURAL|ON|USING|'
+                             r'INDEXED|NOT|FROM)\b)(\w+)', re.IGNORECASE)
+
+    # Number of queries with parameters kept compiled, the least recently used is dropped when full
+    statement_cache_size = 256
+
+    # QueryStats recording the latency of every statement, None to disable
+    query_stats = None
+
+    # Seconds a thread keeps reading from the primary after a write, so it reads its writes while the replicas catch up
+    replica_pin_seconds = 5.0
+
+    # Strategies to choose the read replica of a select
+    REPLICA_STRATEGIES = ['round_robin', 'least_loaded']
+
+    # Rows sent to the database at once by insert_many, update_many and delete_many
+    chunk_size = 1000
+
+    # Pragmas applied to every sqlite connection of the pool by sqlite_profile. With the write-ahead log readers do not
+    # block the writer; synchronous=NORMAL only syncs on checkpoint, a power loss can lose the last transactions but
+    # not corrupt the database. The log file is truncated to journal_size_limit after each checkpoint
+    SQLITE_PROFILES = {
+        'default': [],
+        'wal': [
+            ('journal_mode', 'WAL'),
+            ('synchronous', 'NORMAL'),
+            ('journal_size_limit', 64 * 1024 * 1024),
+            ('mmap_size', 256 * 1024 * 1024),
+            ('cache_size', -64 * 1024),
+            ('temp_store', 'MEMORY')
+        ]
+    }
+
+    def __init__(self, connection_database: str, pool_size: int = 5, pool_timeout: int = 30,
+                 sqlite_profile: str = 'default', read_connections: list = None,
+                 replica_strategy: str = 'round_robin'):
         """
         Constructor with connection string
 
-        :param connection_database: url connection from ini file
+        :param connection_database: url connection from ini file, the primary database
+        :param pool_size: connections of the pool shared by all the threads
+        :param pool_timeout: seconds to wait for a free connection of the pool
+        :param sqlite_profile: name of the pragmas of SQLITE_PROFILES applied to sqlite connections
+        :param read_connections: urls of the read replicas of the primary, the selects run in them
+        :param replica_strategy: choice of the replica of each select, round_robin or least_loaded
         :return: This function return nothing
         """
 
@@ -29,9 +81,26 @@ class DatabaseSqlAlchemy(DatabaseApi, DatabaseGeneric):
 
         try:
             # Connect with database
-            conn, engine = self.open_connection()
-            self.conn = conn
-            self.engine = engine
+            self.pool_size = pool_size
+            self.pool_timeout = pool_timeout
+            self.sqlite_profile = sqlite_profile
+            self.engine = self.open_connection()
+
+            if replica_strategy not in self.REPLICA_STRATEGIES:
+                raise DatabaseException(ErrorMessages.CONFIGURATION_ERROR)
+            self.replica_strategy = replica_strategy
+            self.replica_engines = [self.create_engine(url) for url in read_connections or []]
+            # Selects running in each replica and number of selects sent to replicas
+            self.replica_load = [0] * len(self.replica_engines)
+            self.replica_count = 0
+            self.replica_lock = threading.Lock()
+            # Time of the last write of any thread
+            self.last_write = None
+            self.statements = dict()
+            self.statement_cache = OrderedDict()
+            self.statement_cache_lock = threading.Lock()
+            # Connection of the transaction open in each thread
+            self.local = threading.local()
 
         # TODO Catch exception for configuration error and raise exception
         # except errors.ConfigurationError:
@@ -40,23 +109,370 @@ class DatabaseSqlAlchemy(DatabaseApi, DatabaseGeneric):
             raise e
 
     @log_function(logger, logging.DEBUG)
-    def exec_query(self, query: str) -> list:
+    def exec_query(self, query: str, params: dict = None) -> list:
         """
-        Execute query
-        :param query: query to exec
+        Execute query. Values given in params are bound to the query, so the text of the query is the same for every
+        call and the statement prepared by the driver is reused
+        :param query: query to exec, with the values referenced as :name
+        :param params: values of the parameters of the query, None for a query without parameters
+        :return: list with dictionaries
+        """
+        if self.explain_scan_rows > 0 and query.lower().startswith('select'):
+            self.explain_query(query, params)
+
+        if params is None:
+            return self.execute(query)
+        return self.execute(self.compile_statement(query), params)
+
+    def iter_query(self, query: str, params: dict = None, batch_size: int = None):
+        """
+        Execute query and yield the rows as they are read from the cursor, so only one batch of rows is in memory. The
+        connection is kept out of the pool until the generator is exhausted or closed
+        :param query: query to exec, with the values referenced as :name
+        :param params: values of the parameters of the query, None for a query without parameters
+        :param batch_size: yield lists of up to batch_size rows instead of single rows
+        :return: generator of dictionaries or lists of dictionaries
+        """
+        fetch_size = batch_size if batch_size else self.chunk_size
+
+        with self.connection(read=self.is_read(query)) as conn:
+            # Server side cursor in the databases that have them, sqlite cursors already read the rows on demand
+            conn = conn.execution_options(stream_results=True)
+            if params is None:
+                rs = conn.execute(query)
+            else:
+                rs = conn.execute(self.compile_statement(query), params)
+
+            try:
+                rows = rs.fetchmany(fetch_size)
+                while len(rows) > 0:
+                    if batch_size:
+                        yield [dict(row) for row in rows]
+                    else:
+                        for row in rows:
+                            yield dict(row)
+                    rows = rs.fetchmany(fetch_size)
+            finally:
+                rs.close()
+
+    def exec_many(self, query: str, rows: list) -> int:
+        """
+        Execute query once for each row of parameters with the executemany of the driver
+        :param query: query to exec, with the values referenced as :name
+        :param rows: list of dicts with the values of the parameters
+        :return: number of rows executed
+        """
+        if len(rows) == 0:
+            return 0
+
+        self.execute(self.compile_statement(query), rows)
+        return len(rows)
+
+    def register_statement(self, name: str, query: str) -> None:
+        """
+        Register a query to be executed by name, the query is compiled once here
+        :param name: name of the statement
+        :param query: query with the values referenced as :name
+        :return: None
+        """
+        self.statements[name] = sqlalchemy.text(query).compile(dialect=self.engine.dialect)
+
+    @log_function(logger, logging.DEBUG)
+    def exec_statement(self, name: str, params: dict = None) -> list:
+        """
+        Execute a registered statement
+        :param name: name of the statement
+        :param params: values of the parameters of the statement
+        :return: list with dictionaries
+        """
+        statement = self.statements.get(name)
+        if statement is None:
+            raise DatabaseException('{}: {}'.format(ErrorMessages.STATEMENT_ERROR, name))
+
+        return self.execute(statement, params)
+
+    def compile_statement(self, query: str):
+        """
+        Get the compiled statement of a query with parameters from the cache, compiling it if it is not there
+        :param query: query with the values referenced as :name
+        :return: compiled statement
+        """
+        with self.statement_cache_lock:
+            compiled = self.statement_cache.get(query)
+            if compiled is not None:
+                self.statement_cache.move_to_end(query)
+                return compiled
+
+            compiled = sqlalchemy.text(query).compile(dialect=self.engine.dialect)
+            self.statement_cache[query] = compiled
+            if len(self.statement_cache) > self.statement_cache_size:
+                self.statement_cache.popitem(last=False)
+            return compiled
+
+    def execute(self, statement, params=None) -> list:
+        """
+        Execute a statement in the connection of the module, committing it if it does not return rows
+        :param statement: query or compiled statement
+        :param params: dict with the values of the parameters or list of dicts to execute it many times
         :return: list with dictionaries
         """
         list_of_rows = list()
-        if query.lower().startswith('select'):
-            rs = self.conn.execute(query)
-            for row in rs:
-                row_as_dict = dict(row)
-                list_of_rows.append(row_as_dict)
-        else:
-            self.engine.execute(query)
+        start = time.perf_counter()
+        query = statement if isinstance(statement, str) else getattr(statement, 'string', None) or str(statement)
+        read = self.is_read(query)
+        with self.connection(read=read) as conn:
+            conn = conn.execution_options(autocommit=True)
+            rs = conn.execute(statement, params) if params is not None else conn.execute(statement)
+
+            if rs.returns_rows:
+                for row in rs:
+                    row_as_dict = dict(row)
+                    list_of_rows.append(row_as_dict)
+                rows = len(list_of_rows)
+            else:
+                rows = rs.rowcount
+                rs.close()
+
+        if not read:
+            self.local.last_write = time.monotonic()
+            self.last_write = self.local.last_write
+
+        if self.query_stats is not None:
+            self.query_stats.record(query, time.perf_counter() - start, rows)
 
         return list_of_rows
 
+    def is_read(self, query: str) -> bool:
+        """
+        :param query: text of the query
+        :return: True if the query only reads and can run in a read replica
+        """
+        return query.lstrip()[:6].lower() == 'select'
+
+    @contextlib.contextmanager
+    def connection(self, read: bool = False):
+        """
+        Context manager to get the connection of the transaction open in the thread or, if there is none, a connection
+        checked out from the pool and returned to it at the end of the block. Reads use a connection of a replica,
+        except in the replica_pin_seconds after a write of the thread
+        :param read: True if the statements of the block only read
+        :return: context manager with the connection
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+
+        last_write = getattr(self.local, 'last_write', None)
+        pinned = last_write is not None and time.monotonic() - last_write < self.replica_pin_seconds
+        if not read or pinned or len(self.replica_engines) == 0:
+            conn = self.engine.connect()
+            try:
+                yield conn
+            finally:
+                conn.close()
+            return
+
+        replica = self.choose_replica()
+        try:
+            try:
+                conn = self.replica_engines[replica].connect()
+            except sqlalchemy.exc.DBAPIError:
+                logger.warning('Read replica {} not available, reading from primary'.format(replica), exc_info=True)
+                conn = self.engine.connect()
+            try:
+                yield conn
+            finally:
+                conn.close()
+        finally:
+            with self.replica_lock:
+                self.replica_load[replica] = self.replica_load[replica] - 1
+
+    def replicas_lagging(self) -> bool:
+        """
+        :return: True if there are read replicas and any thread wrote in the last replica_pin_seconds, a select may
+        read a replica that has not received the write yet
+        """
+        last_write = self.last_write
+        return len(self.replica_engines) > 0 and last_write is not None and \
+            time.monotonic() - last_write < self.replica_pin_seconds
+
+    def choose_replica(self) -> int:
+        """
+        Choose the replica of a select, by turns or the one running less selects, and count the select in its load
+        :return: index of the replica
+        """
+        with self.replica_lock:
+            if self.replica_strategy == 'least_loaded':
+                replica = min(range(len(self.replica_load)), key=lambda n: (self.replica_load[n], n))
+            else:
+                replica = self.replica_count % len(self.replica_engines)
+            self.replica_count = self.replica_count + 1
+            self.replica_load[replica] = self.replica_load[replica] + 1
+            return replica
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Context manager to run the statements of the block in one transaction, committed at the end of the block or
+        rolled back if it raises. The connection is kept by the thread during the block, so the statements of other
+        threads use other connections of the pool. A block inside another one joins the outer transaction
+        :return: context manager
+        """
+        if getattr(self.local, 'conn', None) is not None:
+            yield
+            return
+
+        conn = self.engine.connect()
+        self.local.conn = conn
+        try:
+            trans = conn.begin()
+            try:
+                yield
+                trans.commit()
+            except Exception:
+                trans.rollback()
+                raise
+        finally:
+            self.local.conn = None
+            conn.close()
+
+    def checkpoint(self) -> dict:
+        """
+        Copy the pages of the write-ahead log to the database without waiting for readers or writers (PASSIVE), the
+        pages still read by a transaction are copied by the next checkpoint
+        :return: dict with busy, log and checkpointed pages, None if the database has no write-ahead log
+        """
+        if self.engine.dialect.name != 'sqlite':
+            return None
+
+        with self.connection() as conn:
+            if conn.execute('PRAGMA journal_mode').scalar().lower() != 'wal':
+                return None
+
+            busy, log, checkpointed = conn.execute('PRAGMA wal_checkpoint(PASSIVE)').first()
+            return {'busy': busy, 'log': log, 'checkpointed': checkpointed}
+
+    def exec_chunks(self, query: str, rows, chunk_size: int = None) -> int:
+        """
+        Execute query for each row of parameters in one transaction, sending chunk_size rows at once
+        :param query: query to exec, with the values referenced as :name
+        :param rows: iterable of dicts with the values of the parameters
+        :param chunk_size: rows sent to the database at once, chunk_size of the class if None
+        :return: number of rows executed
+        """
+        chunk_size = chunk_size if chunk_size else self.chunk_size
+        compiled = self.compile_statement(query)
+        rows = iter(rows)
+        total = 0
+
+        with self.transaction():
+            chunk = list(itertools.islice(rows, chunk_size))
+            while len(chunk) > 0:
+                self.execute(compiled, chunk)
+                total = total + len(chunk)
+                chunk = list(itertools.islice(rows, chunk_size))
+
+        return total
+
+    def insert_many(self, table: str, rows, chunk_size: int = None) -> int:
+        """
+        Insert rows in table in one transaction. The columns of the first row are used as parameters of the query
+        :param table: table to insert
+        :param rows: iterable of dicts with the same columns
+        :param chunk_size: rows sent to the database at once
+        :return: number of rows inserted
+        """
+        rows = iter(rows)
+        first_row = next(rows, None)
+        if first_row is None:
+            return 0
+
+        columns = ','.join(['"{}"'.format(x) for x in first_row.keys()])
+        values = ','.join([':{}'.format(x) for x in first_row.keys()])
+        query = 'INSERT INTO {} ({}) VALUES ({})'.format(table, columns, values)
+        return self.exec_chunks(query, itertools.chain([first_row], rows), chunk_size)
+
+    def update_many(self, table: str, rows, keys: list, chunk_size: int = None) -> int:
+        """
+        Update rows in table in one transaction. The columns of the first row are used as parameters of the query
+        :param table: table to update
+        :param rows: iterable of dicts with the same columns, the columns not in keys are updated
+        :param keys: columns to search the row to update
+        :param chunk_size: rows sent to the database at once
+        :return: number of rows processed
+        """
+        rows = iter(rows)
+        first_row = next(rows, None)
+        if first_row is None:
+            return 0
+
+        values = ','.join(['"{0}"=:{0}'.format(x) for x in first_row.keys() if x not in keys])
+        sql_filter = ' AND '.join(['"{0}"=:{0}'.format(x) for x in keys])
+        query = 'UPDATE {} SET {} WHERE {}'.format(table, values, sql_filter)
+        return self.exec_chunks(query, itertools.chain([first_row], rows), chunk_size)
+
+    def delete_many(self, table: str, rows, chunk_size: int = None) -> int:
+        """
+        Delete rows in table in one transaction. The columns of the first row are used as parameters of the query
+        :param table: table to delete
+        :param rows: iterable of dicts with the same columns, the values to search the rows to delete
+        :param chunk_size: rows sent to the database at once
+        :return: number of rows processed
+        """
+        rows = iter(rows)
+        first_row = next(rows, None)
+        if first_row is None:
+            return 0
+
+        sql_filter = ' AND '.join(['"{0}"=:{0}'.format(x) for x in first_row.keys()])
+        query = 'DELETE FROM {} WHERE {}'.format(table, sql_filter)
+        return self.exec_chunks(query, itertools.chain([first_row], rows), chunk_size)
+
+    def explain_query(self, query: str, params: dict = None) -> list:
+        """
+        Log the full table scans of a query over tables with more than explain_scan_rows rows. Only sqlite plans are
+        checked, the aliases of the plan are mapped to their tables and the rows of a table are estimated with its
+        greatest rowid.
+        :param query: select query to check
+        :param params: values of the parameters of the query
+        :return: list with the names of the big tables scanned
+        """
+        scanned_tables = list()
+        if self.engine.dialect.name != 'sqlite':
+            return scanned_tables
+
+        with self.connection() as conn:
+            try:
+                if params is None:
+                    rs = conn.execute('EXPLAIN QUERY PLAN ' + query)
+                else:
+                    rs = conn.execute(sqlalchemy.text('EXPLAIN QUERY PLAN ' + query), params)
+                plan = [row['detail'] for row in rs]
+            except sqlalchemy.exc.SQLAlchemyError:
+                logger.debug('Query plan not available for: {}'.format(query))
+                return scanned_tables
+
+            aliases = {alias.lower(): table for table, alias in self.TABLE_ALIAS.findall(query)}
+            for detail in plan:
+                match = re.match(r'SCAN (?:TABLE )?(\w+)', detail)
+                if match is None:
+                    continue
+
+                table = aliases.get(match.group(1).lower(), match.group(1))
+                try:
+                    rows = conn.execute('SELECT MAX(rowid) FROM "{}"'.format(table)).scalar() or 0
+                except sqlalchemy.exc.SQLAlchemyError:
+                    # Subqueries, views and aliases not found in the query have no rowid
+                    logger.debug('Rows of scanned table {} not available [{}]: {}'.format(table, detail, query))
+                    continue
+
+                if rows > self.explain_scan_rows:
+                    scanned_tables.append(table)
+                    logger.warning('Full scan of table {} (~{} rows) [{}]: {}'.format(table, rows, detail, query))
+
+        return scanned_tables
+
     @log_function(logger, logging.DEBUG)
     def insert(self, table: str, data: dict) -> bool:
         """
@@ -67,11 +483,10 @@ class DatabaseSqlAlchemy(DatabaseApi, DatabaseGeneric):
         """
 
         columns = ','.join(['"{}"'.format(x) for x in data.keys()])
-        values = ','.join(['"{}"'.format(x) for x in data.values()])
+        values = ','.join([':p{}'.format(n) for n in range(len(data))])
+        params = {'p{}'.format(n): value for n, value in enumerate(data.values())}
 
-        t = sqlalchemy.text('INSERT INTO {} ({}) VALUES ({})'.format(table, columns, values))
-        t.execution_options(autocommit=True)
-        self.conn.execute(t)
+        self.execute(self.compile_statement('INSERT INTO {} ({}) VALUES ({})'.format(table, columns, values)), params)
         return True
 
     @log_function(logger, logging.DEBUG)
@@ -83,13 +498,7 @@ class DatabaseSqlAlchemy(DatabaseApi, DatabaseGeneric):
         :return: row list
         """
         t = sqlalchemy.text('SELECT * FROM {} WHERE {}'.format(table, sql_filter))
-        rs = self.conn.execute(t)
-        list_of_rows = list()
-        for row in rs:
-            row_as_dict = dict(row)
-            list_of_rows.append(row_as_dict)
-
-        return list_of_rows
+        return self.execute(t)
 
     @log_function(logger, logging.DEBUG)
     def update(self, table: str, data: dict, sql_filter: str) -> bool:
@@ -101,11 +510,10 @@ class DatabaseSqlAlchemy(DatabaseApi, DatabaseGeneric):
         :return: operation status
         """
 
-        values = ','.join(['{}="{}"'.format(k, v) for k, v in data.items()])
+        values = ','.join(['"{}"=:p{}'.format(k, n) for n, k in enumerate(data.keys())])
+        params = {'p{}'.format(n): value for n, value in enumerate(data.values())}
 
-        t = sqlalchemy.text('UPDATE {} SET {} WHERE {}'.format(table, values, sql_filter))
-        t.execution_options(autocommit=True)
-        self.conn.execute(t)
+        self.execute(self.compile_statement('UPDATE {} SET {} WHERE {}'.format(table, values, sql_filter)), params)
         return True
 
     @log_function(logger, logging.DEBUG)
@@ -117,18 +525,50 @@ class DatabaseSqlAlchemy(DatabaseApi, DatabaseGeneric):
         :return: operation status
         """
 
-        t = sqlalchemy.text('DELETE FROM {} WHERE {}'.format(table, sql_filter))
-        t.execution_options(autocommit=True)
-        self.conn.execute(t)
+        self.execute(sqlalchemy.text('DELETE FROM {} WHERE {}'.format(table, sql_filter)))
         return True
 
-    def open_connection(self) :
+    def open_connection(self):
         """
-        Get the connection with database.
+        Get the engine with the pool of connections with database.
 
-        :return: object that represents the connection
+        :return: object that represents the engine
+        """
+        return self.create_engine(self.connection_database)
+
+    def create_engine(self, connection_database: str):
+        """
+        Create an engine with its pool of connections
+        :param connection_database: url connection
+        :return: object that represents the engine
         """
-        engine = sqlalchemy.create_engine(self.connection_database,
-                                          connect_args={'check_same_thread': False})
-        conn = engine.connect()
-        return conn, engine
+        url = sqlalchemy.engine.url.make_url(connection_database)
+        if url.get_backend_name() != 'sqlite':
+            return sqlalchemy.create_engine(connection_database, poolclass=sqlalchemy.pool.QueuePool,
+                                            pool_size=self.pool_size, max_overflow=0, pool_timeout=self.pool_timeout)
+
+        pragmas = self.SQLITE_PROFILES.get(self.sqlite_profile)
+        if pragmas is None:
+            raise DatabaseException(ErrorMessages.CONFIGURATION_ERROR)
+
+        # Pooled connections move between threads
+        connect_args = {'check_same_thread': False}
+        if url.database in (None, '', ':memory:'):
+            # Every connection to a memory database opens a new empty database, all the threads share one connection
+            return sqlalchemy.create_engine(connection_database, connect_args=connect_args,
+                                            poolclass=sqlalchemy.pool.StaticPool)
+
+        engine = sqlalchemy.create_engine(connection_database, connect_args=connect_args,
+                                          poolclass=sqlalchemy.pool.QueuePool, pool_size=self.pool_size,
+                                          max_overflow=0, pool_timeout=self.pool_timeout)
+
+        def apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas:
+                cursor.execute('PRAGMA {}={}'.format(name, value))
+            cursor.close()
+
+        if len(pragmas) > 0:
+            sqlalchemy.event.listen(engine, 'connect', apply_pragmas)
+
+        return engine
@@ -35,3 +35,6 @@ class ErrorMessages:
     DELETE_ERROR = 'Error deleting data'
     CONFIGURATION_ERROR = 'Error configuring module'
     SCHEMA_ERROR = 'Error accessing non-existent schema'
+    STATEMENT_ERROR = 'Error executing non-registered statement'
+    QUEUE_FULL_ERROR = 'Too many database calls waiting'
+    TIMEOUT_ERROR = 'Timeout waiting for database call'
@@ -0,0 +1,186 @@
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+
+class QueryCache:
+    """
+    LRU cache of the results of select queries, keyed by the normalized query and its parameters. Every result expires
+    after ttl seconds and is dropped as soon as a write touches one of the tables read by its query.
+    """
+
+    # Whitespace out of quoted literals, normalized to one space
+    WHITESPACE = re.compile(r'(\'[^\']*\'|"[^"]*")|\s+')
+    # Tables read by a select: the comma separated list after each FROM, up to the next clause, and the joined tables.
+    # Each group in parentheses, as a subquery, is read on its own and replaced by SUBQUERY in the outer query
+    FROM_TABLES = re.compile(r'\bFROM\s+(.*?)(?:\b(?:WHERE|GROUP|ORDER|LIMIT|HAVING|UNION|INTERSECT|EXCEPT|WINDOW|JOIN|'
+                             r'INNER|LEFT|RIGHT|FULL|CROSS|NATURAL|ON|USING)\b|;|$)', re.IGNORECASE | re.DOTALL)
+    JOIN_TABLE = re.compile(r'\bJOIN\s+["`\[]?(\w+)', re.IGNORECASE)
+    TABLE_NAME = re.compile(r'\s*["`\[]?(\w+)')
+    PARENTHESES = re.compile(r'\(([^()]*)\)')
+    SUBQUERY = '__subquery__'
+    # Table written by insert, replace, update or delete
+    WRITE_TABLE = re.compile(r'^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|'
+                             r'DELETE\s+FROM)\s+["`\[]?(\w+)', re.IGNORECASE)
+
+    def __init__(self, size: int, ttl: float) -> None:
+        """
+        :param size: maximum number of results kept, the least recently used is evicted when full
+        :param ttl: seconds a result is valid
+        """
+        self.size = size
+        self.ttl = ttl
+        self.results = OrderedDict()
+        # Incremented on every write of a table, a result read before a write is not stored after it
+        self.generations = defaultdict(int)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """
+        Normalize the whitespace of a query, quoted literals are kept as they are
+        :param query: query
+        :return: normalized query
+        """
+        return __class__.WHITESPACE.sub(lambda m: m.group(1) or ' ', query).strip()
+
+    @staticmethod
+    def is_select(query: str) -> bool:
+        return query.lstrip()[:6].lower() == 'select'
+
+    @staticmethod
+    def read_tables(query: str) -> frozenset:
+        """
+        :param query: select query
+        :return: lowercase names of the tables read by the query, None if they can not be determined
+        """
+        groups = list()
+        replaced = 1
+        while replaced > 0:
+            query, replaced = __class__.PARENTHESES.subn(lambda m: groups.append(m.group(1)) or __class__.SUBQUERY,
+                                                         query)
+        groups.append(query)
+
+        tables = set()
+        for group in groups:
+            tables.update(__class__.JOIN_TABLE.findall(group))
+            for from_list in __class__.FROM_TABLES.findall(group):
+                for item in from_list.split(','):
+                    match = __class__.TABLE_NAME.match(item)
+                    if match is None:
+                        return None
+                    tables.add(match.group(1))
+        tables.discard(__class__.SUBQUERY)
+        return frozenset(table.lower() for table in tables)
+
+    @staticmethod
+    def write_table(query: str) -> str:
+        """
+        :param query: query that modifies the database
+        :return: lowercase name of the table written, None if it is not known
+        """
+        match = __class__.WRITE_TABLE.match(query)
+        return match.group(1).lower() if match is not None else None
+
+    @staticmethod
+    def key(query: str, params: dict = None):
+        """
+        :param query: query
+        :param params: values of the parameters of the query
+        :return: key of the result, None if the parameters can not be part of a key
+        """
+        try:
+            items = tuple(sorted(params.items())) if params else ()
+            hash(items)
+        except TypeError:
+            return None
+        return __class__.normalize(query), items
+
+    def snapshot(self, tables: frozenset) -> tuple:
+        """
+        Generations of the tables before executing a query, needed to store its result with put
+        :param tables: tables read by the query
+        :return: generations of the tables
+        """
+        with self.lock:
+            return tuple(self.generations[table] for table in sorted(tables))
+
+    def get(self, key):
+        """
+        :param key: key of the result
+        :return: copy of the rows of the result, None if not cached or expired
+        """
+        with self.lock:
+            entry = self.results.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.results[key]
+                self.misses = self.misses + 1
+                return None
+
+            self.results.move_to_end(key)
+            self.hits = self.hits + 1
+            rows = entry[2]
+
+        # Callers may change the rows they receive
+        return [dict(row) for row in rows]
+
+    def put(self, key, tables: frozenset, snapshot: tuple, rows: list) -> None:
+        """
+        Store the result of a query, unless one of its tables has been written since the snapshot
+        :param key: key of the result
+        :param tables: tables read by the query
+        :param snapshot: generations of the tables before the query was executed
+        :param rows: rows of the result
+        :return: None
+        """
+        with self.lock:
+            if tuple(self.generations[table] for table in sorted(tables)) != snapshot:
+                return
+
+            self.results[key] = (time.monotonic() + self.ttl, tables, [dict(row) for row in rows])
+            self.results.move_to_end(key)
+            while len(self.results) > self.size:
+                self.results.popitem(last=False)
+                self.evictions = self.evictions + 1
+
+    def invalidate(self, tables=None) -> None:
+        """
+        Drop the results that read any of the tables
+        :param tables: names of the tables written, None to drop all the results
+        :return: None
+        """
+        with self.lock:
+            if tables is None:
+                for table in list(self.generations.keys()):
+                    self.generations[table] = self.generations[table] + 1
+                self.invalidations = self.invalidations + len(self.results)
+                self.results.clear()
+                return
+
+            tables = frozenset(table.lower() for table in tables)
+            for table in tables:
+                self.generations[table] = self.generations[table] + 1
+            for key in [key for key, entry in self.results.items() if not entry[1].isdisjoint(tables)]:
+                del self.results[key]
+                self.invalidations = self.invalidations + 1
+
+    def stats(self) -> dict:
+        """
+        :return: dict with the counters of the cache
+        """
+        with self.lock:
+            return {
+                'size': len(self.results),
+                'max_size': self.size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,151 @@
+import bisect
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+from common.infra_modules.database_module import MODULE_NAME
+
+
+logger = logging.getLogger(MODULE_NAME)
+
+
+class QueryHistogram:
+    """
+    Latencies of the executions of one query fingerprint, counted in buckets of growing size
+    """
+
+    # Upper bounds of the buckets in milliseconds, the last bucket counts the slower executions
+    BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+    def __init__(self, fingerprint: str) -> None:
+        self.fingerprint = fingerprint
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(self.BUCKETS_MS) + 1)
+
+    def add(self, elapsed_ms: float, rows: int) -> None:
+        self.count = self.count + 1
+        self.total_ms = self.total_ms + elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows = self.rows + max(rows, 0)
+        self.buckets[bisect.bisect_left(self.BUCKETS_MS, elapsed_ms)] += 1
+
+    def percentile(self, percent: float) -> float:
+        """
+        Estimate a percentile with the upper bound of its bucket
+        :param percent: percentile, between 0 and 100
+        :return: latency in milliseconds
+        """
+        target = self.count * percent / 100.0
+        accumulated = 0
+        for n, count in enumerate(self.buckets):
+            accumulated = accumulated + count
+            if accumulated >= target and count > 0:
+                bound = self.BUCKETS_MS[n] if n < len(self.BUCKETS_MS) else self.max_ms
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def to_dict(self) -> dict:
+        return {
+            'fingerprint': self.fingerprint,
+            'count': self.count,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count > 0 else 0.0,
+            'p50_ms': round(self.percentile(50), 3),
+            'p95_ms': round(self.percentile(95), 3),
+            'p99_ms': round(self.percentile(99), 3),
+            'max_ms': round(self.max_ms, 3),
+            'rows': self.rows
+        }
+
+
+class QueryStats:
+    """
+    Latency histograms and row counts by query fingerprint, and log of the queries slower than a threshold. The
+    fingerprint of a query replaces its quoted strings, numbers and lists of values with ?, so the executions of the same
+    query with other values are counted together.
+    """
+
+    LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+    VALUE_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+    WHITESPACE = re.compile(r'\s+')
+    # Fingerprints beyond max_fingerprints are counted together
+    OTHER = '<other>'
+
+    def __init__(self, max_fingerprints: int = 500, slow_query_ms: float = 0.0, slow_log_size: int = 100) -> None:
+        """
+        :param max_fingerprints: maximum number of fingerprints with their own histogram
+        :param slow_query_ms: executions slower than this are logged, 0 to disable
+        :param slow_log_size: number of slow executions kept to be returned by get_slow_queries
+        """
+        self.max_fingerprints = max_fingerprints
+        self.slow_query_ms = slow_query_ms
+        self.histograms = dict()
+        self.slow_queries = deque(maxlen=slow_log_size)
+        self.fingerprints = dict()
+        self.lock = threading.Lock()
+
+    def fingerprint(self, query: str) -> str:
+        """
+        :param query: text of the query
+        :return: query without the values
+        """
+        fingerprint = self.fingerprints.get(query)
+        if fingerprint is None:
+            fingerprint = self.LITERALS.sub('?', query)
+            fingerprint = self.VALUE_LISTS.sub('(?)', fingerprint)
+            fingerprint = self.WHITESPACE.sub(' ', fingerprint).strip()
+            if len(self.fingerprints) >= self.max_fingerprints * 4:
+                self.fingerprints.clear()
+            self.fingerprints[query] = fingerprint
+        return fingerprint
+
+    def record(self, query: str, elapsed: float, rows: int) -> None:
+        """
+        Add an execution of a query
+        :param query: text of the query
+        :param elapsed: seconds of the execution
+        :param rows: rows returned or changed, -1 if not known
+        :return: None
+        """
+        fingerprint = self.fingerprint(query)
+        elapsed_ms = elapsed * 1000
+
+        with self.lock:
+            histogram = self.histograms.get(fingerprint)
+            if histogram is None:
+                if len(self.histograms) >= self.max_fingerprints:
+                    fingerprint = self.OTHER
+                histogram = self.histograms.setdefault(fingerprint, QueryHistogram(fingerprint))
+            histogram.add(elapsed_ms, rows)
+
+            if 0 < self.slow_query_ms <= elapsed_ms:
+                self.slow_queries.append({'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'elapsed_ms': round(elapsed_ms, 3),
+                                          'rows': rows, 'query': query})
+
+        if 0 < self.slow_query_ms <= elapsed_ms:
+            logger.warning('Slow query ({:.1f} ms, {} rows): {}'.format(elapsed_ms, rows, query))
+
+    def get_stats(self) -> list:
+        """
+        :return: list with the stats of every fingerprint, the one with most total time first
+        """
+        with self.lock:
+            stats = [histogram.to_dict() for histogram in self.histograms.values()]
+        return sorted(stats, key=lambda x: x['total_ms'], reverse=True)
+
+    def get_slow_queries(self) -> list:
+        """
+        :return: list with the last slow executions, the newest last
+        """
+        with self.lock:
+            return list(self.slow_queries)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.histograms.clear()
+            self.slow_queries.clear()
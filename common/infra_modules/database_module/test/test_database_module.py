@@ -1,8 +1,18 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
 import time
 from nose.tools import assert_equal, assert_true, assert_is_not_none
 
 from common import config
+from common.infra_modules.database_module.async_database import AsyncDatabase
 from common.infra_modules.database_module.database_module import DatabaseModule
+from common.infra_modules.database_module.model_database import DatabaseException
+from common.infra_modules.database_module.impl.database_sqlalchemy import DatabaseSqlAlchemy
+from common.infra_modules.database_module.query_cache import QueryCache
+from common.infra_modules.database_module.query_stats import QueryStats
 
 
 
@@ -95,3 +105,373 @@ class TestDatabaseModule(object):
         filter = 'Name like "C%"'
         out = self.module.delete('genres', filter)
         assert_true(out)
+
+
+    def test_6_exec_query_params(self) -> None:
+        """
+        Execute select query with bound parameters
+        """
+
+        query = 'select * from genres where Name=:name'
+        out = self.module.exec_query(query, {'name': 'Rock'})
+        assert_true(all(row['Name'] == 'Rock' for row in out))
+
+
+    def test_7_exec_many(self) -> None:
+        """
+        Execute insert query for several rows
+        """
+
+        rows = [{'name': 'PEPE1'}, {'name': 'PEPE2'}]
+        out = self.module.exec_many('insert into genres (Name) values (:name)', rows)
+        assert_equal(out, 2)
+
+
+    def test_8_exec_statement(self) -> None:
+        """
+        Execute registered statement
+        """
+
+        self.module.register_statement('genres_by_name', 'select count(*) as total from genres where Name=:name')
+        out = self.module.exec_statement('genres_by_name', {'name': 'PEPE1'})
+        assert_equal(out[0]['total'], 1)
+
+
+    def test_9_insert_update_delete_many(self) -> None:
+        """
+        Execute bulk insert, update and delete in chunks
+        """
+
+        rows = ({'Name': 'BULK{}'.format(n)} for n in range(10))
+        assert_equal(self.module.insert_many('genres', rows, chunk_size=3), 10)
+
+        ids = self.module.exec_query('select GenreId from genres where Name like :name', {'name': 'BULK%'})
+        rows = ({'GenreId': row['GenreId'], 'Name': 'UPDATED{}'.format(row['GenreId'])} for row in ids)
+        assert_equal(self.module.update_many('genres', rows, ['GenreId'], chunk_size=3), 10)
+
+        rows = ({'GenreId': row['GenreId']} for row in ids)
+        assert_equal(self.module.delete_many('genres', rows, chunk_size=3), 10)
+
+        out = self.module.exec_query('select count(*) as total from genres where Name like :name', {'name': 'UPDATED%'})
+        assert_equal(out[0]['total'], 0)
+
+
+    def test_10_transaction(self) -> None:
+        """
+        Rollback the statements of a failed transaction
+        """
+
+        try:
+            with self.module.transaction():
+                self.module.insert('genres', {'Name': 'ROLLBACK'})
+                raise ValueError()
+        except ValueError:
+            pass
+
+        out = self.module.exec_query('select count(*) as total from genres where Name=:name', {'name': 'ROLLBACK'})
+        assert_equal(out[0]['total'], 0)
+
+    def test_11_concurrent_transaction(self) -> None:
+        """
+        Read from other threads while a transaction is open, without seeing its rows
+        """
+
+        query = 'select count(*) as total from genres where Name=:name'
+        results = list()
+
+        def read():
+            results.append(self.module.exec_query(query, {'name': 'CONCURRENT'})[0]['total'])
+
+        with self.module.transaction():
+            self.module.insert('genres', {'Name': 'CONCURRENT'})
+            threads = [threading.Thread(target=read) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=10)
+            assert_equal(self.module.exec_query(query, {'name': 'CONCURRENT'})[0]['total'], 1)
+
+        assert_equal(results, [0, 0, 0, 0])
+        self.module.delete('genres', 'Name="CONCURRENT"')
+
+    def test_12_sqlite_profile_wal(self) -> None:
+        """
+        Write from other thread while a query is reading the database with the wal profile
+        """
+
+        folder = tempfile.mkdtemp()
+        try:
+            db = DatabaseSqlAlchemy('sqlite:///' + os.path.join(folder, 'wal.db'), sqlite_profile='wal')
+            db.exec_query('create table item (id integer primary key, value integer)')
+            db.insert_many('item', ({'value': n} for n in range(100)))
+            assert_equal(db.exec_query('pragma journal_mode')[0]['journal_mode'], 'wal')
+
+            written = threading.Event()
+
+            def write():
+                db.insert('item', {'value': 100})
+                written.set()
+
+            with db.connection() as conn:
+                rs = conn.execute('select * from item')
+                rs.fetchone()
+                thread = threading.Thread(target=write)
+                thread.start()
+                assert_true(written.wait(timeout=2))
+                rs.close()
+
+            assert_equal(db.exec_query('select count(*) as total from item')[0]['total'], 101)
+            assert_is_not_none(db.checkpoint())
+            db.engine.dispose()
+        finally:
+            shutil.rmtree(folder)
+
+    def test_13_iter_query(self) -> None:
+        """
+        Read the rows of a query one by one and in batches
+        """
+
+        rows = self.module.exec_query('select * from tracks where GenreId=:genre', {'genre': 1})
+        streamed = list(self.module.iter_query('select * from tracks where GenreId=:genre', {'genre': 1}))
+        assert_equal(streamed, rows)
+
+        batches = list(self.module.iter_query('select * from tracks where GenreId=:genre', {'genre': 1}, batch_size=100))
+        assert_true(all(len(batch) <= 100 for batch in batches))
+        assert_equal([row for batch in batches for row in batch], rows)
+
+    def test_14_query_cache(self) -> None:
+        """
+        Read repeated selects from the query cache until a write touches their table
+        """
+
+        if self.module.query_cache is None:
+            return
+
+        query = 'select count(*) as total from genres where Name=:name'
+        self.module.exec_query(query, {'name': 'CACHED'})
+        hits = self.module.get_query_cache_stats()['hits']
+        assert_equal(self.module.exec_query('select  count(*) as total\nfrom genres where Name=:name',
+                                            {'name': 'CACHED'})[0]['total'], 0)
+        assert_equal(self.module.get_query_cache_stats()['hits'], hits + 1)
+
+        self.module.insert('genres', {'Name': 'CACHED'})
+        assert_equal(self.module.exec_query(query, {'name': 'CACHED'})[0]['total'], 1)
+
+        self.module.exec_query('delete from genres where Name=:name', {'name': 'CACHED'})
+        assert_equal(self.module.exec_query(query, {'name': 'CACHED'})[0]['total'], 0)
+
+    def test_15_async(self) -> None:
+        """
+        Run concurrent queries with the asyncio facade
+        """
+
+        async_db = self.module.get_async()
+
+        async def read_genres():
+            return await asyncio.gather(*[async_db.exec_query('select * from genres where GenreId=:id', {'id': n})
+                                          for n in range(1, 11)])
+
+        results = asyncio.run(read_genres())
+        assert_equal([rows[0]['GenreId'] for rows in results], list(range(1, 11)))
+
+    def test_16_query_stats(self) -> None:
+        """
+        Count the executions of a query with different values under one fingerprint
+        """
+
+        if self.module.query_stats is None:
+            return
+
+        self.module.reset_query_stats()
+        for n in range(1, 6):
+            self.module.exec_query('select * from genres where GenreId=:id and Name is not null', {'id': n})
+        self.module.update('genres', {'Name': 'Rock'}, 'GenreId=1')
+
+        queries = {x['fingerprint']: x for x in self.module.get_query_stats()['queries']}
+        stats = queries['select * from genres where GenreId=? and Name is not null']
+        assert_equal(stats['count'], 5)
+        assert_equal(stats['rows'], 5)
+        assert_true(stats['p50_ms'] <= stats['p99_ms'] <= stats['max_ms'])
+        assert_equal(queries['UPDATE genres SET "Name"=? WHERE GenreId=?']['rows'], 1)
+
+    def test_17_shards(self) -> None:
+        """
+        Route a key to a shard and merge the rows of the main database and the shard
+        """
+
+        folder = tempfile.mkdtemp()
+        url = 'sqlite:///' + os.path.join(folder, 'shard.db')
+        shard = DatabaseSqlAlchemy(url)
+        shard.exec_query('create table genres (GenreId integer primary key, Name text)')
+        shard.insert_many('genres', [{'GenreId': 100 + n, 'Name': 'Shard {}'.format(n)} for n in range(3)])
+
+        self.module.shard_urls['es'] = url
+        self.module.shards['es'] = shard
+        try:
+            assert_equal(self.module.get_shard('es'), shard)
+            assert_equal(self.module.get_shard('mx'), None)
+            assert_equal(self.module.get_shard_database('es'), os.path.join(folder, 'shard.db'))
+
+            rows = self.module.fan_out('select GenreId from genres order by GenreId desc', order_by='GenreId',
+                                       reverse=True, limit=4)
+            last = self.module.db.exec_query('select max(GenreId) as last from genres')[0]['last']
+            assert_equal([x['GenreId'] for x in rows], [102, 101, 100, last])
+
+            total = self.module.fan_out_aggregate('select count(*) as total, max(GenreId) as last from genres',
+                                                  sums=['total'], maxs=['last'])
+            main = self.module.db.exec_query('select count(*) as total from genres')[0]['total']
+            assert_equal(total, [{'total': main + 3, 'last': 102}])
+
+            assert_equal(len(list(self.module.iter_fan_out('select * from genres'))), main + 3)
+
+            batches = list(self.module.iter_table('genres', key='GenreId', batch_size=2, fan_out=True))
+            assert_equal(sum(len(batch) for batch in batches), main + 3)
+            assert_equal(batches[-1], [{'GenreId': 100 + n, 'Name': 'Shard {}'.format(n)} for n in range(3)][2:])
+        finally:
+            del self.module.shard_urls['es']
+            del self.module.shards['es']
+            shard.engine.dispose()
+            shutil.rmtree(folder)
+
+
+class TestQueryCache(object):
+
+    def test_1_lru_and_ttl(self) -> None:
+        cache = QueryCache(2, 0.2)
+        for n in range(3):
+            key = QueryCache.key('select * from host where id=:id', {'id': n})
+            cache.put(key, frozenset(['host']), cache.snapshot(frozenset(['host'])), [{'id': n}])
+
+        assert_equal(cache.get(QueryCache.key('select * from host where id=:id', {'id': 0})), None)
+        assert_equal(cache.get(QueryCache.key('select * from host where id=:id', {'id': 2})), [{'id': 2}])
+        time.sleep(0.3)
+        assert_equal(cache.get(QueryCache.key('select * from host where id=:id', {'id': 2})), None)
+        assert_equal(cache.stats()['evictions'], 1)
+
+    def test_2_invalidate(self) -> None:
+        cache = QueryCache(10, 60)
+        query = 'SELECT * FROM session s JOIN "host" h ON h.id=s.id_host'
+        tables = QueryCache.read_tables(query)
+        assert_equal(tables, frozenset(['session', 'host']))
+        assert_equal(QueryCache.write_table('INSERT OR REPLACE INTO Host (ip) VALUES (:ip)'), 'host')
+        assert_equal(QueryCache.read_tables('SELECT * FROM (SELECT id FROM session) AS s, host, channel WHERE 1'),
+                     frozenset(['session', 'host', 'channel']))
+        assert_equal(QueryCache.read_tables('SELECT * FROM host, , channel'), None)
+
+        # A write while the query runs discards its result
+        snapshot = cache.snapshot(tables)
+        cache.invalidate(['host'])
+        cache.put(QueryCache.key(query), tables, snapshot, [{'id': 1}])
+        assert_equal(cache.get(QueryCache.key(query)), None)
+
+        cache.put(QueryCache.key(query), tables, cache.snapshot(tables), [{'id': 1}])
+        cache.invalidate(['channel'])
+        assert_equal(cache.get(QueryCache.key(query)), [{'id': 1}])
+        cache.invalidate(['session'])
+        assert_equal(cache.get(QueryCache.key(query)), None)
+
+
+class TestAsyncDatabase(object):
+
+    def test_1_queue_full_and_timeout(self) -> None:
+        async_db = AsyncDatabase(None, workers=1, queue_size=1, timeout=0.2)
+
+        async def run():
+            slow = [asyncio.ensure_future(async_db.run(time.sleep, 0.5)) for _ in range(2)]
+            await asyncio.sleep(0)
+            try:
+                await async_db.run(time.sleep, 0)
+                assert_true(False)
+            except DatabaseException:
+                pass
+            return await asyncio.gather(*slow, return_exceptions=True)
+
+        results = asyncio.run(run())
+        assert_true(all(isinstance(result, DatabaseException) for result in results))
+        async_db.shutdown()
+
+
+class TestQueryStats(object):
+
+    def test_1_fingerprint_and_slow_queries(self) -> None:
+        stats = QueryStats(max_fingerprints=2, slow_query_ms=50)
+        stats.record("SELECT * FROM host WHERE ip='10.0.0.1' AND id IN (1, 2, 3)", 0.001, 1)
+        stats.record("SELECT * FROM host WHERE ip='10.0.0.2' AND id IN (4)", 0.060, 1)
+        stats.record('SELECT * FROM channel', 0.002, 3)
+        stats.record('SELECT * FROM session', 0.002, 3)
+
+        queries = {x['fingerprint']: x for x in stats.get_stats()}
+        assert_equal(queries['SELECT * FROM host WHERE ip=? AND id IN (?)']['count'], 2)
+        assert_equal(queries['SELECT * FROM host WHERE ip=? AND id IN (?)']['p50_ms'], 1)
+        assert_equal(queries[QueryStats.OTHER]['count'], 1)
+        assert_equal(len(stats.get_slow_queries()), 1)
+
+
+class TestExplainQuery(object):
+
+    def setup(self):
+        self.folder = tempfile.mkdtemp()
+        self.db = DatabaseSqlAlchemy('sqlite:///' + os.path.join(self.folder, 'explain.db'))
+        self.db.exec_query('create table host (id integer primary key, ip text)')
+        self.db.exec_query('create table session_host (id integer primary key, id_host integer, status text)')
+        self.db.insert_many('host', [{'ip': '10.0.0.{}'.format(n)} for n in range(10)])
+        self.db.explain_scan_rows = 5
+
+    def teardown(self):
+        self.db.engine.dispose()
+        shutil.rmtree(self.folder)
+
+    def test_1_scans_of_aliased_tables(self) -> None:
+        assert_equal(self.db.explain_query('select * from host where ip=:ip', {'ip': '10.0.0.1'}), ['host'])
+        assert_equal(self.db.explain_query('select h.id from host AS h where h.ip="10.0.0.1"'), ['host'])
+        assert_equal(self.db.explain_query('select count(*) from session_host sh, host h where h.ip like "10.%"'),
+                     ['host'])
+        assert_equal(self.db.explain_query('select * from host where id=1'), [])
+
+
+class TestReadReplicas(object):
+
+    def setup(self):
+        self.folder = tempfile.mkdtemp()
+        self.urls = ['sqlite:///' + os.path.join(self.folder, name) for name in ['primary.db', 'r1.db', 'r2.db']]
+        for url in self.urls:
+            db = DatabaseSqlAlchemy(url)
+            db.exec_query('create table item (id integer primary key, name text)')
+            db.insert('item', {'name': url.rsplit('/', 1)[-1]})
+            db.engine.dispose()
+
+    def teardown(self):
+        shutil.rmtree(self.folder)
+
+    def test_1_route_selects_to_replicas(self) -> None:
+        db = DatabaseSqlAlchemy(self.urls[0], read_connections=self.urls[1:])
+        db.replica_pin_seconds = 0
+
+        names = [db.exec_query('select name from item where id=:id', {'id': 1})[0]['name'] for _ in range(4)]
+        assert_equal(names, ['r1.db', 'r2.db', 'r1.db', 'r2.db'])
+
+        # Writes go to the primary, and the transaction reads its own writes
+        with db.transaction():
+            db.insert('item', {'name': 'new'})
+            assert_equal(len(db.exec_query('select * from item')), 2)
+        assert_equal(len(db.exec_query('select * from item')), 1)
+
+        # After a write the thread reads from the primary while pinned
+        db.replica_pin_seconds = 60
+        db.insert('item', {'name': 'other'})
+        assert_equal(len(db.exec_query('select * from item')), 3)
+
+        # The replicas may lag for every thread, the query cache does not store results meanwhile
+        assert_true(db.replicas_lagging())
+        db.replica_pin_seconds = 0
+        assert_equal(db.replicas_lagging(), False)
+
+    def test_2_least_loaded(self) -> None:
+        db = DatabaseSqlAlchemy(self.urls[0], read_connections=self.urls[1:], replica_strategy='least_loaded')
+
+        # r1 is busy with a streamed select, so the next select goes to r2
+        rows = db.iter_query('select name from item')
+        assert_equal(next(rows)['name'], 'r1.db')
+        assert_equal(db.exec_query('select name from item')[0]['name'], 'r2.db')
+        rows.close()
+        assert_equal(db.replica_load, [0, 0])
@@ -0,0 +1,28 @@
+import logging
+import json
+
+from common.module import ViewModule, authenticate
+from common.infra_tools.decorators import log_function
+from common.infra_modules.database_module import MODULE_NAME
+
+
+logger = logging.getLogger(MODULE_NAME)
+
+
+@authenticate()
+class DatabaseModuleStatsView(ViewModule):
+
+    # latency histograms by query fingerprint, slow queries and counters of the query cache
+    @log_function(logger, print_result=False)
+    def index(self) -> str:
+        stats = self.app_module.get_query_stats()
+        stats['cache'] = self.app_module.get_query_cache_stats()
+
+        return json.dumps(stats)
+
+    # clear the latency histograms and the slow queries
+    @log_function(logger, print_result=False)
+    def delete(self) -> str:
+        self.app_module.reset_query_stats()
+
+        return json.dumps({'success': True})
@@ -1,3 +1,5 @@
+import os
+import openpyxl
 import pandas as pd
 
 from common import config
@@ -82,11 +84,86 @@ class ParsingModule(InfraModule):
         return has_header
 
 
+    def load_lines_to_database(self, lines, connection, table: str, columns: list, sep=' ', errors_path=None,
+                               fixed_values=None, commit=True) -> int:
+        """
+        Split lines and insert them in table with a single executemany, streaming from the iterator without
+        intermediate files. Lines without the expected number of fields are appended to the errors file.
+        :param lines: iterable of tuples (line number, line)
+        :param connection: sqlite3 connection
+        :param table: table to insert
+        :param columns: columns of the table in the same order as the fields of the lines
+        :param sep: separator of the fields
+        :param errors_path: file to append the wrong lines, None to discard them
+        :param fixed_values: dict with the values of additional columns, the same for all the rows
+        :param commit: commit when finished, False to leave the transaction open to the caller
+        :return: number of rows inserted
+        """
+        fixed_values = fixed_values or dict()
+        all_columns = list(columns) + list(fixed_values.keys())
+        query = 'INSERT INTO {} ({}) VALUES ({})'.format(table, ','.join(all_columns), ','.join('?' * len(all_columns)))
+        fixed_row = tuple(fixed_values.values())
+        inserted = 0
+
+        def valid_rows(errors_file):
+            nonlocal inserted
+            for line_number, line in lines:
+                fields = line.split(sep)
+                if len(fields) == len(columns):
+                    inserted = inserted + 1
+                    yield tuple(field if field != '' else None for field in fields) + fixed_row
+                else:
+                    errors_file.write('Line {}: {}\n'.format(line_number, line))
+
+        with open(errors_path if errors_path else os.devnull, 'a') as errors_file:
+            try:
+                connection.executemany(query, valid_rows(errors_file))
+                if commit:
+                    connection.commit()
+            except Exception:
+                if commit:
+                    connection.rollback()
+                raise
+
+        return inserted
+
+
     def load_xlsx(self, file_path:str, xlsx_cols=None) -> pd.DataFrame:
         dataframe = pd.read_excel(file_path, parse_cols=xlsx_cols)
 
         return dataframe
 
 
+    def iter_xlsx(self, file_path: str, xlsx_cols=None):
+        """
+        Generator of the rows of the first sheet of a xlsx file, read in read only mode without loading the whole
+        file in memory.
+        :param file_path: full path of the xlsx file
+        :param xlsx_cols: names of the columns to read in the header row, None to read all of them
+        :return: tuples with the values of the columns in the order of xlsx_cols
+        """
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = [str(name).strip() if name is not None else '' for name in next(rows, ())]
+
+            if xlsx_cols is None:
+                positions = list(range(len(header)))
+            else:
+                missing = [name for name in xlsx_cols if name not in header]
+                if len(missing) > 0:
+                    raise ValueError('Columns {} not found in {}'.format(missing, file_path))
+                positions = [header.index(name) for name in xlsx_cols]
+
+            for row in rows:
+                values = tuple(row[position] if position < len(row) else None for position in positions)
+                # Read only sheets can report blank rows after the last one with data
+                if all(value is None for value in values):
+                    continue
+                yield values
+        finally:
+            workbook.close()
+
+
     def load_xlsx_to_database(self, xlsx_dataframe: pd.DataFrame, connection, table:str, if_exists='append') -> None:
         xlsx_dataframe.to_sql(name=table, con=connection, if_exists=if_exists, index=False, chunksize=1000)
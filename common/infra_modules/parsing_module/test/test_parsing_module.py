@@ -1,6 +1,8 @@
 import os
 import sqlite3
+import tempfile
 
+import openpyxl
 from nose.tools import assert_equal, assert_true, assert_is_none, nottest
 from pandas import DataFrame
 
@@ -227,3 +229,64 @@ class TestParsingModule(object):
         assert_equal(number_of_columns, 18)
 
         connection.close()
+
+
+    def test_9_load_lines_to_database(self):
+        """
+        Stream the lines of a csv file into a table, sending wrong lines to the errors file.
+        """
+        csv_fd, csv_path = tempfile.mkstemp(suffix='.csv')
+        errors_path = TestParsingModule.database + '.errors'
+        columns = ['policyID', 'statecode', 'county', 'eq_site_limit', 'hu_site_limit', 'fl_site_limit',
+                   'fr_site_limit', 'tiv_2011', 'tiv_2012', 'eq_site_deductible', 'hu_site_deductible',
+                   'fl_site_deductible', 'fr_site_deductible', 'point_latitude', 'point_longitude', 'line',
+                   'construction', 'point_granularity']
+
+        # Header, three rows and a wrong line
+        with os.fdopen(csv_fd, 'w') as f:
+            f.write(' '.join(columns) + '\n')
+            for policy_id in range(3):
+                f.write('{} FL CLAY_COUNTY 0 0 0 0 0 0 0 0 0 0 30.1 -81.7 Residential Wood 1\n'.format(policy_id))
+            f.write('wrong line\n')
+
+        connection = sqlite3.connect(TestParsingModule.database)
+        table = 'test_table'
+        connection.execute('CREATE TABLE {} ({}, id_load INTEGER)'.format(table, ','.join(columns)))
+
+        with open(csv_path) as f:
+            lines = [(n, line.rstrip('\n')) for n, line in enumerate(f, 1) if n > 1]
+
+        inserted = self.module.load_lines_to_database(lines, connection, table, columns, sep=' ',
+                                                      errors_path=errors_path, fixed_values={'id_load': 1})
+        assert_equal(inserted, 3)
+
+        cursor = connection.cursor()
+        cursor.execute('SELECT COUNT(*) FROM {} WHERE id_load=1'.format(table))
+        assert_equal(int(cursor.fetchone()[0]), 3)
+
+        with open(errors_path) as f:
+            assert_equal(f.read(), 'Line 5: wrong line\n')
+
+        os.remove(csv_path)
+        os.remove(errors_path)
+        connection.close()
+
+
+    def test_10_iter_xlsx(self):
+        """
+        Read the selected columns of a xlsx file row by row.
+        """
+        xlsx_path = TestParsingModule.database + '.xlsx'
+
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(['Hostname', 'IP', 'Other', 'Canal'])
+        sheet.append(['host1', '10.0.0.1', 'x', 'channel1'])
+        sheet.append(['host2', '10.0.0.2', 'y', None])
+        sheet.append([None, None, None, None])
+        workbook.save(xlsx_path)
+
+        rows = list(self.module.iter_xlsx(xlsx_path, xlsx_cols=['IP', 'Hostname', 'Canal']))
+        assert_equal(rows, [('10.0.0.1', 'host1', 'channel1'), ('10.0.0.2', 'host2', None)])
+
+        os.remove(xlsx_path)
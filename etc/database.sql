@@ -104,14 +104,16 @@ CREATE TABLE IF NOT EXISTS manual_hunting(
 CREATE TABLE IF NOT EXISTS processed_host(
 	id	INTEGER PRIMARY KEY,
 	id_host	INTEGER NOT NULL,
-	hunting_type TEXT NOT NULL
+	hunting_type TEXT NOT NULL,
+	status TEXT DEFAULT ""
 );
 
 CREATE TABLE IF NOT EXISTS processed_evo(
 	id	INTEGER PRIMARY KEY,
 	hostname	TEXT NOT NULL,
 	evoname TEXT NOT NULL,
-	hunting_type TEXT NOT NULL
+	hunting_type TEXT NOT NULL,
+	status TEXT DEFAULT ""
 );
 
 CREATE TABLE IF NOT EXISTS hist_session_host(
@@ -133,4 +135,26 @@ CREATE TABLE IF NOT EXISTS hist_session_evo(
   processing_host TEXT NOT NULL,
   status TEXT DEFAULT "",
   exit_code TEXT DEFAULT ""
-);
\ No newline at end of file
+);
+
+CREATE TABLE IF NOT EXISTS session_file_offset(
+  id_session INTEGER NOT NULL,
+  file_name TEXT NOT NULL,
+  file_offset INTEGER DEFAULT 0,
+  line_number INTEGER DEFAULT 0,
+  PRIMARY KEY (id_session, file_name)
+);
+
+CREATE TABLE IF NOT EXISTS host_first_finish(
+  id_host INTEGER NOT NULL,
+  channel_name TEXT NOT NULL,
+  day INTEGER NOT NULL, -- YYYYMMDD of the first session that finished the host OK
+  PRIMARY KEY (id_host, channel_name)
+);
+
+CREATE TABLE IF NOT EXISTS daily_channel_progress(
+  day INTEGER NOT NULL,
+  channel_name TEXT NOT NULL,
+  finished_hosts INTEGER DEFAULT 0, -- hosts finished for the first time that day
+  PRIMARY KEY (day, channel_name)
+);
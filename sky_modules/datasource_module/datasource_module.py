@@ -1,4 +1,12 @@
+import functools
+import itertools
+import threading
+
+from flask import has_request_context
+
 from common import config
+from common.module import rest_app
+from common.infra_tools.decorators import apply_decorator_for_all_methods
 
 from sky_modules.sky_module import SkyModule
 from sky_modules.datasource_module import MODULE_NAME, ENGINE_NAME
@@ -9,17 +17,71 @@ from sky_modules.datasource_module.views_datasource_module import DatasourceModu
 from sky_modules.datasource_module.model_datasource_module import Base, Permission, AlchemyPermission, \
     AlchemyRole, Role, AlchemyUser, User, AlchemyCaseType, CaseType, AlchemyCaseStatus, CaseStatus, \
     AlchemyCase, Case, AlchemyEvidence, Evidence, AlchemyUpload, Upload, AlchemyFile, File, AlchemyEntity, Entity, \
-    AlchemyInstance, Instance, AlchemyProperty, Property, AlchemyValue, Value
+    AlchemyInstance, Instance, AlchemyProperty, Property, AlchemyValue, Value, FileBulkInputDataSchema, \
+    ValueBulkInputDataSchema
 from sky_modules.datasource_module.shells_datasource_module import DatasourceModuleShell
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker, scoped_session, joinedload, selectinload
+from sqlalchemy.pool import QueuePool
 from common.app_model import AppException, GenericErrorMessages
 
 logger = config.get_log(MODULE_NAME)
 
 
+def request_session(method):
+    """
+    Decorator of the methods of DatasourceModule. The session of the thread is removed when the outermost call returns,
+    so every Pyro call or task works with its own session. Inside a Flask request the session lives until the teardown
+    of the request
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        depth = getattr(self.local, 'depth', 0)
+        if depth == 0 and self.session is not None and not self.session.registry.has():
+            # Generation of the DTO cache when the session starts, its rows are not newer
+            self.local.dto_generation = self.dto_generation
+        self.local.depth = depth + 1
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.local.depth = depth
+            if depth == 0 and self.session is not None and not has_request_context():
+                self.session.remove()
+
+    return wrapper
+
+
+@apply_decorator_for_all_methods(request_session)
 class DatasourceModule(SkyModule):
 
+    # Relationships read by the getters, loaded with the query of the rows instead of one query per row and
+    # relationship. Many-to-one relationships are joined and collections are read with one IN query for all the rows
+    ROLE_LOAD = (selectinload(AlchemyRole.permissions),)
+    USER_LOAD = (selectinload(AlchemyUser.roles).selectinload(AlchemyRole.permissions),)
+    CASE_LOAD = (joinedload(AlchemyCase.type), joinedload(AlchemyCase.status))
+    EVIDENCE_LOAD = (joinedload(AlchemyEvidence.owner).selectinload(AlchemyUser.roles)
+                     .selectinload(AlchemyRole.permissions),)
+    UPLOAD_LOAD = (joinedload(AlchemyUpload.evidence).joinedload(AlchemyEvidence.owner)
+                   .selectinload(AlchemyUser.roles).selectinload(AlchemyRole.permissions),)
+    FILE_LOAD = (joinedload(AlchemyFile.upload).joinedload(AlchemyUpload.evidence).joinedload(AlchemyEvidence.owner)
+                 .selectinload(AlchemyUser.roles).selectinload(AlchemyRole.permissions),)
+    INSTANCE_LOAD = (joinedload(AlchemyInstance.entity),)
+    PROPERTY_LOAD = (joinedload(AlchemyProperty.entity),)
+    VALUE_LOAD = (joinedload(AlchemyValue.property).joinedload(AlchemyProperty.entity),
+                  joinedload(AlchemyValue.instance))
+
+    # Rows inserted in each transaction of the bulk create methods, and errors reported at most
+    BULK_CHUNK_SIZE = 1000
+    MAX_BULK_ERRORS = 1000
+
+    # Incremented each time the DTO cache is flushed, a DTO built from a session older than a flush is not cached
+    dto_generation = 0
+
+    # Session of each thread, created by initialize, and depth of the calls to the module in each thread
+    session = None
+    local = threading.local()
+
     def initialize(self):
         """
         This method create and initialize all variables and resources that are needed
@@ -27,10 +89,32 @@ class DatasourceModule(SkyModule):
         """
 
         try:
-            self.engine = create_engine(ENGINE_NAME)
+            connection_database = self.module_config.get_value(MODULE_NAME, 'connection_database')
+        except AppException:
+            connection_database = ENGINE_NAME
+        try:
+            pool_size = int(self.module_config.get_value(MODULE_NAME, 'pool_size'))
+        except AppException:
+            pool_size = 10
+        try:
+            pool_timeout = int(self.module_config.get_value(MODULE_NAME, 'pool_timeout'))
+        except AppException:
+            pool_timeout = 30
 
-            Session = sessionmaker(bind=self.engine)
-            self.session = Session()
+        try:
+            # Pool of connections shared by the sessions of the threads
+            self.engine = create_engine(connection_database, poolclass=QueuePool, pool_size=pool_size,
+                                        max_overflow=0, pool_timeout=pool_timeout)
+
+            # Each Flask request, Pyro call or task thread works with its own session
+            self.session = scoped_session(sessionmaker(bind=self.engine))
+            rest_app.teardown_request(self.remove_session)
+            # Permission, Role and User built from the database, shared by all the results until a create_* method
+            # changes them. Callers must not modify the shared DTOs
+            self.dto_cache = dict()
+            self.dto_lock = threading.Lock()
+            # Number of rows of the lists by table and filter, kept until a create_* method adds rows to the table
+            self.count_cache = dict()
             Base.metadata.create_all(self.engine)
 
             self.register_url(DatasourceModuleView, '/ds')
@@ -165,6 +249,174 @@ class DatasourceModule(SkyModule):
         except Exception as e:
             raise AppException(GenericErrorMessages.DATABASE_ERROR + ': ' + str(e))
 
+    def permission_dto(self, alchemy_permission):
+        """
+        This method converts an alchemy permission, the Permission is built once and shared until the cache is flushed
+        :return: Permission
+        """
+        key = (Permission, alchemy_permission.id)
+        permission = self.dto_cache.get(key)
+        if permission is None:
+            permission = Permission(alchemy_permission.id, alchemy_permission.name, alchemy_permission.description)
+            self.store_dto(key, permission)
+        return permission
+
+    def role_dto(self, alchemy_role):
+        """
+        This method converts an alchemy role with its permissions, the Role is built once and shared until the cache is
+        flushed
+        :return: Role
+        """
+        key = (Role, alchemy_role.id)
+        role = self.dto_cache.get(key)
+        if role is None:
+            permission_list = [self.permission_dto(p) for p in alchemy_role.permissions]
+            role = Role(alchemy_role.id, alchemy_role.name, alchemy_role.description, permission_list)
+            self.store_dto(key, role)
+        return role
+
+    def user_dto(self, alchemy_user):
+        """
+        This method converts an alchemy user with its roles, the User is built once and shared until the cache is
+        flushed
+        :return: User
+        """
+        key = (User, alchemy_user.id)
+        user = self.dto_cache.get(key)
+        if user is None:
+            role_list = [self.role_dto(r) for r in alchemy_user.roles]
+            user = User(alchemy_user.id, alchemy_user.username, alchemy_user.password, alchemy_user.first_name,
+                        alchemy_user.family_name, alchemy_user.email, role_list)
+            self.store_dto(key, user)
+        return user
+
+    def store_dto(self, key, dto):
+        """
+        This method caches a converted permission, role or user unless the cache has been flushed since the session of
+        the thread started, the rows of the session may be older than the flush
+        :return: None
+        """
+        with self.dto_lock:
+            if getattr(self.local, 'dto_generation', None) == self.dto_generation:
+                self.dto_cache[key] = dto
+
+    def flush_dto_cache(self):
+        """
+        This method drops the converted permissions, roles and users, called by the create_* methods that change them
+        :return: None
+        """
+        with self.dto_lock:
+            self.dto_generation = self.dto_generation + 1
+            self.dto_cache.clear()
+
+    def remove_session(self, exception=None):
+        """
+        This method closes the session of the current thread, called at the teardown of every Flask request
+        :return: None
+        """
+        self.session.remove()
+
+    def page(self, query, alchemy_class, after_id=None, limit=None):
+        """
+        This method restricts a query to the rows with id greater than after_id, up to limit rows ordered by id. Pages
+        are read from the index of the primary key however deep they are, unlike with offsets
+        :return: Query
+        """
+        if after_id is not None:
+            query = query.filter(alchemy_class.id > after_id)
+        query = query.order_by(alchemy_class.id)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    def count_all(self, alchemy_class, cached=True, **filters):
+        """
+        This method counts the rows of a table that match the filters
+        :return: Int
+        """
+        key = (alchemy_class, tuple(sorted(filters.items())))
+        if cached and key in self.count_cache:
+            return self.count_cache[key]
+
+        try:
+            count = self.session.query(func.count(alchemy_class.id)).filter_by(**filters).scalar()
+        except Exception as e:
+            raise AppException(GenericErrorMessages.DATABASE_ERROR + ': ' + str(e))
+
+        self.count_cache[key] = count
+        return count
+
+    def flush_count_cache(self, alchemy_class):
+        """
+        This method drops the cached counts of a table, called by the create_* methods
+        :return: None
+        """
+        for key in [key for key in self.count_cache if key[0] is alchemy_class]:
+            del self.count_cache[key]
+
+    def bulk_insert(self, alchemy_class, rows, check_chunk, chunk_size=None):
+        """
+        This method inserts rows with bulk_insert_mappings, one transaction for each chunk. The rows rejected by
+        check_chunk or by the database are reported and the rest of the batch is inserted
+        :return: dict with the number of rows created and failed and the list of errors with the index of the row
+        """
+        chunk_size = chunk_size if chunk_size is not None else self.BULK_CHUNK_SIZE
+        result = {'created': 0, 'failed': 0, 'errors': list()}
+
+        def add_error(index, error):
+            result['failed'] = result['failed'] + 1
+            if len(result['errors']) < self.MAX_BULK_ERRORS:
+                result['errors'].append({'index': index, 'error': error})
+
+        rows = enumerate(rows)
+        chunk = list(itertools.islice(rows, chunk_size))
+        while len(chunk) > 0:
+            try:
+                mappings, errors = check_chunk(chunk)
+            except Exception as e:
+                self.session.rollback()
+                raise AppException(GenericErrorMessages.DATABASE_ERROR + ': ' + str(e))
+            for index, error in errors:
+                add_error(index, error)
+
+            try:
+                self.session.bulk_insert_mappings(alchemy_class, [mapping for _, mapping in mappings])
+                self.session.commit()
+                result['created'] = result['created'] + len(mappings)
+            except Exception:
+                self.session.rollback()
+                # A row rejected by the database aborts its chunk, the chunk is inserted row by row to find it
+                for index, mapping in mappings:
+                    try:
+                        self.session.bulk_insert_mappings(alchemy_class, [mapping])
+                        self.session.commit()
+                        result['created'] = result['created'] + 1
+                    except Exception as e:
+                        self.session.rollback()
+                        add_error(index, str(e))
+
+            chunk = list(itertools.islice(rows, chunk_size))
+
+        if result['created'] > 0:
+            self.flush_count_cache(alchemy_class)
+        return result
+
+    def load_chunk(self, chunk, schema):
+        """
+        This method validates the rows of a chunk of a bulk create method
+        :return: list of tuples with the index and the data of the valid rows, list of tuples with the index and the
+        error of the invalid rows
+        """
+        valid = list()
+        errors = list()
+        for index, row in chunk:
+            data, row_errors = schema.load(row)
+            if len(row_errors) > 0:
+                errors.append((index, str(row_errors)))
+            else:
+                valid.append((index, data))
+        return valid, errors
+
     def get_all_permissions(self):
         """
         This method retrieves all permissions from DB
@@ -177,7 +429,7 @@ class DatasourceModule(SkyModule):
             permission_list = list()
 
             for perm in alchemy_permission_list:
-                new_permission = Permission(perm.id, perm.name, perm.description)
+                new_permission = self.permission_dto(perm)
                 permission_list.append(new_permission)
 
             return permission_list
@@ -196,8 +448,7 @@ class DatasourceModule(SkyModule):
             if alchemy_permission is None:
                 new_permission = None
             else:
-                new_permission = Permission(alchemy_permission.id, alchemy_permission.name,
-                                            alchemy_permission.description)
+                new_permission = self.permission_dto(alchemy_permission)
 
             return new_permission
 
@@ -229,6 +480,7 @@ class DatasourceModule(SkyModule):
             self.session.add(alchemy_permission)
 
             self.session.commit()
+            self.flush_dto_cache()
 
             permission = Permission(alchemy_permission.id, alchemy_permission.name, alchemy_permission.description)
 
@@ -243,16 +495,12 @@ class DatasourceModule(SkyModule):
         :return: {Role}
         """
         try:
-            alchemy_roles_list = self.session.query(AlchemyRole).all()
+            alchemy_roles_list = self.session.query(AlchemyRole).options(*self.ROLE_LOAD).all()
 
             role_list = list()
 
             for r in alchemy_roles_list:
-                perm_list = list()
-                for p in r.permissions:
-                    perm = Permission(p.id, p.name, p.description)
-                    perm_list.append(perm)
-                new_role = Role(r.id, r.name, r.description, perm_list)
+                new_role = self.role_dto(r)
                 role_list.append(new_role)
 
             return role_list
@@ -266,16 +514,12 @@ class DatasourceModule(SkyModule):
         :return: Role
         """
         try:
-            alchemy_role = self.session.query(AlchemyRole).filter_by(id=role_id).first()
+            alchemy_role = self.session.query(AlchemyRole).options(*self.ROLE_LOAD).filter_by(id=role_id).first()
 
             if alchemy_role is None:
                 new_role = None
             else:
-                permissions_list = list()
-                for p in alchemy_role.permissions:
-                    perm = Permission(p.id, p.name, p.description)
-                    permissions_list.append(perm)
-                new_role = Role(alchemy_role.id, alchemy_role.name, alchemy_role.description, permissions_list)
+                new_role = self.role_dto(alchemy_role)
 
             return new_role
 
@@ -315,6 +559,7 @@ class DatasourceModule(SkyModule):
             self.session.add(alchemy_role)
 
             self.session.commit()
+            self.flush_dto_cache()
 
             role = Role(alchemy_role.id, alchemy_role.name, alchemy_role.description, permissions)
 
@@ -323,26 +568,20 @@ class DatasourceModule(SkyModule):
         except Exception:
             return None, False
 
-    def get_all_users(self):
+    def get_all_users(self, after_id=None, limit=None):
         """
         This method retrieves all users from DB
+        The list is ordered by id, after_id and limit return the page of rows with id greater than after_id
         :return: {User}
         """
         try:
-            alchemy_users_list = self.session.query(AlchemyUser).all()
+            query = self.session.query(AlchemyUser).options(*self.USER_LOAD)
+            alchemy_users_list = self.page(query, AlchemyUser, after_id, limit).all()
 
             user_list = list()
 
             for u in alchemy_users_list:
-                role_list = list()
-                for r in u.roles:
-                    permission_list = list()
-                    for p in r.permissions:
-                        new_permission = Permission(p.id, p.name, p.description)
-                        permission_list.append(new_permission)
-                    role = Role(r.id, r.name, r.description, permission_list)
-                    role_list.append(role)
-                new_user = User(u.id, u.username, u.password, u.first_name, u.family_name, u.email, role_list)
+                new_user = self.user_dto(u)
                 user_list.append(new_user)
 
             return user_list
@@ -350,28 +589,26 @@ class DatasourceModule(SkyModule):
         except Exception as e:
             raise AppException(GenericErrorMessages.DATABASE_ERROR + ': ' + str(e))
 
+    def count_users(self, cached=True):
+        """
+        This method counts the users
+        The count is cached until a new row is created, cached=False counts again
+        :return: Int
+        """
+        return self.count_all(AlchemyUser, cached)
+
     def get_user(self, user_id):
         """
         This method retrieves users with given id from DB
         :return: User
         """
         try:
-            alchemy_user = self.session.query(AlchemyUser).filter_by(id=user_id).first()
+            alchemy_user = self.session.query(AlchemyUser).options(*self.USER_LOAD).filter_by(id=user_id).first()
 
             if alchemy_user is None:
                 new_user = None
             else:
-                role_list = list()
-                for r in alchemy_user.roles:
-                    permissions_list = list()
-                    for p in r.permissions:
-                        new_permission = Permission(p.id, p.name, p.description)
-                        permissions_list.append(new_permission)
-                    new_role = Role(r.id, r.name, r.description, permissions_list)
-                    role_list.append(new_role)
-
-                new_user = User(alchemy_user.id, alchemy_user.username, alchemy_user.password, alchemy_user.first_name,
-                                alchemy_user.family_name, alchemy_user.email, role_list)
+                new_user = self.user_dto(alchemy_user)
 
             return new_user
 
@@ -412,6 +649,8 @@ class DatasourceModule(SkyModule):
             self.session.add(alchemy_user)
 
             self.session.commit()
+            self.flush_count_cache(AlchemyUser)
+            self.flush_dto_cache()
 
             user = User(alchemy_user.id, alchemy_user.username, alchemy_user.password, alchemy_user.first_name,
                         alchemy_user.family_name, alchemy_user.email, roles)
@@ -555,13 +794,15 @@ class DatasourceModule(SkyModule):
         except Exception:
             return None, False
 
-    def get_all_cases(self):
+    def get_all_cases(self, after_id=None, limit=None):
         """
         This method retrieves all cases from DB
+        The list is ordered by id, after_id and limit return the page of rows with id greater than after_id
         :return: {Case}
         """
         try:
-            alchemy_cases_list = self.session.query(AlchemyCase).all()
+            query = self.session.query(AlchemyCase).options(*self.CASE_LOAD)
+            alchemy_cases_list = self.page(query, AlchemyCase, after_id, limit).all()
 
             case_list = list()
 
@@ -577,13 +818,21 @@ class DatasourceModule(SkyModule):
         except Exception as e:
             raise AppException(GenericErrorMessages.DATABASE_ERROR + ': ' + str(e))
 
+    def count_cases(self, cached=True):
+        """
+        This method counts the cases
+        The count is cached until a new row is created, cached=False counts again
+        :return: Int
+        """
+        return self.count_all(AlchemyCase, cached)
+
     def get_case(self, case_id):
         """
         This method retrieves cases with given id from DB
         :return: Case
         """
         try:
-            alchemy_case = self.session.query(AlchemyCase).filter_by(id=case_id).first()
+            alchemy_case = self.session.query(AlchemyCase).options(*self.CASE_LOAD).filter_by(id=case_id).first()
 
             if alchemy_case is None:
                 new_case = None
@@ -618,6 +867,7 @@ class DatasourceModule(SkyModule):
 
             self.session.add(alchemy_case)
             self.session.commit()
+            self.flush_count_cache(AlchemyCase)
 
             new_type = CaseStatus(alchemy_case_type.id, alchemy_case_type.name, alchemy_case_type.description)
             status = CaseStatus(alchemy_case_status.id, alchemy_case_status.name, alchemy_case_status.description)
@@ -631,27 +881,19 @@ class DatasourceModule(SkyModule):
         except Exception:
             return None, False
 
-    def get_all_evidences(self):
+    def get_all_evidences(self, after_id=None, limit=None):
         """
         This method retrieves all evidences from DB
+        The list is ordered by id, after_id and limit return the page of rows with id greater than after_id
         :return: {Evidence}
         """
         try:
-            alchemy_evidences_list = self.session.query(AlchemyEvidence).all()
+            query = self.session.query(AlchemyEvidence).options(*self.EVIDENCE_LOAD)
+            alchemy_evidences_list = self.page(query, AlchemyEvidence, after_id, limit).all()
             evidence_list = list()
 
             for e in alchemy_evidences_list:
-                roles_list = list()
-                for r in e.owner.roles:
-                    permission_list = list()
-                    for p in r.permissions:
-                        new_permission = Permission(p.id, p.name, p.description)
-                        permission_list.append(new_permission)
-                    new_role = Role(r.id, r.name, r.description, permission_list)
-                    roles_list.append(new_role)
-
-                new_user = User(e.owner.id, e.owner.username, e.owner.password, e.owner.first_name, e.owner.family_name,
-                                e.owner.email, roles_list)
+                new_user = self.user_dto(e.owner)
                 new_evidence = Evidence(e.id, e.alias, e.size, new_user)
                 evidence_list.append(new_evidence)
 
@@ -660,29 +902,27 @@ class DatasourceModule(SkyModule):
         except Exception as e:
             raise AppException(GenericErrorMessages.DATABASE_ERROR + ': ' + str(e))
 
+    def count_evidences(self, cached=True):
+        """
+        This method counts the evidences
+        The count is cached until a new row is created, cached=False counts again
+        :return: Int
+        """
+        return self.count_all(AlchemyEvidence, cached)
+
     def get_evidence(self, evidence_id):
         """
         This method retrieves evidences with given id from DB
         :return: Evidence
         """
         try:
-            alchemy_evidence = self.session.query(AlchemyEvidence).filter_by(id=evidence_id).first()
+            alchemy_evidence = self.session.query(AlchemyEvidence).options(*self.EVIDENCE_LOAD) \
+                .filter_by(id=evidence_id).first()
 
             if alchemy_evidence is None:
                 new_evidence = None
             else:
-                roles_list = list()
-                for r in alchemy_evidence.owner.roles:
-                    permissions_list = list()
-                    for p in r.permissions:
-                        new_permission = Permission(p.id, p.name, p.description)
-                        permissions_list.append(new_permission)
-                    new_role = Role(evidence_id, r.name, r.description, permissions_list)
-                    roles_list.append(new_role)
-                new_user = User(alchemy_evidence.owner.id, alchemy_evidence.owner.username,
-                                alchemy_evidence.owner.password,
-                                alchemy_evidence.owner.first_name, alchemy_evidence.owner.family_name,
-                                alchemy_evidence.owner.email, roles_list)
+                new_user = self.user_dto(alchemy_evidence.owner)
                 new_evidence = Evidence(alchemy_evidence.id, alchemy_evidence.alias, alchemy_evidence.size, new_user)
 
             return new_evidence
@@ -717,6 +957,7 @@ class DatasourceModule(SkyModule):
 
             self.session.add(alchemy_evidence)
             self.session.commit()
+            self.flush_count_cache(AlchemyEvidence)
 
             evidence = Evidence(alchemy_evidence.id, alchemy_evidence.alias, alchemy_evidence.size, owner)
 
@@ -746,22 +987,13 @@ class DatasourceModule(SkyModule):
         :return: {Upload}
         """
         try:
-            alchemy_upload_list = self.session.query(AlchemyUpload).filter_by(evidence_id=evidence_id).all()
+            alchemy_upload_list = self.session.query(AlchemyUpload).options(*self.UPLOAD_LOAD) \
+                .filter_by(evidence_id=evidence_id).all()
 
             upload_list = list()
 
             for u in alchemy_upload_list:
-                roles_list = list()
-                for r in u.evidence.owner.roles:
-                    permission_list = list()
-                    for p in r.permissions:
-                        new_permission = Permission(p.id, p.name, p.description)
-                        permission_list.append(new_permission)
-                    new_role = Role(r.id, r.name, r.description, permission_list)
-                    roles_list.append(new_role)
-                new_user = User(u.evidence.owner.id, u.evidence.owner.username, u.evidence.owner.password,
-                                u.evidence.owner.first_name, u.evidence.owner.family_name, u.evidence.owner.email,
-                                roles_list)
+                new_user = self.user_dto(u.evidence.owner)
                 new_evidence = Evidence(u.evidence.id, u.evidence.alias, u.evidence.size, new_user)
                 new_upload = Upload(u.id, u.path, u.size, u.type, new_evidence)
                 upload_list.append(new_upload)
@@ -777,24 +1009,13 @@ class DatasourceModule(SkyModule):
         :return: Upload
         """
         try:
-            alchemy_upload = self.session.query(AlchemyUpload).filter_by(id=upload_id).first()
+            alchemy_upload = self.session.query(AlchemyUpload).options(*self.UPLOAD_LOAD) \
+                .filter_by(id=upload_id).first()
             if alchemy_upload is None:
                 new_upload = None
             else:
 
-                roles_list = list()
-                for r in alchemy_upload.evidence.owner.roles:
-                    permissions_list = list()
-                    for p in r.permissions:
-                        new_permission = Permission(p.id, p.name, p.description)
-                        permissions_list.append(new_permission)
-                    new_role = Role(r.id, r.name, r.description, permissions_list)
-                    roles_list.append(new_role)
-
-                new_user = User(alchemy_upload.evidence.owner.id, alchemy_upload.evidence.owner.username,
-                                alchemy_upload.evidence.owner.password, alchemy_upload.evidence.owner.first_name,
-                                alchemy_upload.evidence.owner.family_name, alchemy_upload.evidence.owner.email,
-                                roles_list)
+                new_user = self.user_dto(alchemy_upload.evidence.owner)
                 new_evidence = Evidence(alchemy_upload.evidence.id, alchemy_upload.evidence.alias,
                                         alchemy_upload.evidence.size, new_user)
                 new_upload = Upload(alchemy_upload.id, alchemy_upload.path, alchemy_upload.size, alchemy_upload.type,
@@ -839,28 +1060,19 @@ class DatasourceModule(SkyModule):
         except Exception as e:
             raise AppException(GenericErrorMessages.DATABASE_ERROR + ': ' + str(e))
 
-    def get_all_files(self, upload_id):
+    def get_all_files(self, upload_id, after_id=None, limit=None):
         """
         This method retrieves all files from DB that belongs to upload_id
+        The list is ordered by id, after_id and limit return the page of rows with id greater than after_id
         :return: {File}
         """
         try:
-            alchemy_file_list = self.session.query(AlchemyFile).filter_by(upload_id=upload_id).all()
+            query = self.session.query(AlchemyFile).options(*self.FILE_LOAD).filter_by(upload_id=upload_id)
+            alchemy_file_list = self.page(query, AlchemyFile, after_id, limit).all()
             file_list = list()
 
             for f in alchemy_file_list:
-                roles_list = list()
-                for r in f.upload.evidence.owner.roles:
-                    permission_list = list()
-                    for p in r.permissions:
-                        new_permission = Permission(p.id, p.name, p.description)
-                        permission_list.append(new_permission)
-                    new_role = Role(r.id, r.name, r.description, permission_list)
-                    roles_list.append(new_role)
-
-                new_owner = User(f.upload.evidence.owner.id, f.upload.evidence.owner.username,
-                                 f.upload.evidence.owner.password, f.upload.evidence.owner.first_name,
-                                 f.upload.evidence.owner.family_name, f.upload.evidence.owner.email, roles_list)
+                new_owner = self.user_dto(f.upload.evidence.owner)
 
                 new_evidence = Evidence(f.upload.evidence.id, f.upload.evidence.alias, f.upload.evidence.size,
                                         new_owner)
@@ -875,34 +1087,27 @@ class DatasourceModule(SkyModule):
         except Exception as e:
             raise AppException(GenericErrorMessages.DATABASE_ERROR + ': ' + str(e))
 
+    def count_files(self, upload_id, cached=True):
+        """
+        This method counts the files that belong to upload_id
+        The count is cached until a new row is created, cached=False counts again
+        :return: Int
+        """
+        return self.count_all(AlchemyFile, cached, upload_id=upload_id)
+
     def get_file(self, file_id):
         """
         This method retrieves files with given id from DB
         :return: File
         """
         try:
-            alchemy_file = self.session.query(AlchemyFile).filter_by(id=file_id).first()
+            alchemy_file = self.session.query(AlchemyFile).options(*self.FILE_LOAD).filter_by(id=file_id).first()
 
             if alchemy_file is None:
                 new_file = None
             else:
 
-                roles_list = list()
-
-                for r in alchemy_file.upload.evidence.owner.roles:
-                    permission_list = list()
-                    for p in r.permissions:
-                        new_permission = Permission(p.id, p.name, p.description)
-                        permission_list.append(new_permission)
-
-                    new_role = Role(r.id, r.name, r.description, permission_list)
-                    roles_list.append(new_role)
-
-                new_user = User(alchemy_file.upload.evidence.owner.id, alchemy_file.upload.evidence.owner.username,
-                                alchemy_file.upload.evidence.owner.password,
-                                alchemy_file.upload.evidence.owner.first_name,
-                                alchemy_file.upload.evidence.owner.family_name,
-                                alchemy_file.upload.evidence.owner.email, roles_list)
+                new_user = self.user_dto(alchemy_file.upload.evidence.owner)
 
                 new_evidence = Evidence(alchemy_file.upload.evidence.id, alchemy_file.upload.evidence.alias,
                                         alchemy_file.upload.evidence.size, new_user)
@@ -931,6 +1136,7 @@ class DatasourceModule(SkyModule):
             self.session.add(alchemy_file)
 
             self.session.commit()
+            self.flush_count_cache(AlchemyFile)
 
             file = File(alchemy_file.id, alchemy_file.path, alchemy_file.size, alchemy_file.name, alchemy_file.hash_md5,
                         alchemy_file.hash_sha256, upload)
@@ -940,6 +1146,24 @@ class DatasourceModule(SkyModule):
         except Exception:
             return None, False
 
+    def create_files(self, rows, chunk_size=None):
+        """
+        This method inserts many files in DB, one transaction for each chunk of rows. Each row is a dict with path,
+        size, name, hash_md5, hash_sha256 and upload_id. The invalid rows are reported without aborting the batch
+        :return: dict with the number of rows created and failed and the list of errors with the index of the row
+        """
+        schema = FileBulkInputDataSchema()
+
+        def check_chunk(chunk):
+            valid, errors = self.load_chunk(chunk, schema)
+            upload_ids = {data['upload_id'] for _, data in valid}
+            uploads = {x[0] for x in self.session.query(AlchemyUpload.id).filter(AlchemyUpload.id.in_(upload_ids))}
+            errors.extend((index, 'Upload {} not found'.format(data['upload_id']))
+                          for index, data in valid if data['upload_id'] not in uploads)
+            return [(index, data) for index, data in valid if data['upload_id'] in uploads], errors
+
+        return self.bulk_insert(AlchemyFile, rows, check_chunk, chunk_size)
+
     def get_all_entities(self):
         """
         This method retrieves all entities from DB
@@ -1015,7 +1239,8 @@ class DatasourceModule(SkyModule):
         :return: {Instance}
         """
         try:
-            alchemy_instance_list = self.session.query(AlchemyInstance).filter_by(entity_id=entity_id).all()
+            alchemy_instance_list = self.session.query(AlchemyInstance).options(*self.INSTANCE_LOAD) \
+                .filter_by(entity_id=entity_id).all()
             instance_list = list()
 
             for ins in alchemy_instance_list:
@@ -1034,7 +1259,8 @@ class DatasourceModule(SkyModule):
         :return: Instance
         """
         try:
-            alchemy_instance = self.session.query(AlchemyInstance).filter_by(id=instance_id).first()
+            alchemy_instance = self.session.query(AlchemyInstance).options(*self.INSTANCE_LOAD) \
+                .filter_by(id=instance_id).first()
             if alchemy_instance is None:
                 new_instance = None
             else:
@@ -1088,7 +1314,8 @@ class DatasourceModule(SkyModule):
         :return: {Property}
         """
         try:
-            alchemy_property_list = self.session.query(AlchemyProperty).filter_by(entity_id=entity_id).all()
+            alchemy_property_list = self.session.query(AlchemyProperty).options(*self.PROPERTY_LOAD) \
+                .filter_by(entity_id=entity_id).all()
 
             property_list = list()
 
@@ -1108,7 +1335,8 @@ class DatasourceModule(SkyModule):
         :return: Property
         """
         try:
-            alchemy_property = self.session.query(AlchemyProperty).filter_by(id=property_id).first()
+            alchemy_property = self.session.query(AlchemyProperty).options(*self.PROPERTY_LOAD) \
+                .filter_by(id=property_id).first()
             if alchemy_property is None:
                 new_property = None
             else:
@@ -1157,13 +1385,15 @@ class DatasourceModule(SkyModule):
         except Exception as e:
             raise AppException(GenericErrorMessages.DATABASE_ERROR + ': ' + str(e))
 
-    def get_all_values(self, instance_id):
+    def get_all_values(self, instance_id, after_id=None, limit=None):
         """
         This method retrieves all values from DB that belongs to instance_id
+        The list is ordered by id, after_id and limit return the page of rows with id greater than after_id
         :return: {Value}
         """
         try:
-            alchemy_value_list = self.session.query(AlchemyValue).filter_by(instance_id=instance_id).all()
+            query = self.session.query(AlchemyValue).options(*self.VALUE_LOAD).filter_by(instance_id=instance_id)
+            alchemy_value_list = self.page(query, AlchemyValue, after_id, limit).all()
 
             value_list = list()
 
@@ -1179,13 +1409,21 @@ class DatasourceModule(SkyModule):
         except Exception as e:
             raise AppException(GenericErrorMessages.DATABASE_ERROR + ': ' + str(e))
 
+    def count_values(self, instance_id, cached=True):
+        """
+        This method counts the values that belong to instance_id
+        The count is cached until a new row is created, cached=False counts again
+        :return: Int
+        """
+        return self.count_all(AlchemyValue, cached, instance_id=instance_id)
+
     def get_value(self, value_id):
         """
         This method retrieves values with given id from DB
         :return: Value
         """
         try:
-            alchemy_value = self.session.query(AlchemyValue).filter_by(id=value_id).first()
+            alchemy_value = self.session.query(AlchemyValue).options(*self.VALUE_LOAD).filter_by(id=value_id).first()
 
             if alchemy_value is None:
                 new_value = None
@@ -1220,6 +1458,7 @@ class DatasourceModule(SkyModule):
 
             self.session.add(alchemy_value)
             self.session.commit()
+            self.flush_count_cache(AlchemyValue)
 
             value = Value(alchemy_value.id, property, instance, value)
 
@@ -1228,6 +1467,38 @@ class DatasourceModule(SkyModule):
         except Exception:
             return None, False
 
+    def create_values(self, rows, chunk_size=None):
+        """
+        This method inserts many values in DB, one transaction for each chunk of rows. Each row is a dict with
+        property_id, instance_id and value, the property and the instance must belong to the same entity. The invalid
+        rows are reported without aborting the batch
+        :return: dict with the number of rows created and failed and the list of errors with the index of the row
+        """
+        schema = ValueBulkInputDataSchema()
+
+        def check_chunk(chunk):
+            valid, errors = self.load_chunk(chunk, schema)
+            property_ids = {data['property_id'] for _, data in valid}
+            instance_ids = {data['instance_id'] for _, data in valid}
+            properties = dict(self.session.query(AlchemyProperty.id, AlchemyProperty.entity_id)
+                              .filter(AlchemyProperty.id.in_(property_ids)))
+            instances = dict(self.session.query(AlchemyInstance.id, AlchemyInstance.entity_id)
+                             .filter(AlchemyInstance.id.in_(instance_ids)))
+
+            mappings = list()
+            for index, data in valid:
+                if data['property_id'] not in properties:
+                    errors.append((index, 'Property {} not found'.format(data['property_id'])))
+                elif data['instance_id'] not in instances:
+                    errors.append((index, 'Instance {} not found'.format(data['instance_id'])))
+                elif properties[data['property_id']] != instances[data['instance_id']]:
+                    errors.append((index, 'Property and instance of different entities'))
+                else:
+                    mappings.append((index, data))
+            return mappings, errors
+
+        return self.bulk_insert(AlchemyValue, rows, check_chunk, chunk_size)
+
     def get_base_engine(self):
         """
         This method returns Base class and engine
@@ -765,3 +765,19 @@ class ValueInputDataSchema(Schema):
     property = fields.Nested(PropertiesSchema)
     instance = fields.Nested(InstancesSchema)
     value = fields.Str()
+
+
+# Rows of the bulk create views, the related rows are referenced by id
+class FileBulkInputDataSchema(Schema):
+    path = fields.Str(required=True)
+    size = fields.Float(required=True)
+    name = fields.Str(required=True)
+    hash_md5 = fields.Str(required=True)
+    hash_sha256 = fields.Str(required=True)
+    upload_id = fields.Int(required=True)
+
+
+class ValueBulkInputDataSchema(Schema):
+    property_id = fields.Int(required=True)
+    instance_id = fields.Int(required=True)
+    value = fields.Str(required=True)
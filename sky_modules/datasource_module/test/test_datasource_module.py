@@ -1,11 +1,15 @@
 import logging
 from common.infra_tools.decorators import log_function
-from nose.tools import assert_equal, assert_true
+from nose.tools import assert_equal, assert_true, assert_raises
 from sky_modules.datasource_module.datasource_module import DatasourceModule, MODULE_NAME
 from sky_modules.datasource_module.model_datasource_module import Permission, Role, User, CaseType, CaseStatus, Case, \
-    Evidence, Upload, File, Entity, Instance, Property, Value
+    Evidence, Upload, File, Entity, Instance, Property, Value, AlchemyRole, AlchemyFile
 from common import config
+from common.app_model import AppException
+from sqlalchemy import event
+from flask import Flask
 import datetime
+import threading
 
 logger = logging.getLogger(MODULE_NAME)
 
@@ -1189,3 +1193,136 @@ class TestDatasourceModule(object):
 
         found_user_id = self.module.get_user_id(login_user, login_pass)
         assert_true(found_user_id is None)
+
+    def count_queries(self, function, *args):
+        """
+        Call a getter with an empty session and count the queries it executes
+        """
+        queries = list()
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            queries.append(statement)
+
+        self.module.session.expire_all()
+        event.listen(self.module.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            result = function(*args)
+        finally:
+            event.remove(self.module.engine, 'before_cursor_execute', before_cursor_execute)
+        return result, len(queries)
+
+    @log_function(logger)
+    def test_29_constant_query_count(self):
+        # Upload 1 has 2 files and upload 2 has 3, the graph up to the permissions is read with the same queries
+        files_1, queries_1 = self.count_queries(self.module.get_all_files, 1)
+        files_2, queries_2 = self.count_queries(self.module.get_all_files, 2)
+        assert_true(len(files_1) < len(files_2))
+        assert_equal(queries_1, queries_2)
+        assert_true(queries_2 <= 3)
+        assert_true(len(files_2[0].upload.evidence.owner.roles[0].permissions) > 0)
+
+        # Evidence 1 has 2 uploads and evidence 2 has 4
+        uploads_1, queries_1 = self.count_queries(self.module.get_all_uploads, 1)
+        uploads_2, queries_2 = self.count_queries(self.module.get_all_uploads, 2)
+        assert_true(len(uploads_1) < len(uploads_2))
+        assert_equal(queries_1, queries_2)
+
+        _, queries = self.count_queries(self.module.get_all_users)
+        assert_true(queries <= 3)
+        _, queries = self.count_queries(self.module.get_all_evidences)
+        assert_true(queries <= 3)
+        _, queries = self.count_queries(self.module.get_file, 3)
+        assert_true(queries <= 3)
+
+    @log_function(logger)
+    def test_30_dto_cache(self):
+        # The role of the owner of every file is the same object
+        files = self.module.get_all_files(2)
+        roles = [f.upload.evidence.owner.roles[0] for f in files]
+        assert_true(all(r is roles[0] for r in roles))
+        assert_true(self.module.get_role(roles[0].id) is roles[0])
+
+        # Creating a role flushes the cache, the next results are built again
+        self.module.create_role('role cache', 'desc role cache', [self.module.get_permission(1)])
+        role = self.module.get_role(roles[0].id)
+        assert_true(role is not roles[0])
+        assert_equal(role.name, roles[0].name)
+
+        # In a request the session keeps the rows read before other thread flushes the cache, their DTOs are not cached
+        with Flask(__name__).test_request_context():
+            self.module.get_role(role.id)
+            alchemy_role = self.module.session.query(AlchemyRole).options(*DatasourceModule.ROLE_LOAD).get(role.id)
+            thread = threading.Thread(target=self.module.flush_dto_cache)
+            thread.start()
+            thread.join()
+            assert_true(self.module.role_dto(alchemy_role) is not self.module.role_dto(alchemy_role))
+        self.module.session.remove()
+
+    @log_function(logger)
+    def test_31_keyset_pagination(self):
+        files = self.module.get_all_files(2)
+        first_page = self.module.get_all_files(2, limit=2)
+        second_page = self.module.get_all_files(2, after_id=first_page[-1].id, limit=2)
+        assert_equal([f.id for f in first_page + second_page], [f.id for f in files])
+        assert_equal(len(second_page), len(files) - 2)
+        assert_equal(self.module.count_files(2), len(files))
+
+        # The count is cached until a file is created
+        self.module.create_file('file path 24', 104.44, 'file name 24', 'file has 5 24', 'file has256 24',
+                                self.module.get_upload(2))
+        assert_equal(self.module.count_files(2), len(files) + 1)
+        assert_equal(len(self.module.get_all_files(2, after_id=second_page[-1].id)), 1)
+
+    @log_function(logger)
+    def test_32_session_per_thread(self):
+        errors = list()
+        sessions = list()
+
+        def client():
+            try:
+                for _ in range(10):
+                    assert_equal(len(self.module.get_all_files(1)), 2)
+                    assert_equal(self.module.get_user(1).id, 1)
+                sessions.append(self.module.session.registry.has())
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=client) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert_equal(errors, [])
+        # Out of a Flask request the session of the thread is removed after each call
+        assert_equal(sessions, [False] * 8)
+
+
+    @log_function(logger)
+    def test_33_bulk_create_files_values(self):
+        files = self.module.count_files(3, cached=False)
+        row = {'path': 'bulk path', 'size': 10.5, 'name': 'bulk name', 'hash_md5': 'md5', 'hash_sha256': 'sha256',
+               'upload_id': 3}
+        rows = [row, dict(row, name=None), dict(row, upload_id=999), 'not a row', row, row]
+        result = self.module.create_files(rows, chunk_size=4)
+        assert_equal(result['created'], 3)
+        assert_equal(result['failed'], 3)
+        assert_equal(sorted(error['index'] for error in result['errors']), [1, 2, 3])
+        assert_equal(self.module.count_files(3), files + 3)
+
+        values = self.module.count_values(1, cached=False)
+        # Property 4 belongs to the entity of instance 4, not to the entity of instance 1
+        rows = [{'property_id': 1, 'instance_id': 1, 'value': 'bulk value 1'},
+                {'property_id': 4, 'instance_id': 1, 'value': 'bulk value 2'},
+                {'property_id': 999, 'instance_id': 1, 'value': 'bulk value 3'},
+                {'property_id': 2, 'instance_id': 1, 'value': 'bulk value 4'}]
+        result = self.module.create_values(rows)
+        assert_equal(result['created'], 2)
+        assert_equal(sorted(error['index'] for error in result['errors']), [1, 2])
+        assert_equal(self.module.count_values(1), values + 2)
+
+        # A database error checking the rows aborts the batch
+        def check_chunk(chunk):
+            self.module.session.execute('SELECT id FROM missing_table')
+
+        assert_raises(AppException, self.module.bulk_insert, AlchemyFile, [row], check_chunk)
@@ -1,4 +1,7 @@
+import json
 import logging
+from flask import request
+from flask_classful import route
 from common.module import ViewModule, authenticate
 from sky_modules.datasource_module import MODULE_NAME
 from sky_modules.datasource_module.model_datasource_module import PermissionSchema, RolesSchema, UsersSchema, \
@@ -11,6 +14,79 @@ from sky_modules.datasource_module.model_datasource_module import PermissionSche
 from common.app_model import DataResult, AppException, GenericErrorMessages
 logger = logging.getLogger(MODULE_NAME)
 
+# Maximum number of rows of a page of the list views
+MAX_PAGE_LIMIT = 1000
+
+
+def page_args():
+    """
+    Keyset pagination arguments of the request: after_id, the last id of the previous page, and limit
+    :return: tuple with after_id and limit, limit is None if the request does not ask for a page
+    """
+    after_id = request.args.get('after_id', None, type=int)
+    limit = request.args.get('limit', None, type=int)
+    if after_id is None and limit is None:
+        return None, None
+    if limit is None or limit <= 0 or limit > MAX_PAGE_LIMIT:
+        limit = MAX_PAGE_LIMIT
+    return after_id, limit
+
+
+def page_data(cls_schema, items: list, total: int, limit: int) -> dict:
+    """
+    Data of a page of a list view
+    :param cls_schema: schema of the items
+    :param items: items of the page, ordered by id
+    :param total: number of items of the whole list
+    :param limit: maximum number of items of the page
+    :return: dict with the items, the total and next_after_id to ask for the next page, None in the last page
+    """
+    next_after_id = items[-1].id if len(items) == limit else None
+    return {'items': cls_schema(many=True).dump(items)[0], 'total': total, 'next_after_id': next_after_id}
+
+
+def iter_request_rows():
+    """
+    Rows of the body of a bulk create request, a JSON array or a NDJSON stream with one JSON object in each line.
+    The NDJSON stream is read line by line, a line that is not valid JSON is returned as None and reported as an
+    invalid row
+    :return: iterator of the rows
+    """
+    if request.mimetype == 'application/x-ndjson':
+        for line in request.stream:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            try:
+                yield json.loads(line.decode('utf-8'))
+            except ValueError:
+                yield None
+    else:
+        rows = request.get_json(force=True, silent=True)
+        if not isinstance(rows, list):
+            raise AppException('Bulk create expects a JSON array or a NDJSON stream')
+        yield from rows
+
+
+def bulk_output(app_module, name: str, create_many):
+    """
+    Output of a bulk create view
+    :param app_module: module of the view
+    :param name: name of the created rows for the message
+    :param create_many: method of the module that creates the rows
+    :return: output with the number of rows created and failed and the errors of the invalid rows
+    """
+    try:
+        result = create_many(iter_request_rows())
+        code = 'CODE_CREATED_OK' if result['failed'] == 0 else 'CODE_CREATED_ERROR'
+        msg = '{} {} created, {} rows with errors'.format(result['created'], name, result['failed'])
+    except AppException as e:
+        result = {'created': 0, 'failed': 0, 'errors': list()}
+        code = 'CODE_CREATED_ERROR'
+        msg = str(e)
+    return app_module.create_output(DataResult, None, result, code, msg=msg)
+
+
 @authenticate()
 class DatasourceModuleView(ViewModule):
 
@@ -75,8 +151,12 @@ class DatasourceModuleView(ViewModule):
             return result
 
     def get_all_users(self):
+        after_id, limit = page_args()
+        total = 0
         try:
-            users = self.app_module.get_all_users()
+            users = self.app_module.get_all_users(after_id, limit)
+            if limit is not None:
+                total = self.app_module.count_users()
             code = 'CODE_OK'
             msg = 'All users list'
         except AppException as e:
@@ -84,7 +164,12 @@ class DatasourceModuleView(ViewModule):
             code = 'CODE_ERROR'
             msg = str(e)
         finally:
-            result = self.app_module.create_output(DataResult, UsersSchema, users, code, msg=msg)
+            if limit is None:
+                result = self.app_module.create_output(DataResult, UsersSchema, users, code, msg=msg)
+            else:
+                result = self.app_module.create_output(DataResult, None,
+                                                       page_data(UsersSchema, users, total, limit), code,
+                                                       msg=msg)
             return result
 
     def get_user(self, user_id):
@@ -175,8 +260,12 @@ class DatasourceModuleView(ViewModule):
             return result
 
     def get_all_cases(self):
+        after_id, limit = page_args()
+        total = 0
         try:
-            cases = self.app_module.get_all_cases()
+            cases = self.app_module.get_all_cases(after_id, limit)
+            if limit is not None:
+                total = self.app_module.count_cases()
             code = 'CODE_OK'
             msg = 'All cases list'
         except AppException as e:
@@ -184,7 +273,12 @@ class DatasourceModuleView(ViewModule):
             code = 'CODE_ERROR'
             msg = str(e)
         finally:
-            result = self.app_module.create_output(DataResult, CasesSchema, cases, code, msg=msg)
+            if limit is None:
+                result = self.app_module.create_output(DataResult, CasesSchema, cases, code, msg=msg)
+            else:
+                result = self.app_module.create_output(DataResult, None,
+                                                       page_data(CasesSchema, cases, total, limit), code,
+                                                       msg=msg)
             return result
 
     def get_case(self, case_id):
@@ -205,8 +299,12 @@ class DatasourceModuleView(ViewModule):
             return result
 
     def get_all_evidences(self):
+        after_id, limit = page_args()
+        total = 0
         try:
-            evidences = self.app_module.get_all_evidences()
+            evidences = self.app_module.get_all_evidences(after_id, limit)
+            if limit is not None:
+                total = self.app_module.count_evidences()
             code = 'CODE_OK'
             msg = 'All evidences list'
         except AppException as e:
@@ -214,7 +312,12 @@ class DatasourceModuleView(ViewModule):
             code = 'CODE_ERROR'
             msg = str(e)
         finally:
-            result = self.app_module.create_output(DataResult, EvidencesSchema, evidences, code, msg=msg)
+            if limit is None:
+                result = self.app_module.create_output(DataResult, EvidencesSchema, evidences, code, msg=msg)
+            else:
+                result = self.app_module.create_output(DataResult, None,
+                                                       page_data(EvidencesSchema, evidences, total, limit), code,
+                                                       msg=msg)
             return result
 
     def get_evidence(self, evidence_id):
@@ -265,8 +368,12 @@ class DatasourceModuleView(ViewModule):
             return result
 
     def get_all_files(self, upload_id):
+        after_id, limit = page_args()
+        total = 0
         try:
-            files_list = self.app_module.get_all_files(upload_id)
+            files_list = self.app_module.get_all_files(upload_id, after_id, limit)
+            if limit is not None:
+                total = self.app_module.count_files(upload_id)
             code = 'CODE_OK'
             msg = 'All files list for upload ' + upload_id
         except AppException as e:
@@ -274,7 +381,12 @@ class DatasourceModuleView(ViewModule):
             code = 'CODE_ERROR'
             msg = str(e)
         finally:
-            result = self.app_module.create_output(DataResult, FilesSchema, files_list, code, msg=msg)
+            if limit is None:
+                result = self.app_module.create_output(DataResult, FilesSchema, files_list, code, msg=msg)
+            else:
+                result = self.app_module.create_output(DataResult, None,
+                                                       page_data(FilesSchema, files_list, total, limit), code,
+                                                       msg=msg)
             return result
 
     def get_file(self, file_id):
@@ -385,8 +497,12 @@ class DatasourceModuleView(ViewModule):
             return result
 
     def get_all_values(self, instance_id):
+        after_id, limit = page_args()
+        total = 0
         try:
-            value_list = self.app_module.get_all_values(instance_id)
+            value_list = self.app_module.get_all_values(instance_id, after_id, limit)
+            if limit is not None:
+                total = self.app_module.count_values(instance_id)
             code = 'CODE_OK'
             msg = 'All values list for instance ' + instance_id
         except AppException as e:
@@ -394,7 +510,12 @@ class DatasourceModuleView(ViewModule):
             code = 'CODE_ERROR'
             msg = str(e)
         finally:
-            result = self.app_module.create_output(DataResult, ValuesSchema, value_list, code, msg=msg)
+            if limit is None:
+                result = self.app_module.create_output(DataResult, ValuesSchema, value_list, code, msg=msg)
+            else:
+                result = self.app_module.create_output(DataResult, None,
+                                                       page_data(ValuesSchema, value_list, total, limit), code,
+                                                       msg=msg)
             return result
 
     def get_value(self, value_id):
@@ -582,6 +703,11 @@ class CreateFileModuleView(ViewModule):
         result = self.app_module.create_output(DataResult, FilesSchema, file, code, msg=msg)
         return result
 
+    @route('/batch/', methods=['POST'])
+    def batch(self):
+        # For testing: curl --data-binary @files.ndjson -H "Content-type: application/x-ndjson" -X POST http://localhost:5000/ds/createfile/batch/
+        return bulk_output(self.app_module, 'files', self.app_module.create_files)
+
 
 class CreateEntityModuleView(ViewModule):
 
@@ -666,3 +792,8 @@ class CreateValueModuleView(ViewModule):
         result = self.app_module.create_output(DataResult, ValuesSchema, value, code, msg=msg)
         return result
 
+    @route('/batch/', methods=['POST'])
+    def batch(self):
+        # For testing: curl -d '[{"property_id": 1, "instance_id": 1, "value": "value 1"}]' -H "Content-type: application/json" -X POST http://localhost:5000/ds/createvalue/batch/
+        return bulk_output(self.app_module, 'values', self.app_module.create_values)
+
@@ -0,0 +1,91 @@
+import os
+
+from common import config
+from sky_modules.hunting_module import MODULE_NAME
+
+
+logger = config.get_log(MODULE_NAME)
+
+
+class FileTailReader:
+    """
+    Read only the lines appended to a forest output file since the last call. The byte offset and the line number
+    of the last consumed line are persisted per session and file in table session_file_offset.
+    """
+
+    def __init__(self, db, id_session: int, file_path: str, skip_rows: int = 0) -> None:
+        """
+        Load the checkpoint of the file for the session
+        :param db: database module
+        :param id_session: id of the session that owns the file
+        :param file_path: full path of the file to read
+        :param skip_rows: lines already loaded when there is no checkpoint saved (sessions started before checkpoints)
+        """
+        self.db = db
+        self.id_session = id_session
+        self.file_path = file_path
+        self.file_name = os.path.basename(file_path)
+        self.offset = 0
+        self.line_number = 0
+
+        self.load_checkpoint(skip_rows)
+
+    def load_checkpoint(self, skip_rows: int = 0) -> None:
+        """
+        Get the offset of the last consumed line from database.
+        :param skip_rows: lines to skip if there is no checkpoint
+        :return: None
+        """
+        rows = self.db.exec_query(
+            'SELECT file_offset, line_number FROM session_file_offset WHERE id_session=:id_session '
+            'AND file_name=:file_name', {'id_session': self.id_session, 'file_name': self.file_name})
+
+        if len(rows) > 0:
+            self.offset = int(rows[0]['file_offset'])
+            self.line_number = int(rows[0]['line_number'])
+        elif skip_rows > 0:
+            # Locate the offset once reading line by line, next calls will use the saved checkpoint
+            with open(self.file_path, 'rb') as f:
+                for _ in range(skip_rows):
+                    line = f.readline()
+                    if not line.endswith(b'\n'):
+                        break
+                    self.offset = self.offset + len(line)
+                    self.line_number = self.line_number + 1
+
+    def read_lines(self):
+        """
+        Generator of the complete lines written after the checkpoint. A last line without newline is still being
+        written by forest, so it is left for the next call. Offset is advanced in memory, call commit to persist it.
+        :return: tuples (line number, line without newline)
+        """
+        if os.path.getsize(self.file_path) < self.offset:
+            logger.warning('File {} is smaller than its checkpoint, reading from the beginning'.format(self.file_path))
+            self.offset = 0
+            self.line_number = 0
+
+        with open(self.file_path, 'rb') as f:
+            f.seek(self.offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                self.offset = self.offset + len(line)
+                self.line_number = self.line_number + 1
+                yield self.line_number, line.decode('utf-8', errors='replace').rstrip('\r\n')
+
+    def commit(self, connection=None) -> None:
+        """
+        Persist the current offset of the file.
+        :param connection: sqlite3 connection to save the offset inside its transaction, None to use the database module
+        :return: None
+        """
+        if connection is not None:
+            connection.execute(
+                'INSERT OR REPLACE INTO session_file_offset (id_session, file_name, file_offset, line_number) '
+                'VALUES (?, ?, ?, ?)', (self.id_session, self.file_name, self.offset, self.line_number))
+        else:
+            self.db.exec_query(
+                'INSERT OR REPLACE INTO session_file_offset (id_session, file_name, file_offset, line_number) '
+                'VALUES (:id_session, :file_name, :file_offset, :line_number)',
+                {'id_session': self.id_session, 'file_name': self.file_name, 'file_offset': self.offset,
+                 'line_number': self.line_number})
@@ -0,0 +1,80 @@
+import re
+
+
+class HostsLoader:
+    """
+    Merge the hosts read from a spreadsheet into table host. Rows are validated while they are read and written with a
+    single upsert by (ip, country) in one transaction, so new hosts are inserted and known hosts are updated in place.
+    """
+
+    UPSERT_QUERY = 'INSERT INTO host (hostname, ip, operating_system, channel_name, country, date_creation, ' \
+                   'date_modified) VALUES (?, ?, ?, ?, ?, ?, ?) ' \
+                   'ON CONFLICT(ip, country) DO UPDATE SET hostname=excluded.hostname, ' \
+                   'operating_system=excluded.operating_system, channel_name=excluded.channel_name'
+
+    IP_REGEXP = re.compile(r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$")
+
+    def __init__(self, connection, hosts_columns: list, country: str = None, job=None) -> None:
+        """
+        :param connection: sqlite3 connection to the hunting database
+        :param hosts_columns: column of table host for each value of the rows (hostname, ip, operating_system,
+        channel_name)
+        :param country: country of the hosts
+        :param job: ImportHostsJob to update the parsed rows and to check cancellation, None if there is no job
+        """
+        self.connection = connection
+        self.hosts_columns = hosts_columns
+        self.country = country if country else ''
+        self.job = job
+        self.parsed = 0
+        self.upserted = 0
+
+    @staticmethod
+    def to_text(value) -> str:
+        return str(value).strip() if value is not None else ''
+
+    def iter_hosts(self, rows, date_creation: int):
+        """
+        Generator of the parameters of the upsert for each valid row. Rows without a valid ip and repeated ips are
+        discarded, the first row of an ip wins. Stops when the job is cancelled.
+        :param rows: iterable of tuples with the values of hosts_columns
+        :param date_creation: date of creation and modification of the new hosts
+        :return: tuples with the parameters of UPSERT_QUERY
+        """
+        seen_ips = set()
+
+        for row in rows:
+            self.parsed = self.parsed + 1
+            if self.job is not None:
+                self.job.parsed = self.parsed
+                if self.job.is_cancelled():
+                    return
+
+            host = dict(zip(self.hosts_columns, row))
+            ip = self.to_text(host.get('ip'))
+            if not self.IP_REGEXP.match(ip) or ip in seen_ips:
+                continue
+            seen_ips.add(ip)
+
+            self.upserted = self.upserted + 1
+            yield (self.to_text(host.get('hostname')), ip, self.to_text(host.get('operating_system')),
+                   self.to_text(host.get('channel_name')) or 'unknown', self.country, date_creation, date_creation)
+
+    def load(self, rows, date_creation: int) -> int:
+        """
+        Upsert the hosts in one transaction. If the job is cancelled the transaction is rolled back.
+        :param rows: iterable of tuples with the values of hosts_columns
+        :param date_creation: date of creation and modification of the new hosts
+        :return: number of hosts inserted or updated
+        """
+        try:
+            self.connection.executemany(self.UPSERT_QUERY, self.iter_hosts(rows, date_creation))
+            if self.job is not None and self.job.is_cancelled():
+                self.connection.rollback()
+                return 0
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+
+        return self.upserted
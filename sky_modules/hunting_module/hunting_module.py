@@ -6,6 +6,8 @@ import time
 from datetime import datetime, date, timedelta
 import subprocess
 import csv
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from common import config, module_manager
 from sky_modules.hunting_module import MODULE_NAME
@@ -15,8 +17,14 @@ from sky_modules.hunting_module.load_hunting_database import HuntingDatabase as
 from sky_modules.hunting_module.views_hunting_module import HuntingModuleChannelView, HuntingModuleHostView, \
     HuntingModuleHistoricalCsvView, HuntingModuleEvidenceOutputsView, HuntingModuleReportView, HuntingModuleManualView
 from sky_modules.hunting_module.execute_cmd_task import ExecuteCmdTask
+from sky_modules.hunting_module.notify_hosts_task import NotifyHostsTask
+from sky_modules.hunting_module.import_hosts_job import ImportHostsJob
+from sky_modules.hunting_module.hosts_loader import HostsLoader
+from sky_modules.hunting_module.file_tail_reader import FileTailReader
+from sky_modules.hunting_module.hunting_report import HuntingReport
 
 from common import config
+from common.app_model import AppException
 from common.infra_tools.task_thread import TaskThread
 from common.infra_modules.database_module.database_module import DatabaseModule
 from common.infra_modules.parsing_module.parsing_module import ParsingModule
@@ -33,6 +41,11 @@ class HuntingModule(SkyModule):
     host_channel = 'channel_name'
     historical_host = 'historical_host'
     agent_status_folder = ''
+    notify_task = None
+    import_executor = None
+    # Jobs of the imports of hosts by id, the oldest ended ones are dropped when there are more than max_import_jobs
+    import_jobs = OrderedDict()
+    max_import_jobs = 100
 
     def initialize(self):
         """
@@ -47,6 +60,9 @@ class HuntingModule(SkyModule):
         self.load_config_parameters()
         self.create_database_tables_if_not_exist()
 
+        # Imports of hosts run one after another in background
+        HuntingModule.import_executor = ThreadPoolExecutor(max_workers=1)
+
         self.register_url(HuntingModuleChannelView, '/hunting/channel')
         self.register_url(HuntingModuleHostView, '/hunting/host')
         self.register_url(HuntingModuleHistoricalCsvView, '/hunting/historical')
@@ -94,7 +110,78 @@ class HuntingModule(SkyModule):
         HuntingModule.all_host_file = self.module_config.get_value(MODULE_NAME, 'all_host_file')
         HuntingModule.cancel_session_script = self.module_config.get_value(MODULE_NAME, 'cancel_session_script')
 
-    def load_hosts_xlsx(self, xlsx_params) -> bool:
+        # Config for NotifyHostsTask
+        try:
+            HuntingModule.notify_concurrency = int(self.module_config.get_value(MODULE_NAME, 'notify_concurrency'))
+        except AppException:
+            HuntingModule.notify_concurrency = 8
+        try:
+            HuntingModule.notify_timeout = int(self.module_config.get_value(MODULE_NAME, 'notify_timeout'))
+        except AppException:
+            HuntingModule.notify_timeout = 60
+
+    def submit_hosts_import(self, xlsx_params) -> ImportHostsJob:
+        """
+        Queue an import of hosts from a xlsx file to run in background.
+        :param xlsx_params: parameters of load_hosts_xlsx
+        :return: The job of the import.
+        """
+        job = ImportHostsJob(xlsx_params)
+        HuntingModule.import_jobs[job.id] = job
+        ImportHostsJob.evict_ended_jobs(HuntingModule.import_jobs, HuntingModule.max_import_jobs)
+        HuntingModule.import_executor.submit(self.run_hosts_import, job)
+
+        logger.info('Hosts import {} queued for {}'.format(job.id, xlsx_params.get('full_path')))
+        return job
+
+    def run_hosts_import(self, job: ImportHostsJob) -> None:
+        """
+        Run a queued import of hosts, updating the status of the job.
+        :param job: job of the import
+        :return: None
+        """
+        if job.is_cancelled():
+            job.status = ImportHostsJob.STATUS_CANCELLED
+            return
+
+        job.status = ImportHostsJob.STATUS_WORKING
+        try:
+            loaded = self.load_hosts_xlsx(job.xlsx_params, job=job)
+            if job.is_cancelled():
+                job.status = ImportHostsJob.STATUS_CANCELLED
+            else:
+                job.status = ImportHostsJob.STATUS_FINISHED if loaded else ImportHostsJob.STATUS_FAILED
+        except Exception as e:
+            logger.error('Error importing hosts from {}'.format(job.xlsx_params.get('full_path')), exc_info=True)
+            job.error = str(e)
+            job.status = ImportHostsJob.STATUS_FAILED
+
+    def get_import_job(self, job_id) -> dict:
+        """
+        Retrieve the status and counters of an import of hosts.
+        :param job_id: id of the job
+        :return: A dict with the job information, None if the job does not exist.
+        """
+        job = HuntingModule.import_jobs.get(job_id)
+        return job.to_dict() if job is not None else None
+
+    def cancel_import_job(self, job_id) -> bool:
+        """
+        Cancel an import of hosts.
+        :param job_id: id of the job
+        :return: True if the job was running or queued.
+        """
+        job = HuntingModule.import_jobs.get(job_id)
+        return job.cancel() if job is not None else False
+
+    def load_hosts_xlsx(self, xlsx_params, job: ImportHostsJob = None) -> bool:
+        """
+        Merge the hosts of a xlsx file into host and notify the new ones to forest in background.
+        :param xlsx_params: dict with full_path and optionally xlsx_header and country
+        :param job: job of the import, its counters are updated
+        :return: True if the hosts were loaded, False if the job was cancelled. Errors are raised to be stored in the
+        job.
+        """
         full_path = xlsx_params.get('full_path')
         xlsx_header = xlsx_params.get('xlsx_header', None)
         xlsx_country = xlsx_params.get('country', None)
@@ -108,106 +195,64 @@ class HuntingModule(SkyModule):
             xlsx_columns = list(csv.reader([xlsx_header], delimiter=' '))[0]
 
         try:
-            if os.path.isfile(full_path):
-                (current_number_of_hosts, current_number_of_channels) = self.get_number_of_channels_and_hosts()
-
-                xlsx_dataframe = HuntingModule.parsing_module.load_xlsx(full_path, xlsx_cols=xlsx_columns)
-
-                new_cols = dict()
-                for idx, val in enumerate(xlsx_columns):
-                    new_cols[val] = hosts_columns[idx]
-
-                xlsx_dataframe.rename(columns=new_cols,
-                                      inplace=True)
-
-                xlsx_dataframe.dropna(subset=['ip'], inplace=True)
-                xlsx_dataframe.drop_duplicates(subset=['ip'], inplace=True)
-
-                xlsx_hostnames = list(xlsx_dataframe['ip'])
-                existing_hostnames_query = 'SELECT ip FROM host WHERE country="{}" AND ip IN ("{}")'.format(
-                    xlsx_country, '","'.join(map(str, xlsx_hostnames)))
-                result = HuntingModule.database_module.exec_query(existing_hostnames_query)
-                ips = [value['ip'] for value in result]
-
-                indexNames = xlsx_dataframe[xlsx_dataframe['ip'].apply(self.check_valid_ip)].index
-                xlsx_dataframe.drop(indexNames, inplace=True)
-
-                indexNames = xlsx_dataframe[xlsx_dataframe['ip'].isin(ips)].index
-                to_insert = xlsx_dataframe.drop(indexNames, inplace=False)
-
-                indexNames = xlsx_dataframe[~xlsx_dataframe['ip'].isin(ips)].index
-                to_update = xlsx_dataframe.drop(indexNames, inplace=False)
-
-                date_creation = self.get_datetime_in_hunting_database_format()
-                HuntingModule.parsing_module.load_xlsx_to_database(to_insert, connection, self.hosts_table)
-                self.update_hosts_dates_and_empty_channels(date_creation, country=xlsx_country)
-
-                query = 'DROP TABLE IF EXISTS host_aux'
-                HuntingModule.database_module.exec_query(query)
-
-                query = 'CREATE TABLE IF NOT EXISTS host_aux(id INTEGER NOT NULL PRIMARY KEY,hostname TEXT DEFAULT "",ip TEXT NOT NULL,operating_system TEXT DEFAULT "",date_creation INTEGER DEFAULT 0,agent_available INTEGER DEFAULT 0,forest_available INTEGER DEFAULT 0,channel_name TEXT DEFAULT "unknown",country TEXT DEFAULT "",managed_by TEXT DEFAULT "")'
-                HuntingModule.database_module.exec_query(query)
-
-                HuntingModule.parsing_module.load_xlsx_to_database(to_update, connection,
-                                                                   '{}_aux'.format(self.hosts_table))
-                query = 'UPDATE {} SET channel_name="unknown" WHERE date_creation=0 AND channel_name IS NULL'.format(
-                    '{}_aux'.format(self.hosts_table))
-                HuntingModule.database_module.exec_query(query)
-
-                query = 'UPDATE host SET ' \
-                        '  hostname = (SELECT host_aux.hostname FROM host_aux WHERE host_aux.ip = host.ip), ' \
-                        '  channel_name = (SELECT host_aux.channel_name FROM host_aux WHERE host_aux.ip = host.ip), ' \
-                        '  operating_system = (SELECT host_aux.operating_system FROM host_aux WHERE host_aux.ip = host.ip AND host_aux.country = host.country ) ' \
-                        'WHERE EXISTS (SELECT * FROM host_aux WHERE host_aux.ip = host.ip)'
-                HuntingModule.database_module.exec_query(query)
-
-                self.insert_new_host_channels()
-
-                loaded = True
-
-                (new_number_of_hosts, new_number_of_channels) = self.get_number_of_channels_and_hosts()
-
-                total_hosts = new_number_of_hosts - current_number_of_hosts
-                total_channels = new_number_of_channels - current_number_of_channels
-                self.insert_historical_xlsx(full_path, total_channels, total_hosts)
-
-                new_host_notify = self.get_hosts_by_creation_date(date_creation)
-                for host in new_host_notify:
-                    # Call to Forest
-                    cmd = HuntingModule.hunting_script_notif_path + " -ip=" + host['ip'] + " -host=" + host['hostname']
-
-                    p = subprocess.Popen("exec " + cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                         stdin=subprocess.PIPE)
-
-                    codes = {
-                        'HOST_NO_ACCESIBLE': [0, 0],
-                        'HOST_REGISTERED': [1, 1],
-                        'HOST_EXISTS_IN_CASE': [1, 1],
-                        'DEFAULT': [0, 0]
-                    }
-
-                    out, err = p.communicate()
-
-                    code_output = out.decode('utf-8').split('\n')[-2]
-
-                    query = 'UPDATE host SET agent_available={}, forest_available={} WHERE id={}'.format(
-                        codes.get(code_output, codes['DEFAULT'])[0], codes.get(code_output, codes['DEFAULT'])[1],
-                        host['id'])
-                    HuntingModule.database_module.exec_query(query)
-
-                    with open(HuntingModule.all_host_file, 'a') as all_host_file:
-                        all_host_file.write(
-                            '{},{},{},{},{}\n'.format(host['hostname'], host['ip'], host['operating_system'],
-                                                      host['channel_name'], host['managed_by']))
-
-
-        except Exception as e:
-            print(e)
+            if not os.path.isfile(full_path):
+                raise AppException('File {} not found'.format(full_path))
+
+            (current_number_of_hosts, current_number_of_channels) = self.get_number_of_channels_and_hosts()
+
+            # Rows are merged into host while they are read from the xlsx
+            date_creation = self.get_datetime_in_hunting_database_format()
+            rows = HuntingModule.parsing_module.iter_xlsx(full_path, xlsx_cols=xlsx_columns)
+            hosts_loader = HostsLoader(connection, hosts_columns, country=xlsx_country, job=job)
+            upserted = hosts_loader.load(rows, date_creation)
+            # Hosts are written by other connection, out of the cache of the database module
+            HuntingModule.database_module.invalidate_tables(['host'])
+
+            # A cancelled import leaves the database unchanged
+            if job is not None and job.is_cancelled():
+                return loaded
+
+            self.insert_new_host_channels()
+
+            loaded = True
+
+            (new_number_of_hosts, new_number_of_channels) = self.get_number_of_channels_and_hosts()
+
+            total_hosts = new_number_of_hosts - current_number_of_hosts
+            total_channels = new_number_of_channels - current_number_of_channels
+            self.insert_historical_xlsx(full_path, total_channels, total_hosts)
+
+            if job is not None:
+                job.inserted = total_hosts
+                job.updated = upserted - total_hosts
+
+            if job is not None and job.is_cancelled():
+                return loaded
+
+            # Forest is notified in background, the progress is returned by get_notification_progress
+            new_host_notify = self.get_hosts_by_creation_date(date_creation)
+            HuntingModule.notify_task = NotifyHostsTask(logger, HuntingModule.database_module, new_host_notify,
+                                                        HuntingModule.hunting_script_notif_path,
+                                                        HuntingModule.all_host_file,
+                                                        concurrency=HuntingModule.notify_concurrency,
+                                                        timeout=HuntingModule.notify_timeout)
+            HuntingModule.notify_task.set_only_one_execution()
+            if job is not None:
+                job.notify_task = HuntingModule.notify_task
+            HuntingModule.notify_task.start()
+        finally:
+            connection.close()
 
         return loaded
 
-    def check_valid_ip(self, ip):
-        return not re.match(r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$", ip)
+    def get_notification_progress(self) -> dict:
+        """
+        Retrieve the progress of the notification to forest of the hosts of the last import.
+        :return: A dict with status and counters, empty if no hosts have been notified.
+        """
+        if HuntingModule.notify_task is None:
+            return dict()
+        return HuntingModule.notify_task.get_progress()
 
     def load_hunting_info_from_files(self, task_info) -> (bool, bool):
         return self.execute_channel.load_hunting_info_from_files(task_info)
@@ -217,50 +262,62 @@ class HuntingModule(SkyModule):
 
         return HuntingModule.database_module.exec_query(query)
 
+    def iter_host_data(self, batch_size: int = 1000):
+        """
+        Read all the hosts in batches by id, without loading the whole table in memory. Each batch is one short query,
+        so a slow client of the streamed response does not hold a connection of the pool.
+        :param batch_size: number of hosts of each batch
+        :return: generator of lists of hosts
+        """
+        return HuntingModule.database_module.iter_table(HuntingModule.hosts_table, batch_size=batch_size)
+
     def get_hosts_by_creation_date(self, date_creation):
         hosts = HuntingModule.database_module.exec_query(
-            'SELECT * FROM host WHERE date_creation="{}"'.format(date_creation))
+            'SELECT * FROM host WHERE date_creation=:date_creation', {'date_creation': date_creation})
         return hosts
 
     def update_hosts_channel(self, old_channel: str, new_channel: str) -> None:
         datetime_modified = self.get_datetime_in_hunting_database_format()
 
         # Save to historical host table
-        query = 'INSERT INTO "{}" (ip, country, old_channel_name, date_modified, status) ' \
-                'SELECT ip, country, channe_name, "{}", "{}" FROM host)'.format(self.historical_host, datetime_modified,
-                                                                                "CHANGE_CHANNEL")
-        HuntingModule.database_module.exec_query(query)
+        query = 'INSERT INTO {} (host_name, channel_name, date_modified, status) ' \
+                'SELECT hostname, channel_name, :date_modified, :status FROM {} ' \
+                'WHERE channel_name=:old_channel'.format(self.historical_host, self.hosts_table)
+        HuntingModule.database_module.exec_query(query, {'date_modified': datetime_modified,
+                                                         'status': "CHANGE_CHANNEL", 'old_channel': old_channel})
 
         # Update channel from all hosts
-        query = 'UPDATE {} SET channel_name="{}", date_modified={} WHERE channel_name="{}"'.format(self.hosts_table,
-                                                                                                   new_channel,
-                                                                                                   datetime_modified,
-                                                                                                   old_channel)
+        query = 'UPDATE {} SET channel_name=:new_channel, date_modified=:date_modified ' \
+                'WHERE channel_name=:old_channel'.format(self.hosts_table)
 
-        HuntingModule.database_module.exec_query(query)
+        HuntingModule.database_module.exec_query(query, {'new_channel': new_channel, 'old_channel': old_channel,
+                                                         'date_modified': datetime_modified})
         self.insert_new_host_channels()
 
     def create_database_tables_if_not_exist(self) -> None:
+        hd.check_sqlite_version()
         hd.create_hunting_database(HuntingModule.database_for_panda, HuntingModule.sql_script)
+        for database in HuntingModule.get_shard_databases():
+            hd.create_hunting_database(database, HuntingModule.sql_script)
+
+    @staticmethod
+    def get_shard_databases() -> list:
+        """
+        Files of the shards of the database module, the hits of the channels of a shard are stored in its file.
+        :return: list with the file of every shard
+        """
+        databases = list()
+        for key in HuntingModule.database_module.shard_urls.keys():
+            database = HuntingModule.database_module.get_shard_database(key)
+            if database not in databases:
+                databases.append(database)
+        return databases
 
     def remove_repeated_hosts(self) -> None:
         query = 'DELETE FROM host WHERE (id NOT IN (SELECT MIN(id) FROM host GROUP BY hostname)) OR ip IS NULL'
 
         HuntingModule.database_module.exec_query(query)
 
-    def update_hosts_dates_and_empty_channels(self, date_creation, country=None) -> None:
-        query = 'UPDATE host SET channel_name="unknown" WHERE date_creation=0 AND channel_name IS NULL'
-        HuntingModule.database_module.exec_query(query)
-
-        if country:
-            query = 'UPDATE host SET country="{}" WHERE date_creation=0 and country=""'.format(country)
-            HuntingModule.database_module.exec_query(query)
-
-        query = 'UPDATE host SET date_creation={}, date_modified={} WHERE date_creation=0'.format(date_creation,
-                                                                                                  date_creation)
-
-        HuntingModule.database_module.exec_query(query)
-
     def insert_new_host_channels(self) -> None:
         query = 'SELECT DISTINCT(channel_name) FROM host WHERE channel_name IS NOT NULL AND channel_name NOT IN (SELECT DISTINCT(name) FROM channel)'
 
@@ -282,7 +339,7 @@ class HuntingModule(SkyModule):
         :param name: The name of the channel to retrieve.
         :return: A dict containing the information of the channel.
         """
-        result = HuntingModule.database_module.exec_query('SELECT * FROM channel WHERE name="{}"'.format(name))
+        result = HuntingModule.database_module.exec_query('SELECT * FROM channel WHERE name=:name', {'name': name})
         return result
 
     @staticmethod
@@ -309,19 +366,14 @@ class HuntingModule(SkyModule):
         :return:
         """
         result = HuntingModule.database_module.exec_query(
-            'INSERT INTO channel VALUES ("{}","{}","{}","{}","{}","{}","{}")'.format(input_data['name'],
-                                                                                     input_data['hunting_type'],
-                                                                                     input_data['gevo_associated'],
-                                                                                     input_data['concurrence_type'],
-                                                                                     input_data['concurrence_time'],
-                                                                                     input_data['scheduling'],
-                                                                                     input_data['priority']))
+            'INSERT INTO channel VALUES (:name, :hunting_type, :gevo_associated, :concurrence_type, :concurrence_time, '
+            ':scheduling, :priority)', input_data)
 
         return result
 
     def add_empty_channel(self, channel_name):
         result = HuntingModule.database_module.exec_query(
-            'INSERT INTO channel (name) VALUES ("{}")'.format(channel_name))
+            'INSERT INTO channel (name) VALUES (:name)', {'name': channel_name})
 
         return result
 
@@ -331,15 +383,10 @@ class HuntingModule(SkyModule):
         :param input_data: dict with the new information about the channel.
         :return:
         """
-        result = HuntingModule.database_module.exec_query('UPDATE channel SET hunting_type="{}", gevo_associated="{}",'
-                                                          'concurrence_type="{}", concurrence_time="{}", scheduling="{}", priority="{}" WHERE name="{}"'.format(
-            input_data['hunting_type'],
-            input_data['gevo_associated'],
-            input_data['concurrence_type'],
-            input_data['concurrence_time'],
-            input_data['scheduling'],
-            input_data['priority'],
-            input_data['name']))
+        result = HuntingModule.database_module.exec_query(
+            'UPDATE channel SET hunting_type=:hunting_type, gevo_associated=:gevo_associated, '
+            'concurrence_type=:concurrence_type, concurrence_time=:concurrence_time, scheduling=:scheduling, '
+            'priority=:priority WHERE name=:name', input_data)
 
         return result
 
@@ -349,7 +396,7 @@ class HuntingModule(SkyModule):
         :param name: Name of the channel to delete
         :return:
         """
-        result = HuntingModule.database_module.exec_query('DELETE FROM channel WHERE name="{}"'.format(name))
+        result = HuntingModule.database_module.exec_query('DELETE FROM channel WHERE name=:name', {'name': name})
         return result
 
     def get_historical_xlsx(self):
@@ -386,156 +433,33 @@ class HuntingModule(SkyModule):
 
     def get_report_total(self):
         """
-        Retrieve a single channel from database, by its name.
-        :return: A dict containing the information of the channel.
+        Retrieve the global report of all channels.
+        :return: A list with a dict containing the global report.
         """
-        result = dict()
-
-        total_scope = HuntingModule.database_module.exec_query(
-            'SELECT COUNT(*) AS total_scope FROM host')[0]
-        result.update(total_scope)
-        total_agent_up = HuntingModule.database_module.exec_query(
-            'SELECT COUNT(*) AS total_agents_up FROM host WHERE agent_available=1 AND active=1')[0]
-        result.update(total_agent_up)
-        total_agents_down = HuntingModule.database_module.exec_query(
-            'SELECT COUNT(*) AS total_agents_down FROM host WHERE agent_available=0 AND active=1')[0]
-        result.update(total_agents_down)
-        total_availables_hosts = HuntingModule.database_module.exec_query(
-            'SELECT COUNT(*) AS total_availables_hosts FROM host WHERE agent_available=1 AND forest_available=1 AND active=1')[
-            0]
-        result.update(total_availables_hosts)
-        total_finished_hosts = HuntingModule.database_module.exec_query(
-            'SELECT COUNT(*) AS total_finished_hosts FROM processed_host')[
-            0]
-        result.update(total_finished_hosts)
-        total_session_hosts = HuntingModule.database_module.exec_query(
-            'SELECT COUNT(DISTINCT(id)) AS total_session_hosts FROM host WHERE active=1 AND id IN (SELECT id_host FROM hist_session_host)')[
-            0]
-        diff = int(total_session_hosts['total_session_hosts']) - int(total_finished_hosts['total_finished_hosts'])
-        total_failed_hosts = {"total_failed_hosts": diff}
-        result.update(total_failed_hosts)
-        last_hit = HuntingModule.database_module.exec_query(
-            'SELECT date AS last_hit FROM session_hit ORDER BY date DESC LIMIT 1')
-        last_hit_result = last_hit[0] if len(last_hit) > 0 else {'last_hit': 0}
-        result.update(last_hit_result)
-
-        # Calculate the current progress
-        if total_finished_hosts['total_finished_hosts'] > 0:
-            current_progress = float(total_finished_hosts['total_finished_hosts']) / float(
-                total_scope['total_scope']) * 100
-            current_progress = str(round(current_progress, 2)) + "%"
-        else:
-            current_progress = "0%"
-        result.update({'current_progress': current_progress})
-
-        # Calculate the last day progress
-        now = datetime.now()
-        current_time = int(now.strftime("%Y%m%d000000"))
-        total_finished_hosts_last_day = HuntingModule.database_module.exec_query(
-            'SELECT COUNT(DISTINCT(id)) AS total_finished_hosts_last_day FROM host WHERE active=1 AND id IN (SELECT id_host FROM session_host WHERE status="OK" AND date_finish < {})'.format(
-                current_time))[
-            0]
-        if total_finished_hosts_last_day['total_finished_hosts_last_day'] > 0:
-            total_finished_hosts = total_finished_hosts['total_finished_hosts'] - total_finished_hosts_last_day[
-                'total_finished_hosts_last_day']
-            last_day_progress = float(total_finished_hosts) / float(total_scope['total_scope']) * 100
-            last_day_progress = str(round(last_day_progress, 2)) + "%"
-        else:
-            last_day_progress = "0%"
-        result.update({'last_day_progress': last_day_progress})
-
-        last_update = HuntingModule.database_module.exec_query(
-            'SELECT date_finish  AS last_update FROM session ORDER BY date_finish DESC LIMIT 1')[0]
-        result.update(last_update)
-
-        result_list = list()
-        result_list.append(result)
-
-        return result_list
+        return HuntingReport(HuntingModule.database_module).get_report_total()
 
     def get_report_total_by_channel(self):
         """
         Retrieve a report by channel.
         :return: A dict containing the report of the channel.
         """
-        channels_list = HuntingModule.database_module.exec_query('SELECT name from channel')
-
-        result_total = list()
-        for channel in channels_list:
-            if channel['name'] == 'manual':
-                continue
-            result = dict()
-
-            total_scope = HuntingModule.database_module.exec_query(
-                'SELECT COUNT(*) AS total_scope FROM host WHERE channel_name="{}"'.format(
-                    channel['name']))[0]
-            result.update(total_scope)
-            total_availables_hosts = HuntingModule.database_module.exec_query(
-                'SELECT COUNT(*) AS total_availables_hosts FROM host WHERE agent_available=1 AND forest_available=1 AND active=1 AND channel_name="{}"'.format(
-                    channel['name']))[
-                0]
-            result.update(total_availables_hosts)
-            total_finished_hosts = HuntingModule.database_module.exec_query(
-                'SELECT COUNT(DISTINCT(id)) AS total_finished_hosts FROM host WHERE active=1 AND channel_name="{}" AND id IN (SELECT id_host FROM session_host WHERE status="OK")'.format(
-                    channel['name']))[
-                0]
-            result.update(total_finished_hosts)
-            total_session_hosts = HuntingModule.database_module.exec_query(
-                'SELECT COUNT(DISTINCT(id)) AS total_session_hosts FROM host WHERE active=1 AND channel_name="{}" AND id IN (SELECT id_host FROM session_host)'.format(
-                    channel['name']))[
-                0]
-            diff = int(total_session_hosts['total_session_hosts']) - int(total_finished_hosts['total_finished_hosts'])
-            total_failed_hosts = {'total_failed_hosts': diff}
-            result.update(total_failed_hosts)
-            total_finished_evos = HuntingModule.database_module.exec_query(
-                'SELECT COUNT(DISTINCT(evo)) AS total_finished_evos FROM (SELECT * FROM session_evo WHERE status="OK" AND id_session IN ('
-                'SELECT DISTINCT(id) FROM session WHERE channel_name="{}") GROUP BY session_hostname, evo)'.format(
-                    channel['name']))[
-                0]
-            result.update(total_finished_evos)
-            total_evos_skipped = HuntingModule.database_module.exec_query(
-                'SELECT COUNT(DISTINCT(evo)) AS total_evos_skipped FROM (SELECT * FROM session_evo WHERE status="SKIP" AND id_session IN ('
-                'SELECT DISTINCT(id) FROM session WHERE channel_name="{}") GROUP BY session_hostname, evo)'.format(
-                    channel['name']))[
-                0]
-            result.update(total_evos_skipped)
-            total_evos = HuntingModule.database_module.exec_query(
-                'SELECT COUNT(DISTINCT(evo)) AS total_evos FROM (SELECT * FROM session_evo WHERE id_session IN ('
-                'SELECT DISTINCT(id) FROM session WHERE channel_name="{}") GROUP BY session_hostname, evo)'.format(
-                    channel['name']))[
-                0]
-            result.update(total_evos)
-            total_agent_up = HuntingModule.database_module.exec_query(
-                'SELECT COUNT(*) AS total_agents_up FROM host WHERE agent_available=1 AND active=1 AND channel_name ="{}"'.format(channel['name']))[0]
-            result.update(total_agent_up)
-            total_agents_down = HuntingModule.database_module.exec_query(
-                'SELECT COUNT(*) AS total_agents_down FROM host WHERE agent_available=0 AND active=1 AND channel_name ="{}"'.format(channel['name']))[0]
-            result.update(total_agents_down)
-            last_update = HuntingModule.database_module.exec_query(
-                'SELECT date_finish AS last_update FROM session WHERE channel_name ="{}" ORDER BY date_finish DESC LIMIT 1'.format(
-                    channel['name']))[
-                0]
-            result.update(last_update)
-
-            # Add the channel name
-            result.update({'channel_name': channel['name']})
-
-            result_total.append(result)
-        return result_total
+        return HuntingReport(HuntingModule.database_module).get_report_total_by_channel()
 
     def get_report_details_by_channel(self, channel_name):
         """
         Retrieve a detailed report by channel.
         :return: A dict containing the detailed report of the channel.
         """
-        hosts_channel = HuntingModule.database_module.exec_query('SELECT * from host WHERE channel_name="{}"'.format(channel_name))
+        hosts_channel = HuntingModule.database_module.exec_query('SELECT * from host WHERE channel_name=:channel_name',
+                                                                 {'channel_name': channel_name})
 
         result_total = list()
         for host in hosts_channel:
             result = dict()
 
             is_processed = HuntingModule.database_module.exec_query(
-                'SELECT COUNT(*) AS total from session_host WHERE id_host={} AND status="OK"'.format(host['id']))[0]
+                'SELECT COUNT(*) AS total from session_host WHERE id_host=:id_host AND status="OK"',
+                {'id_host': host['id']})[0]
             processed = "PROCESSED" if is_processed['total'] > 0 else "NOT_PROCESSED"
 
             result.update({'hostname': host['hostname']})
@@ -553,20 +477,30 @@ class HuntingModule(SkyModule):
         """
         result = HuntingModule.database_module.exec_query(
             'SELECT DISTINCT(evo) AS failed_evo, session_hostname AS hostname FROM session_evo WHERE status!="OK" '
-            'AND id_session IN (SELECT DISTINCT(id) FROM session WHERE channel_name="{}") '
+            'AND id_session IN (SELECT DISTINCT(id) FROM session WHERE channel_name=:channel_name) '
             'AND evo NOT IN (SELECT DISTINCT(evo) FROM session_evo WHERE status="OK") '
-            'GROUP BY evo, session_hostname'.format(channel_name))
+            'GROUP BY evo, session_hostname', {'channel_name': channel_name})
 
         return result
 
     def get_report_hits(self):
         """
-        Retrieve all hits from database.
+        Retrieve all hits from the database and its shards.
         :return: A dict containing the list of hits with information.
         """
-        result = HuntingModule.database_module.exec_query('SELECT * FROM session_hits')
+        result = HuntingModule.database_module.fan_out('SELECT * FROM session_hit')
         return result
 
+    def iter_report_hits(self, batch_size: int = 1000):
+        """
+        Read all hits from the database and its shards in batches by rowid, without loading the whole table in memory.
+        Each batch is one short query, so a slow client of the streamed response does not hold a connection of the pool.
+        :param batch_size: number of hits of each batch
+        :return: generator of lists of hits
+        """
+        return HuntingModule.database_module.iter_table('session_hit', key='rowid', batch_size=batch_size,
+                                                        fan_out=True)
+
     def get_report_agents_status(self, status):
         """
         Retrieve all agents' status of hosts.
@@ -575,7 +509,8 @@ class HuntingModule(SkyModule):
         if status != 'total':
             status = 1 if status == 'up' else 0
             hosts_agents_status = HuntingModule.database_module.exec_query(
-                'SELECT hostname, ip, agent_available FROM host WHERE active = 1 AND agent_available={}'.format(status))
+                'SELECT hostname, ip, agent_available FROM host WHERE active = 1 AND agent_available=:status',
+                {'status': status})
         else:
             hosts_agents_status = HuntingModule.database_module.exec_query(
                 'SELECT hostname, ip, agent_available FROM host WHERE active = 1')
@@ -624,34 +559,42 @@ class HuntingModule(SkyModule):
         """
         channels_list = HuntingModule.database_module.exec_query('SELECT name from channel')
 
+        today = datetime.now()
+        date_start_today = int(today.strftime("%Y%m%d000000"))
+        yesterday = date.today() - timedelta(1)
+        date_start_yesterday = int(yesterday.strftime("%Y%m%d000000"))
+
+        # Hits are stored in the shards, they are counted by host in all of them and added by channel
+        hits_by_host = HuntingModule.database_module.fan_out_aggregate(
+            'SELECT session_host, COUNT(*) AS hits FROM session_hit WHERE (date BETWEEN :date_start AND :date_finish) '
+            'GROUP BY session_host', {'date_start': date_start_yesterday, 'date_finish': date_start_today},
+            keys=['session_host'], sums=['hits'])
+        hits_by_host = {row['session_host']: row['hits'] for row in hits_by_host}
+
         result_total = list()
         for channel in channels_list:
             if channel['name'] == 'manual':
                 continue
             result = dict()
 
-            today = datetime.now()
-            date_start_today = int(today.strftime("%Y%m%d000000"))
-            yesterday = date.today() - timedelta(1)
-            date_start_yesterday = int(yesterday.strftime("%Y%m%d000000"))
+            params = {'channel_name': channel['name'], 'date_start': date_start_yesterday,
+                      'date_finish': date_start_today}
 
             hunts = HuntingModule.database_module.exec_query(
-                'SELECT COUNT(*) AS hunts FROM session WHERE channel_name="{}" AND (date_finish BETWEEN {} AND {})'.format(
-                    channel['name'], date_start_yesterday, date_start_today))[0]
+                'SELECT COUNT(*) AS hunts FROM session WHERE channel_name=:channel_name '
+                'AND (date_finish BETWEEN :date_start AND :date_finish)', params)[0]
             result.update(hunts)
 
             hosts = HuntingModule.database_module.exec_query(
-                'SELECT COUNT(DISTINCT(id)) AS hosts FROM host WHERE active=1 AND channel_name="{}" AND id IN ('
-                'SELECT DISTINCT(id_host) FROM session_host WHERE (date_finish BETWEEN {} AND {})'
-                ')'.format(
-                    channel['name'], date_start_yesterday, date_start_today))[0]
+                'SELECT COUNT(DISTINCT(id)) AS hosts FROM host WHERE active=1 AND channel_name=:channel_name '
+                'AND id IN (SELECT DISTINCT(id_host) FROM session_host '
+                'WHERE (date_finish BETWEEN :date_start AND :date_finish))', params)[0]
             result.update(hosts)
 
-            hits = HuntingModule.database_module.exec_query(
-                'SELECT COUNT(*) AS hits FROM session_hit WHERE (date BETWEEN {} AND {}) AND session_host IN ('
-                'SELECT DISTINCT(LOWER(hostname)) FROM host WHERE active=1 AND channel_name="{}")'.format(
-                    date_start_yesterday, date_start_today, channel['name']))[0]
-            result.update(hits)
+            hostnames = HuntingModule.database_module.exec_query(
+                'SELECT DISTINCT(LOWER(hostname)) AS hostname FROM host WHERE active=1 AND channel_name=:channel_name',
+                params)
+            result.update({'hits': sum(hits_by_host.get(row['hostname'], 0) for row in hostnames)})
 
             # Add the channel name
             result.update({'channel_name': channel['name']})
@@ -662,56 +605,17 @@ class HuntingModule(SkyModule):
 
     def get_history_report(self):
         """
-        Retrieve a yesterday report by channel.
-        :return: A dict containing the report of the channel.
+        Retrieve the daily progress of every channel since the first session.
+        :return: A list with a dict for each day.
         """
-        result_total = list()
-
-        # Get the date of the first session
-        first_session = HuntingModule.database_module.exec_query('SELECT date_start from session WHERE date_start > 0 ORDER BY date_start ASC LIMIT 1')
-
-        if len(first_session) > 0:
-            format_str = '%Y%m%d%H%M%S'
-            first_date_ms = first_session[0]['date_start']
-            date_start = datetime.strptime(str(first_date_ms), format_str).date()
-            date_finish = datetime.now().date()
-
-            channels_list = HuntingModule.database_module.exec_query('SELECT name from channel')
-
-            first_date = 0
-            for dt in self.dates_between_range_from_dates(date_start, date_finish):
-                result = dict()
-
-                first_date = dt if first_date == 0 else first_date
-
-                for channel in channels_list:
-                    if channel['name'] == 'manual':
-                        continue
-                    total_finished_hosts = HuntingModule.database_module.exec_query(
-                        'SELECT COUNT(DISTINCT(id)) AS total_finished_hosts FROM host WHERE active=1 AND channel_name="{}" AND id IN (SELECT id_host FROM session_host WHERE status="OK" AND date_start > {} AND date_finish <= {})'.format(
-                            channel['name'], int(first_date.strftime("%Y%m%d000000")), int(dt.strftime("%Y%m%d235959"))))[
-                        0]
-
-                    if total_finished_hosts['total_finished_hosts'] > 0:
-                        total_hosts = HuntingModule.database_module.exec_query(
-                            'SELECT COUNT(*) AS total_hosts FROM host WHERE channel_name="{}"'.format(
-                                channel['name']))[
-                            0]
-
-                        total_hosts = total_hosts['total_hosts']
-                        progress = round(total_finished_hosts['total_finished_hosts'] / total_hosts * 100, 2)
-                    else:
-                        progress = 0
-
-                    str_key = 'hosts_channel_' + channel['name']
-                    str_value = '{} ({}%)'.format(total_finished_hosts['total_finished_hosts'], progress)
-                    result.update({str_key: str_value})
+        return HuntingReport(HuntingModule.database_module).get_history_report()
 
-                result.update({'date': dt.strftime('%Y%m%d')})
-
-                result_total.append(result)
-
-        return result_total
+    def backfill_daily_progress(self) -> int:
+        """
+        Rebuild the daily progress of the channels from the session hosts already stored.
+        :return: number of finished hosts
+        """
+        return HuntingReport(HuntingModule.database_module).backfill_daily_progress()
 
     def dates_between_range_from_dates(self, date_start, date_finish):
         for n in range(int((date_finish - date_start).days) + 1):
@@ -744,7 +648,7 @@ class HuntingModule(SkyModule):
         # Create a session for this manual hunting.
         result = HuntingModule.database_module.insert('session', data_task)
         id_session = HuntingModule.database_module.exec_query(
-            'SELECT id FROM session WHERE forest_path="{}"'.format(full_path))[0]['id']
+            'SELECT id FROM session WHERE forest_path=:forest_path', {'forest_path': full_path})[0]['id']
 
         logger.info('[EXECUTE_MANUAL_TASK] Inserted manual session with id: {}'.format(id_session))
 
@@ -752,9 +656,8 @@ class HuntingModule(SkyModule):
         for host in data['hosts_list']:
 
             host_db = HuntingModule.database_module.exec_query(
-                'SELECT * FROM host where ip="{}" and hostname="{}" and country="{}"'.format(
-                    host['ip'], host['hostname'], data['country']
-                ))
+                'SELECT * FROM host where ip=:ip and hostname=:hostname and country=:country',
+                {'ip': host['ip'], 'hostname': host['hostname'], 'country': data['country']})
 
             # Check the status of the host.
             code = 'HOST_NOT_FOUND'
@@ -770,11 +673,13 @@ class HuntingModule(SkyModule):
 
             HuntingModule.database_module.exec_query(
                 'INSERT INTO manual_hunting (id_host, hostname, ip, country, channel_name, code, id_session)'
-                'values ({},"{}","{}","{}","{}","{}",{})'.format(id_host, host['hostname'], host['ip'],
-                                                                 data['country'], channel_name, code, id_session))
+                'values (:id_host, :hostname, :ip, :country, :channel_name, :code, :id_session)',
+                {'id_host': id_host, 'hostname': host['hostname'], 'ip': host['ip'], 'country': data['country'],
+                 'channel_name': channel_name, 'code': code, 'id_session': id_session})
 
         hosts_availables = HuntingModule.database_module.exec_query(
-            'SELECT * FROM manual_hunting where id_session={} and code="{}"'.format(id_session, 'HOST_OK'))
+            'SELECT * FROM manual_hunting where id_session=:id_session and code=:code',
+            {'id_session': id_session, 'code': 'HOST_OK'})
         logger.info('[EXECUTE_MANUAL_TASK] {} hosts availables for manual hunting session with id: {}'.format(
             len(hosts_availables), id_session))
 
@@ -783,26 +688,22 @@ class HuntingModule(SkyModule):
             for host in hosts_availables:
                 new_line = "{} {}\n".format(host['hostname'], host['ip'])
                 f.write(new_line)
-                query = 'INSERT INTO session_host (id_session, id_host) VALUES (' \
-                        '(SELECT id FROM session WHERE forest_path="{}"), ' \
-                        '(SELECT id FROM host WHERE country="{}" AND ip="{}"))' \
-                    .format(full_path, host['country'], host['ip'])
-                HuntingModule.database_module.exec_query(query)
+        HuntingModule.database_module.insert_many('session_host', ({'id_session': id_session,
+                                                                    'id_host': host['id_host']}
+                                                                   for host in hosts_availables))
 
         # Save info for hosts not availables
 
         hosts_not_availables = HuntingModule.database_module.exec_query(
-            'SELECT * FROM manual_hunting where id_session={} and code="{}"'.format(id_session, 'HOST_NOT_AVAILABLE'))
+            'SELECT * FROM manual_hunting where id_session=:id_session and code=:code',
+            {'id_session': id_session, 'code': 'HOST_NOT_AVAILABLE'})
         logger.info('[EXECUTE_MANUAL_TASK] {} hosts not availables for manual hunting session with id: {}'.format(
             len(hosts_not_availables), id_session))
 
-        for host in hosts_not_availables:
-            query = 'INSERT INTO session_host (id_session, id_host, status) VALUES (' \
-                    '(SELECT id FROM session WHERE forest_path="{}"), ' \
-                    '(SELECT id FROM host WHERE country="{}" AND ip="{}"), ' \
-                    '"NOT_AVAILABLE")' \
-                .format(full_path, host['country'], host['ip'])
-            HuntingModule.database_module.exec_query(query)
+        HuntingModule.database_module.insert_many('session_host', ({'id_session': id_session,
+                                                                    'id_host': host['id_host'],
+                                                                    'status': 'NOT_AVAILABLE'}
+                                                                   for host in hosts_not_availables))
 
         # Call to EvidenceProcessor
         cmd = HuntingModule.hunting_script_path + " -path=" + folder_name + " -priority=medium"
@@ -818,7 +719,7 @@ class HuntingModule(SkyModule):
         result = {'processed_hosts': list(), 'unavailable_hosts': list(), 'inactive_hosts': list(),
                   'not_found_hosts': list()}
         session_hosts = HuntingModule.database_module.exec_query(
-            'SELECT * FROM manual_hunting where id_session={}'.format(id_session))
+            'SELECT * FROM manual_hunting where id_session=:id_session', {'id_session': id_session})
 
         for host in session_hosts:
             host_info = {'hostname': host['hostname'], 'ip': host['ip']}
@@ -846,16 +747,14 @@ class HuntingModule(SkyModule):
                 concurrence_time = int(times)
                 concurrence_type = "by_times" if concurrence_time > 0 else 'continuous'
                 result = HuntingModule.database_module.exec_query(
-                    'UPDATE channel SET concurrence_type="{}", concurrence_time="{}", scheduling="{}" WHERE name="{}"'.format(
-                        concurrence_type,
-                        concurrence_time,
-                        0,
-                        channel_name))
+                    'UPDATE channel SET concurrence_type=:concurrence_type, concurrence_time=:concurrence_time, '
+                    'scheduling=:scheduling WHERE name=:name',
+                    {'concurrence_type': concurrence_type, 'concurrence_time': concurrence_time, 'scheduling': 0,
+                     'name': channel_name})
 
                 # Execute the task
-                channel = \
-                HuntingModule.database_module.exec_query('SELECT * FROM channel WHERE name="{}"'.format(channel_name))[
-                    0]
+                channel = HuntingModule.database_module.exec_query('SELECT * FROM channel WHERE name=:name',
+                                                                   {'name': channel_name})[0]
                 self.execute_channel.launch_task(channel)
 
                 # Set the result
@@ -875,10 +774,12 @@ class HuntingModule(SkyModule):
                 try:
                     # Update the channel
                     HuntingModule.database_module.exec_query(
-                        'UPDATE channel SET scheduling="{}" WHERE name="{}"'.format(-1, channel_name))
+                        'UPDATE channel SET scheduling=:scheduling WHERE name=:name',
+                        {'scheduling': -1, 'name': channel_name})
 
-                    working_sessions = HuntingModule.database_module.exec_query('SELECT * FROM session WHERE channel_name="{}" and status="{}"'.format(
-                        channel_name, self.execute_channel.STATUS_WORKING))
+                    working_sessions = HuntingModule.database_module.exec_query(
+                        'SELECT * FROM session WHERE channel_name=:channel_name and status=:status',
+                        {'channel_name': channel_name, 'status': self.execute_channel.STATUS_WORKING})
                     if len(working_sessions) > 0:
                         for session in working_sessions:
 
@@ -906,11 +807,25 @@ class HuntingModule(SkyModule):
         CONCURRENCE_BY_DATE = "by_date"
         CONCURRENCE_BY_TIMES = "by_times"
 
+        # Statements run for every channel on each execution of the task
+        STATEMENTS = {
+            'hunting_channel_sessions': 'SELECT COUNT(*) FROM session WHERE channel_name=:channel_name',
+            'hunting_channel_last_status': 'SELECT status FROM session WHERE channel_name=:channel_name '
+                                           'ORDER BY id DESC',
+            'hunting_working_channels': 'SELECT * FROM channel WHERE name in '
+                                        '(SELECT channel_name FROM session WHERE status=:status)',
+            'hunting_channel_session': 'SELECT * FROM session WHERE channel_name=:channel_name and status=:status',
+            'hunting_session_status': 'UPDATE session SET status=:status WHERE id=:id',
+        }
+
         def __init__(self, db: DatabaseModule, ps: ParsingModule) -> None:
             TaskThread.__init__(self)
             self.db = db
             self.ps = ps
 
+            for name, query in __class__.STATEMENTS.items():
+                self.db.register_statement(name, query)
+
         def is_channel_active(self, channel) -> bool:
             """
             Check if channel is active in database
@@ -935,8 +850,8 @@ class HuntingModule(SkyModule):
                     elif channel['concurrence_type'] == __class__.CONCURRENCE_BY_TIMES:
                         # If it's executed by number of times, and it's has not been executed the max number of times,
                         # channel is active.
-                        times_executed = self.db.exec_query(
-                            'SELECT COUNT(*) FROM session WHERE channel_name="{}"'.format(channel['name']))
+                        times_executed = self.db.exec_statement('hunting_channel_sessions',
+                                                                {'channel_name': channel['name']})
                         if times_executed[0]['COUNT(*)'] < int(channel['concurrence_time']):
                             result = True
 
@@ -948,8 +863,7 @@ class HuntingModule(SkyModule):
             :return: bool
             """
 
-            row = self.db.exec_query(
-                'SELECT status FROM session WHERE channel_name="{}" ORDER BY id DESC'.format(channel_name)) # Quizás hay que cogerlas todas y ver si alguna está en working.
+            row = self.db.exec_statement('hunting_channel_last_status', {'channel_name': channel_name}) # Quizás hay que cogerlas todas y ver si alguna está en working.
             if len(row) > 0 and row[0]['status'] == __class__.STATUS_WORKING:
                 return True
             else:
@@ -969,9 +883,7 @@ class HuntingModule(SkyModule):
             Get all processing channels
             :return: list of working channels
             """
-            channels = self.db.exec_query(
-                'SELECT * FROM channel WHERE name in (SELECT channel_name FROM session WHERE status="{}")'.format(
-                    __class__.STATUS_WORKING))
+            channels = self.db.exec_statement('hunting_working_channels', {'status': __class__.STATUS_WORKING})
             return channels
 
         def update_task_channel_status(self, channel_name: str, status: str) -> None:
@@ -983,10 +895,12 @@ class HuntingModule(SkyModule):
             :return: None
             """
             result = self.db.exec_query(
-                'UPDATE session SET status="{}" WHERE channel_name="{}"'.format(status, channel_name))
+                'UPDATE session SET status=:status WHERE channel_name=:channel_name',
+                {'status': status, 'channel_name': channel_name})
 
         def get_hosts_from_channel(self, channel_name):
-            hosts = self.db.exec_query('SELECT * FROM host WHERE channel_name="{}" AND active = 1'.format(channel_name))
+            hosts = self.db.exec_query('SELECT * FROM host WHERE channel_name=:channel_name AND active = 1',
+                                       {'channel_name': channel_name})
             return hosts
 
         def get_hosts_available_from_channel(self, channel_name):
@@ -999,12 +913,10 @@ class HuntingModule(SkyModule):
 
         def get_ok_hosts(self, channel_name, failed_hosts):
             hosts = self.db.exec_query(
-                'SELECT * FROM host WHERE channel_name="{}" AND agent_available = 1 AND forest_available = 1 AND active=1'.format(
-                    channel_name))
-            result = list()
-            for host in hosts:
-                if host not in failed_hosts:
-                    result.append(host)
+                'SELECT * FROM host WHERE channel_name=:channel_name AND agent_available = 1 AND forest_available = 1 '
+                'AND active=1', {'channel_name': channel_name})
+            failed_ids = {host['id'] for host in failed_hosts}
+            result = [host for host in hosts if host['id'] not in failed_ids]
             return result
 
         def get_hosts_not_executed_from_channel(self, channel_name):
@@ -1013,31 +925,18 @@ class HuntingModule(SkyModule):
             :param channel_name: The name of the channel to get the hosts.
             :return: A list with the host not processed.
             """
-            hunting_type = HuntingModule.database_module.exec_query('SELECT hunting_type FROM channel WHERE'
-                                                                    ' name="{}"'.format(channel_name))[0]['hunting_type']
-            processed_hosts = HuntingModule.database_module.exec_query('SELECT * FROM processed_host WHERE hunting_type="{}"'
-                                                                       .format(hunting_type))
-            channel_hosts = HuntingModule.database_module.exec_query('SELECT * FROM host WHERE channel_name="{}" AND '
-                                                                     'agent_available = 1 AND forest_available = 1 AND active=1'
-                                                                     .format(channel_name))
-            not_executed = list()
-            for c_host in channel_hosts:
-                found = False
-                for p_host in processed_hosts:
-                    if c_host['id'] == p_host['id_host']:
-                        found = True
-                        break
-                if not found:
-                    not_executed.append(c_host)
-
-            not_executed = [host for host in channel_hosts if host not in processed_hosts]
+            query = 'SELECT * FROM host WHERE channel_name=:channel_name AND agent_available = 1 ' \
+                    'AND forest_available = 1 AND active=1 AND NOT EXISTS (SELECT 1 FROM processed_host ' \
+                    'WHERE processed_host.id_host=host.id ' \
+                    'AND processed_host.hunting_type=(SELECT hunting_type FROM channel WHERE name=:channel_name))'
+            not_executed = self.db.exec_query(query, {'channel_name': channel_name})
 
             return not_executed
 
         def get_hosts_not_availables_from_channel(self, channel_name):
             hosts = self.db.exec_query(
-                'SELECT * FROM host WHERE channel_name="{}" AND (agent_available = 0 OR forest_available = 0)'.format(
-                    channel_name))
+                'SELECT * FROM host WHERE channel_name=:channel_name AND (agent_available = 0 OR forest_available = 0)',
+                {'channel_name': channel_name})
             return hosts
 
         def execute_command(self, command: str, sudo=False, host='localhost', user=None, password=None, port=None):
@@ -1099,6 +998,8 @@ class HuntingModule(SkyModule):
                     'forest_path': full_path,
                     }
             result = HuntingModule.database_module.insert('session', data)
+            id_session = self.db.exec_query('SELECT id FROM session WHERE forest_path=:forest_path',
+                                            {'forest_path': full_path})[0]['id']
 
             # Get all the hosts availables and write them to a file
             if channel['force_execution'] == 0:
@@ -1110,22 +1011,14 @@ class HuntingModule(SkyModule):
                 for host in hosts_availables:
                     new_line = "{} {}\n".format(host['hostname'], host['ip'])
                     f.write(new_line)
-                    query = 'INSERT INTO session_host (id_session, id_host) VALUES (' \
-                            '(SELECT id FROM session WHERE forest_path="{}"), ' \
-                            '(SELECT id FROM host WHERE country="{}" AND ip="{}"))' \
-                        .format(full_path, host['country'], host['ip'])
-                    self.db.exec_query(query)
+            self.db.insert_many('session_host', ({'id_session': id_session, 'id_host': host['id']}
+                                                 for host in hosts_availables))
 
             # Save info for hosts not availables
             if channel['force_execution'] == 1:
                 hosts_not_availables = self.get_hosts_not_availables_from_channel(channel['name'])
-                for host in hosts_not_availables:
-                    query = 'INSERT INTO session_host (id_session, id_host, status) VALUES (' \
-                            '(SELECT id FROM session WHERE forest_path="{}"), ' \
-                            '(SELECT id FROM host WHERE country="{}" AND ip="{}"), ' \
-                            '"NOT_AVAILABLE")' \
-                        .format(full_path, host['country'], host['ip'])
-                    self.db.exec_query(query)
+                self.db.insert_many('session_host', ({'id_session': id_session, 'id_host': host['id'],
+                                                      'status': 'NOT_AVAILABLE'} for host in hosts_not_availables))
 
             # Call to EvidenceProcessor
             cmd = HuntingModule.hunting_script_path + " -path=" + folder_name + " -priority=" + channel['priority']
@@ -1145,77 +1038,143 @@ class HuntingModule(SkyModule):
 
         def add_processed_host(self, id_host, hunting_type, host_status):
             """
-            Add a processed host if it has not been inserted yet.
+            Add a processed host if it has not been inserted yet, or mark it as OK if it was processed with errors.
             :param id_host:
             :param hunting_type:
+            :param host_status:
             :return: None
             """
-            result = HuntingModule.database_module.exec_query('SELECT * FROM processed_host WHERE id_host={} and '
-                                                              'hunting_type="{}"'.format(id_host, hunting_type))
-            if len(result) == 0:
-                HuntingModule.database_module.exec_query('INSERT INTO processed_host (id_host, hunting_type, status) values '
-                                                         '({}, "{}","{}")'.format(id_host, hunting_type, host_status))
-            elif result['status'] != 'OK' and host_status == 'OK':
-                HuntingModule.database_module.exec_query('UPDATE processed_host SET status="OK" WHERE id_host={}'
-                                                         ' and hunting_type="{}"'.format(id_host, hunting_type))
+            query = 'INSERT INTO processed_host (id_host, hunting_type, status) VALUES (:id_host, :hunting_type, ' \
+                    ':status) ON CONFLICT(id_host, hunting_type) DO UPDATE SET status="OK" ' \
+                    'WHERE excluded.status="OK" AND processed_host.status!="OK"'
+            self.db.exec_query(query, {'id_host': id_host, 'hunting_type': hunting_type, 'status': host_status})
 
+        def add_processed_hosts(self, id_session):
+            """
+            Merge the hosts of the session processed OK or KO into processed_host in one statement, with the same rules
+            as add_processed_host.
+            :param id_session:
+            :return: None
+            """
+            query = 'INSERT INTO processed_host (id_host, hunting_type, status) ' \
+                    'SELECT session_host.id_host, channel.hunting_type, session_host.status ' \
+                    'FROM session_host JOIN session ON session.id=session_host.id_session ' \
+                    'JOIN channel ON channel.name=session.channel_name ' \
+                    'WHERE session_host.id_session=:id_session AND session_host.status IN ("OK", "KO") ' \
+                    'ON CONFLICT(id_host, hunting_type) DO UPDATE SET status="OK" ' \
+                    'WHERE excluded.status="OK" AND processed_host.status!="OK"'
+            self.db.exec_query(query, {'id_session': id_session})
+
+        def finish_session_hosts(self, id_session) -> int:
+            """
+            Set dates and status of every available host of a finished session from its evos, with one grouped
+            aggregate over session_evo joined to the hosts in a single UPDATE. Evos are matched to the host by hostname
+            ignoring case. A host is KO if any evo ended in a status other than OK or SKIP, and NO_EVOS, with the dates
+            of the session, if it has no evos.
+            :param id_session:
+            :return: number of hosts KO or NO_EVOS
+            """
+            query = 'UPDATE session_host SET ' \
+                    'date_start=CASE WHEN evo.total IS NULL THEN session.date_start ELSE evo.date_start END, ' \
+                    'date_finish=CASE WHEN evo.total IS NULL THEN session.date_finish ELSE evo.date_finish END, ' \
+                    'status=CASE WHEN evo.total IS NULL THEN "NO_EVOS" WHEN evo.total_ko > 0 THEN "KO" ELSE "OK" END ' \
+                    'FROM session, host LEFT JOIN (' \
+                    'SELECT LOWER(session_hostname) AS hostname, MIN(date_start) AS date_start, ' \
+                    'MAX(date_finish) AS date_finish, COUNT(*) AS total, ' \
+                    'SUM(status NOT IN ("OK", "SKIP")) AS total_ko ' \
+                    'FROM session_evo WHERE id_session=:id_session GROUP BY LOWER(session_hostname)' \
+                    ') AS evo ON evo.hostname=LOWER(host.hostname) ' \
+                    'WHERE session_host.id_session=:id_session AND session_host.status!="NOT_AVAILABLE" ' \
+                    'AND session.id=session_host.id_session AND host.id=session_host.id_host'
+            self.db.exec_query(query, {'id_session': id_session})
+
+            failed = self.db.exec_query(
+                'SELECT COUNT(*) AS total FROM session_host WHERE id_session=:id_session '
+                'AND status IN ("KO", "NO_EVOS")', {'id_session': id_session})
+            return failed[0]['total']
 
         def add_processed_evos(self, id_session):
-
-            query = 'SELECT hunting_type FROM channel WHERE name=(SELECT channel_name FROM session WHERE id={})'
-            hunting_type = HuntingModule.database_module.exec_query(query.format(id_session))[0]['hunting_type']
-
-            current_session_evos = HuntingModule.database_module.exec_query('SELECT * FROM session_evo WHERE id_session={}'
-                                                                    .format(id_session))
-            current_processed_evos = HuntingModule.database_module.exec_query('SELECT * FROM processed_evo WHERE hunting_type="{}"'
-                                                                    .format(hunting_type))
-
-            for s_evo in current_session_evos:
-
-                #if s_evo['status'] == 'OK':
-                found = False
-                evo = None
-                for p_evo in current_processed_evos:
-                    if s_evo['hostname'] == p_evo['hostname'] and s_evo['evoname'] == p_evo['evo_name']:
-                        found = True
-                        evo = p_evo
-                        break
-                if not found:
-                    query_insert = 'INSERT INTO processed_evo (hostname, evoname, hunting_type, status) values ("{}","{}","{}","{}")'
-                    HuntingModule.database_module.exec_query(query_insert.format(s_evo['session_hostname'], s_evo['evo'],
-                                                                                 hunting_type, s_evo['status']))
-                else:
-                    if evo['status'] != 'OK' and s_evo['status'] == 'OK':
-                        HuntingModule.database_module.exec_query('UPDATE processed_evo SET status="OK" WHERE'
-                                                                 ' hostname="{}" and evoname="{}" and hunting_type"{}"'.format(
-                            s_evo['session_hostname'], s_evo['evo'], hunting_type
-                        ))
-
+            """
+            Merge the evos of the session into processed_evo in one statement. Every pair hostname/evo is inserted once
+            per hunting type, and an evo already processed with errors is marked as OK when the session processed it OK.
+            :param id_session:
+            :return: None
+            """
+            query = 'INSERT INTO processed_evo (hostname, evoname, hunting_type, status) ' \
+                    'SELECT session_evo.session_hostname, session_evo.evo, channel.hunting_type, ' \
+                    'CASE WHEN SUM(session_evo.status="OK") > 0 THEN "OK" ELSE MAX(session_evo.status) END ' \
+                    'FROM session_evo JOIN session ON session.id=session_evo.id_session ' \
+                    'JOIN channel ON channel.name=session.channel_name ' \
+                    'WHERE session_evo.id_session=:id_session ' \
+                    'GROUP BY session_evo.session_hostname, session_evo.evo, channel.hunting_type ' \
+                    'ON CONFLICT(hostname, evoname, hunting_type) DO UPDATE SET status="OK" ' \
+                    'WHERE excluded.status="OK" AND processed_evo.status!="OK"'
+            self.db.exec_query(query, {'id_session': id_session})
 
         def store_historical_data(self, id_session):
             """
             Insert the information about hosts and evos from the current finished session into historical, and delete
-            them from session_host and session_evo.
+            them from session_host and session_evo, all in one transaction.
             :param id_session:
             :return: None
             """
 
-            # Insert into historical the data of the session_host.
-            query_host = 'INSERT INTO hist_session_host SELECT * FROM session_host WHERE id_session={}'.format(id_session)
-            HuntingModule.database_module.exec_query(query_host)
-            # Insert into historical the data of the session_evo.
-            query_evo = 'INSERT INTO hist_session_evo SELECT id_session,session_hostname,id_job,evo, date_start, ' \
-                        'date_finish, processing_host, status, exit_code FROM session_evo WHERE id_session={}'.format(
-                id_session
-            )
-            HuntingModule.database_module.exec_query(query_evo)
-
-            # Delete the data from the tables for current processing.
-            query_delete_host = 'DELETE FROM session_host WHERE id_session={}'.format(id_session)
-            HuntingModule.database_module.exec_query(query_delete_host)
-            query_delete_evo = 'DELETE FROM session_evo WHERE id_session={}'.format(id_session)
-            HuntingModule.database_module.exec_query(query_delete_evo)
+            params = {'id_session': id_session}
+
+            with self.db.transaction():
+                # Insert into historical the data of the session_host.
+                query_host = 'INSERT INTO hist_session_host (id_session, id_host, date_start, date_finish, status, ' \
+                             'exit_code) SELECT id_session, id_host, date_start, date_finish, status, exit_code ' \
+                             'FROM session_host WHERE id_session=:id_session'
+                self.db.exec_query(query_host, params)
+                # Insert into historical the data of the session_evo.
+                query_evo = 'INSERT INTO hist_session_evo SELECT id_session,session_hostname,id_job,evo, date_start, ' \
+                            'date_finish, processing_host, status, exit_code FROM session_evo ' \
+                            'WHERE id_session=:id_session'
+                self.db.exec_query(query_evo, params)
+
+                # Delete the data from the tables for current processing.
+                query_delete_host = 'DELETE FROM session_host WHERE id_session=:id_session'
+                self.db.exec_query(query_delete_host, params)
+                query_delete_evo = 'DELETE FROM session_evo WHERE id_session=:id_session'
+                self.db.exec_query(query_delete_evo, params)
+                query_delete_offsets = 'DELETE FROM session_file_offset WHERE id_session=:id_session'
+                self.db.exec_query(query_delete_offsets, params)
+
+        def delete_shard_offsets(self, id_session, channel_name) -> None:
+            """
+            Delete the offsets of the hits files of a session from the shard of its channel. The shard is another
+            database, so this runs only after the bookkeeping of the session is committed; the delete is idempotent
+            and a failure only leaves offsets that are never read again.
+            :param id_session:
+            :param channel_name: channel of the session
+            :return: None
+            """
+            shard = self.db.get_shard(channel_name)
+            if shard is not None:
+                shard.exec_query('DELETE FROM session_file_offset WHERE id_session=:id_session',
+                                 {'id_session': id_session})
+                self.db.invalidate_tables(['session_file_offset'])
 
+        def finish_session(self, session) -> None:
+            """
+            Save the bookkeeping of a finished session in one transaction: its status, finished or failed if any host
+            is KO or has no evos, the dates and status of its hosts, the processed hosts and evos, the daily progress
+            and the move to historical. If any step fails the session stays working and is finished again on next
+            execution. The offsets of its hits files are deleted from the shard once everything is committed.
+            :param session: dict with the session data
+            :return: None
+            """
+            with self.db.transaction():
+                status = __class__.STATUS_FINISHED
+                if self.finish_session_hosts(session['id']) > 0:
+                    status = __class__.STATUS_FAILED
+                self.db.exec_statement('hunting_session_status', {'status': status, 'id': session['id']})
+                self.add_processed_hosts(session['id'])
+                self.add_processed_evos(session['id'])
+                HuntingReport(self.db).update_daily_progress(session['id'])
+                self.store_historical_data(session['id'])
+            self.delete_shard_offsets(session['id'], session['channel_name'])
 
         def task(self) -> None:
             logger.info('Init launching tasks')
@@ -1228,9 +1187,8 @@ class HuntingModule(SkyModule):
             for channel in working_channels:
 
                 # Get the current working task for this channel.
-                session = self.db.exec_query('SELECT * FROM session WHERE channel_name="{}" and status="{}"'.format(
-                    channel['name'], __class__.STATUS_WORKING
-                ))[0]
+                session = self.db.exec_statement('hunting_channel_session', {'channel_name': channel['name'],
+                                                                             'status': __class__.STATUS_WORKING})[0]
 
                 # Execute the file parsing for the folder in path.
                 task_finished = self.load_hunting_info_from_files(session)
@@ -1246,73 +1204,10 @@ class HuntingModule(SkyModule):
                     pass
                 # Update the status of the task if it has finished.
                 elif new_status == __class__.STATUS_FINISHED:
-                    self.db.exec_query('UPDATE session SET status="{}" WHERE id="{}"'.format(
-                        new_status, session['id']
-                    ))
-
-                    # Get all the session_host processing
-                    total_hosts_processed = self.db.exec_query(
-                        'SELECT id_host FROM session_host WHERE id_session="{}" and status != "NOT_AVAILABLE"'.format(
-                            session['id']
-                        ))
-
-                    for host_processing in total_hosts_processed:
-                        hostname = self.db.exec_query('SELECT hostname FROM host WHERE id="{}"'.format(
-                            host_processing['id_host']
-                        ))[0]
-
-                        total_evos_processed = self.db.exec_query(
-                            'SELECT COUNT(*) AS total from session_evo WHERE id_session="{}" AND session_hostname LIKE "{}"'.format(
-                                session['id'], hostname['hostname']
-                            ))[0]
-
-                        if total_evos_processed['total'] > 0:
-                            host_date_start = self.db.exec_query(
-                                'SELECT date_start FROM session_evo WHERE id_session="{}" AND session_hostname LIKE "{}" ORDER BY date_start ASC LIMIT 1'.format(
-                                    session['id'], hostname['hostname']
-                                ))[0]
-                            host_date_finish = self.db.exec_query(
-                                'SELECT date_finish FROM session_evo WHERE id_session="{}" AND session_hostname LIKE "{}" ORDER BY date_finish DESC LIMIT 1'.format(
-                                    session['id'], hostname['hostname']
-                                ))[0]
-                            # Contamos que los evos KO son diferentes de OK y de SKIP
-                            host_total_status_KO = self.db.exec_query(
-                                'SELECT COUNT(status) FROM session_evo WHERE id_session="{}" AND session_hostname LIKE "{}" AND (status !="OK" OR status !="SKIP")'.format(
-                                    session['id'], hostname['hostname']
-                                ))[0]
-                            host_status = "KO" if host_total_status_KO['COUNT(status)'] > 0 else 'OK'
-
-                            #if host_status == 'OK':
-                            # Add the host to processed_host if it has not been added yet.
-                            self.add_processed_host(host_processing['id_host'], channel['hunting_type'], host_status)
-                            if host_status == 'KO':
-                                new_status = __class__.STATUS_FAILED
-
-                        else:
-                            new_status = __class__.STATUS_FAILED
-                            host_date_start = self.db.exec_query(
-                                'SELECT date_start FROM session WHERE id="{}" '.format(
-                                    session['id']
-                                ))[0]
-                            host_date_finish = self.db.exec_query(
-                                'SELECT date_finish FROM session WHERE id="{}" '.format(
-                                    session['id']
-                                ))[0]
-
-                            host_status = 'NO_EVOS'
-
-                        self.db.exec_query(
-                            'UPDATE session_host SET date_start="{}", date_finish="{}", status="{}" WHERE id_session="{}" AND id_host="{}"'.format(
-                                host_date_start['date_start'], host_date_finish['date_finish'], host_status, session['id'],
-                                host_processing['id_host']
-                            ))
-
-                        # Update the session status
-                        if new_status == __class__.STATUS_FAILED:
-                            self.db.exec_query('UPDATE session SET status="{}" WHERE id="{}"'.format(
-                                new_status, session['id']
-                            ))
-                    self.store_historical_data(session['id'])
+                    try:
+                        self.finish_session(session)
+                    except Exception:
+                        logger.error('Error finishing session {}'.format(session['id']), exc_info=True)
 
 
             # Get all channels
@@ -1328,13 +1223,20 @@ class HuntingModule(SkyModule):
             logger.info('Tasks launched')
 
         def load_hunting_info_from_files(self, task_info) -> bool:
-            new_full_path = ''
             finished = False
             connection = sqlite3.connect(HuntingModule.database_for_panda)
 
+            # Hits of the channel go to its shard, out of the lock of the main database
+            hits_db = self.db.get_shard(task_info.get('channel_name'))
+            if hits_db is not None:
+                hits_connection = sqlite3.connect(self.db.get_shard_database(task_info.get('channel_name')))
+            else:
+                hits_db = self.db
+                hits_connection = connection
+
             ps_header = HuntingModule.csv_headers.get('ps')
-            evos_header = HuntingModule.csv_headers.get('evos')
-            hits_header = HuntingModule.csv_headers.get('hits')
+            evos_columns = HuntingModule.csv_headers.get('evos').split()
+            hits_columns = HuntingModule.csv_headers.get('hits').split()
             full_path = task_info.get('forest_path')
             session_id = task_info.get('id')
             current_evos = task_info.get('current_evos')
@@ -1357,37 +1259,45 @@ class HuntingModule(SkyModule):
                                 finish_date = ps_info[2]
                                 finished = True
 
-                            query = 'UPDATE session SET total_evos={}, date_start={}, date_finish={} WHERE id={}'.format(
-                                total_evos, start_date, finish_date, session_id)
-                            self.db.exec_query(query)
+                            query = 'UPDATE session SET total_evos=:total_evos, date_start=:date_start, ' \
+                                    'date_finish=:date_finish WHERE id=:id'
+                            self.db.exec_query(query, {'total_evos': total_evos, 'date_start': start_date,
+                                                       'date_finish': finish_date, 'id': session_id})
                     elif file.startswith('evos-hunting-'):
-                        (new_full_path, new_evos) = self.preprocess_evos_file(full_path, file, skip_rows=current_evos)
-                        self.ps.load_csv_to_database(new_full_path, connection, 'session_evo', header=evos_header)
-                        os.remove(new_full_path)
-
-                        query = 'UPDATE session_evo SET id_session={} WHERE id_session=-1'.format(session_id)
-                        self.db.exec_query(query)
+                        tail = FileTailReader(self.db, session_id, full_file_path, skip_rows=current_evos)
+                        lines = ((n, line.replace('-live-', ' ')) for n, line in tail.read_lines())
+                        # Rows and checkpoint are saved in the same transaction
+                        with connection:
+                            new_evos = self.ps.load_lines_to_database(
+                                lines, connection, 'session_evo', evos_columns,
+                                errors_path=os.path.join(full_path, 'aux_evos_error.txt'),
+                                fixed_values={'id_session': session_id}, commit=False)
+                            tail.commit(connection)
+                        self.db.invalidate_tables(['session_evo', 'session_file_offset'])
 
                         total_evos = current_evos + new_evos
-                        query = 'UPDATE session SET current_evos={} WHERE id={}'.format(total_evos, session_id)
-                        self.db.exec_query(query)
-
-                        self.add_processed_evos(session_id)
-
+                        query = 'UPDATE session SET current_evos=:current_evos WHERE id=:id'
+                        self.db.exec_query(query, {'current_evos': total_evos, 'id': session_id})
 
                     elif file.startswith('hits-hunting-'):
-                        (new_full_path, new_hits) = self.preprocess_hits_file(full_path, file, skip_rows=current_hits)
-                        self.ps.load_csv_to_database(new_full_path, connection, 'session_hit', header=hits_header)
-                        os.remove(new_full_path)
+                        tail = FileTailReader(hits_db, session_id, full_file_path, skip_rows=current_hits)
+                        lines = ((n, line.replace('-live-', ' ', 1)) for n, line in tail.read_lines())
+                        with hits_connection:
+                            new_hits = self.ps.load_lines_to_database(
+                                lines, hits_connection, 'session_hit', hits_columns,
+                                errors_path=os.path.join(full_path, 'aux_hits_error.txt'), commit=False)
+                            tail.commit(hits_connection)
+                        self.db.invalidate_tables(['session_hit', 'session_file_offset'])
 
                         total_hits = current_hits + new_hits
-                        query = 'UPDATE session SET current_hits={} WHERE id={}'.format(total_hits, session_id)
-                        self.db.exec_query(query)
+                        query = 'UPDATE session SET current_hits=:current_hits WHERE id=:id'
+                        self.db.exec_query(query, {'current_hits': total_hits, 'id': session_id})
 
                     elif file.startswith('hosts_list'):
                         # Check if file is read
-                        query_evos_read = 'SELECT COUNT(*) AS total FROM session_host WHERE id_session={} AND total_evos={}'.format(
-                                session_id, -1)
+                        query_evos_read = self.db.exec_query(
+                            'SELECT COUNT(*) AS total FROM session_host WHERE id_session=:id_session '
+                            'AND total_evos=:total_evos', {'id_session': session_id, 'total_evos': -1})
                         is_read = True if query_evos_read[0]['total'] == 0 else False
 
                         if not is_read:
@@ -1400,75 +1310,26 @@ class HuntingModule(SkyModule):
                                 if len(hosts_list_info) == 3:
                                     total_evos = hosts_list_info[2]
 
-                                    query_host = 'SELECT id FROM host WHERE hostname="{}" AND ip="{}"'.format(
-                                        hostname, ip)
+                                    query_host = self.db.exec_query(
+                                        'SELECT id FROM host WHERE hostname=:hostname AND ip=:ip',
+                                        {'hostname': hostname, 'ip': ip})
                                     id_host = query_host[0]['id']
 
-                                    query = 'UPDATE session_host SET total_evos={} WHERE id_session={} AND id_host={}'.format(
-                                        total_evos, session_id, id_host)
-                                    self.db.exec_query(query)
+                                    query = 'UPDATE session_host SET total_evos=:total_evos ' \
+                                            'WHERE id_session=:id_session AND id_host=:id_host'
+                                    self.db.exec_query(query, {'total_evos': total_evos, 'id_session': session_id,
+                                                               'id_host': id_host})
 
             except Exception as e:
-                if os.path.isfile(new_full_path):
-                    os.remove(new_full_path)
+                logger.error('Error loading hunting files from {}'.format(full_path), exc_info=True)
+            finally:
+                connection.close()
+                if hits_connection is not connection:
+                    hits_connection.close()
 
             # return (loaded, errors_full_path)
             return finished
 
-        def preprocess_evos_file(self, full_path, file, sep=' ', skip_rows=0):
-            file_path = os.path.join(full_path, file)
-            new_file_path = os.path.join(full_path, 'aux_evos.txt')
-            file_errors_path = os.path.join(full_path, 'aux_evos_error.txt')
-
-            with open(file_path, 'r') as f:
-                lines = f.readlines()
-
-            content = [line.replace('-live-', sep) for line in lines[skip_rows:]]
-            content_cleaned = list()
-            content_errors = list()
-            line_number = skip_rows
-            for line in content:
-                line_number = line_number + 1
-                if len(line.split(sep)) == 8:
-                    content_cleaned.append(line)
-                else:
-                    content_errors.append('Line {}: {}'.format(line_number, line))
-
-            with open(new_file_path, 'w') as f:
-                f.writelines(content_cleaned)
-
-            with open(file_errors_path, 'a+') as f:
-                f.writelines(content_errors)
-
-            return (new_file_path, len(content_cleaned))
-
-        def preprocess_hits_file(self, full_path, file, sep=' ', skip_rows=0):
-            file_path = os.path.join(full_path, file)
-            new_file_path = os.path.join(full_path, 'aux_hits.txt')
-            file_errors_path = os.path.join(full_path, 'aux_hits_error.txt')
-
-            with open(file_path, 'r') as f:
-                lines = f.readlines()
-
-            content = [line.replace('-live-', sep, 1) for line in lines[skip_rows:]]
-            content_cleaned = list()
-            content_errors = list()
-            line_number = skip_rows
-            for line in content:
-                line_number = line_number + 1
-                if len(line.split(sep)) == 5:
-                    content_cleaned.append(line)
-                else:
-                    content_errors.append('Line {}: {}'.format(line_number, line))
-
-            with open(new_file_path, 'w') as f:
-                f.writelines(content_cleaned)
-
-            with open(file_errors_path, 'a+') as f:
-                f.writelines(content_errors)
-
-            return (new_file_path, len(content_cleaned))
-
     class AgentStatusTask(TaskThread):
 
         def __init__(self, db: DatabaseModule, scm: SystemCommandsModule) -> None:
@@ -1507,7 +1368,9 @@ class HuntingModule(SkyModule):
             logger.info('Updating agents status from file: {}'.format(second_most_recent_file))
             # Open the file, parse its content and update the corresponding host
             if second_most_recent_file is not None:
-                with open(os.path.join(HuntingModule.agent_status_folder, second_most_recent_file), 'r') as agent_file:
+                # All the hosts of the file are updated in one transaction
+                agent_file_path = os.path.join(HuntingModule.agent_status_folder, second_most_recent_file)
+                with open(agent_file_path, 'r') as agent_file, self.db.transaction():
 
                     for line in agent_file.readlines():
                         # Check if the line has a correct format.
@@ -1518,9 +1381,8 @@ class HuntingModule(SkyModule):
                             status = 0 if (parsed_line[2] == 'down') else 1
 
                             self.db.exec_query(
-                                'UPDATE host SET agent_available={} WHERE hostname like "{}" and ip="{}" COLLATE NOCASE'.format(
-                                    status, hostname, ip
-                                ))
+                                'UPDATE host SET agent_available=:status WHERE hostname like :hostname '
+                                'and ip=:ip COLLATE NOCASE', {'status': status, 'hostname': hostname, 'ip': ip})
                         else:
                             bad_lines.append(line)
             logger.info('Updating agents status finished. {} lines could not be read from report file.'.format(
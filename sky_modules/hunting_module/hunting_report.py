@@ -0,0 +1,230 @@
+from datetime import datetime, timedelta
+
+
+class HuntingReport:
+    """
+    Aggregated reports of the hunting dashboard. Every metric is computed with grouped aggregates, so the number of
+    queries does not depend on the number of channels or hosts.
+    """
+
+    def __init__(self, db) -> None:
+        """
+        :param db: database module
+        """
+        self.db = db
+
+    def get_report_total(self) -> list:
+        """
+        Retrieve the global report of all channels with one query.
+        :return: A list with a dict containing the global report.
+        """
+        today = int(datetime.now().strftime("%Y%m%d000000"))
+        query = 'SELECT COUNT(*) AS total_scope, ' \
+                'IFNULL(SUM(CASE WHEN agent_available=1 AND active=1 THEN 1 ELSE 0 END), 0) AS total_agents_up, ' \
+                'IFNULL(SUM(CASE WHEN agent_available=0 AND active=1 THEN 1 ELSE 0 END), 0) AS total_agents_down, ' \
+                'IFNULL(SUM(CASE WHEN agent_available=1 AND forest_available=1 AND active=1 THEN 1 ELSE 0 END), 0) ' \
+                'AS total_availables_hosts, ' \
+                '(SELECT COUNT(*) FROM processed_host) AS total_finished_hosts, ' \
+                'IFNULL(SUM(CASE WHEN active=1 AND id IN (SELECT id_host FROM hist_session_host) THEN 1 ELSE 0 END), 0) ' \
+                'AS total_session_hosts, ' \
+                'IFNULL(SUM(CASE WHEN active=1 AND id IN (SELECT id_host FROM session_host WHERE status="OK" ' \
+                'AND date_finish < :today) THEN 1 ELSE 0 END), 0) AS total_finished_hosts_last_day, ' \
+                '(SELECT IFNULL(MAX(date_finish), 0) FROM session) AS last_update ' \
+                'FROM host'
+        totals = self.db.exec_query(query, {'today': today})[0]
+
+        total_scope = totals['total_scope']
+        total_finished_hosts = totals['total_finished_hosts']
+        total_finished_hosts_last_day = totals['total_finished_hosts_last_day']
+
+        result = dict()
+        result.update({'total_scope': total_scope})
+        result.update({'total_agents_up': totals['total_agents_up']})
+        result.update({'total_agents_down': totals['total_agents_down']})
+        result.update({'total_availables_hosts': totals['total_availables_hosts']})
+        result.update({'total_finished_hosts': total_finished_hosts})
+        result.update({'total_failed_hosts': int(totals['total_session_hosts']) - int(total_finished_hosts)})
+        # Hits are stored in the shards of the database
+        last_hit = self.db.fan_out_aggregate('SELECT IFNULL(MAX(date), 0) AS last_hit FROM session_hit',
+                                             maxs=['last_hit'])[0]
+        result.update({'last_hit': last_hit['last_hit']})
+
+        # Calculate the current progress
+        if total_finished_hosts > 0 and total_scope > 0:
+            current_progress = float(total_finished_hosts) / float(total_scope) * 100
+            current_progress = str(round(current_progress, 2)) + "%"
+        else:
+            current_progress = "0%"
+        result.update({'current_progress': current_progress})
+
+        # Calculate the last day progress
+        if total_finished_hosts_last_day > 0 and total_scope > 0:
+            last_day_progress = float(total_finished_hosts - total_finished_hosts_last_day) / float(total_scope) * 100
+            last_day_progress = str(round(last_day_progress, 2)) + "%"
+        else:
+            last_day_progress = "0%"
+        result.update({'last_day_progress': last_day_progress})
+
+        result.update({'last_update': totals['last_update']})
+
+        return [result]
+
+    def get_report_total_by_channel(self) -> list:
+        """
+        Retrieve the report of every channel (except manual) with one query for hosts and one for sessions and evos.
+        :return: A list with a dict containing the report of each channel.
+        """
+        channels_list = self.db.exec_query('SELECT name FROM channel WHERE name != "manual"')
+
+        # A host is finished if any of its session_host rows is OK
+        query_hosts = 'SELECT host.channel_name, COUNT(*) AS total_scope, ' \
+                      'SUM(CASE WHEN host.agent_available=1 AND host.forest_available=1 AND host.active=1 ' \
+                      'THEN 1 ELSE 0 END) AS total_availables_hosts, ' \
+                      'SUM(CASE WHEN host.active=1 AND sh.finished=1 THEN 1 ELSE 0 END) AS total_finished_hosts, ' \
+                      'SUM(CASE WHEN host.active=1 AND sh.id_host IS NOT NULL THEN 1 ELSE 0 END) AS total_session_hosts, ' \
+                      'SUM(CASE WHEN host.agent_available=1 AND host.active=1 THEN 1 ELSE 0 END) AS total_agents_up, ' \
+                      'SUM(CASE WHEN host.agent_available=0 AND host.active=1 THEN 1 ELSE 0 END) AS total_agents_down ' \
+                      'FROM host LEFT JOIN (SELECT id_host, MAX(status="OK") AS finished FROM session_host ' \
+                      'GROUP BY id_host) AS sh ON sh.id_host=host.id ' \
+                      'GROUP BY host.channel_name'
+        hosts_by_channel = {row['channel_name']: row for row in self.db.exec_query(query_hosts)}
+
+        query_sessions = 'SELECT session.channel_name, ' \
+                         'COUNT(DISTINCT CASE WHEN session_evo.status="OK" THEN session_evo.evo END) ' \
+                         'AS total_finished_evos, ' \
+                         'COUNT(DISTINCT CASE WHEN session_evo.status="SKIP" THEN session_evo.evo END) ' \
+                         'AS total_evos_skipped, ' \
+                         'COUNT(DISTINCT session_evo.evo) AS total_evos, ' \
+                         'MAX(session.date_finish) AS last_update ' \
+                         'FROM session LEFT JOIN session_evo ON session_evo.id_session=session.id ' \
+                         'GROUP BY session.channel_name'
+        sessions_by_channel = {row['channel_name']: row for row in self.db.exec_query(query_sessions)}
+
+        result_total = list()
+        for channel in channels_list:
+            hosts = hosts_by_channel.get(channel['name'], dict())
+            sessions = sessions_by_channel.get(channel['name'], dict())
+            total_finished_hosts = hosts.get('total_finished_hosts', 0)
+
+            result = dict()
+            result.update({'total_scope': hosts.get('total_scope', 0)})
+            result.update({'total_availables_hosts': hosts.get('total_availables_hosts', 0)})
+            result.update({'total_finished_hosts': total_finished_hosts})
+            result.update({'total_failed_hosts': int(hosts.get('total_session_hosts', 0)) - int(total_finished_hosts)})
+            result.update({'total_finished_evos': sessions.get('total_finished_evos', 0)})
+            result.update({'total_evos_skipped': sessions.get('total_evos_skipped', 0)})
+            result.update({'total_evos': sessions.get('total_evos', 0)})
+            result.update({'total_agents_up': hosts.get('total_agents_up', 0)})
+            result.update({'total_agents_down': hosts.get('total_agents_down', 0)})
+            result.update({'last_update': sessions.get('last_update', 0)})
+
+            # Add the channel name
+            result.update({'channel_name': channel['name']})
+
+            result_total.append(result)
+
+        return result_total
+
+    def get_history_report(self) -> list:
+        """
+        Retrieve the cumulative number of finished hosts of every channel (except manual) for each day since the first
+        session, reading the daily rollup with a single range scan.
+        :return: A list with a dict for each day.
+        """
+        result_total = list()
+
+        # Get the date of the first session
+        first_session = self.db.exec_query(
+            'SELECT date_start FROM session WHERE date_start > 0 ORDER BY date_start ASC LIMIT 1')
+        if len(first_session) == 0:
+            return result_total
+
+        date_start = datetime.strptime(str(first_session[0]['date_start']), '%Y%m%d%H%M%S').date()
+        date_finish = datetime.now().date()
+
+        channels_list = self.db.exec_query('SELECT name FROM channel WHERE name != "manual"')
+        total_hosts = {row['channel_name']: row['total_hosts'] for row in self.db.exec_query(
+            'SELECT channel_name, COUNT(*) AS total_hosts FROM host GROUP BY channel_name')}
+
+        finished_by_day = dict()
+        progress_rows = self.db.exec_query(
+            'SELECT day, channel_name, finished_hosts FROM daily_channel_progress '
+            'WHERE day BETWEEN :day_start AND :day_finish',
+            {'day_start': int(date_start.strftime('%Y%m%d')), 'day_finish': int(date_finish.strftime('%Y%m%d'))})
+        for row in progress_rows:
+            finished_by_day.setdefault(row['day'], dict())[row['channel_name']] = row['finished_hosts']
+
+        total_finished_hosts = {channel['name']: 0 for channel in channels_list}
+        for n in range((date_finish - date_start).days + 1):
+            dt = date_start + timedelta(n)
+            finished_today = finished_by_day.get(int(dt.strftime('%Y%m%d')), dict())
+
+            result = dict()
+            for channel in channels_list:
+                total_finished_hosts[channel['name']] += finished_today.get(channel['name'], 0)
+                finished_hosts = total_finished_hosts[channel['name']]
+
+                if finished_hosts > 0 and total_hosts.get(channel['name'], 0) > 0:
+                    progress = round(finished_hosts / total_hosts[channel['name']] * 100, 2)
+                else:
+                    progress = 0
+
+                str_key = 'hosts_channel_' + channel['name']
+                str_value = '{} ({}%)'.format(finished_hosts, progress)
+                result.update({str_key: str_value})
+
+            result.update({'date': dt.strftime('%Y%m%d')})
+
+            result_total.append(result)
+
+        return result_total
+
+    def update_daily_progress(self, id_session: int) -> None:
+        """
+        Add the active hosts finished OK for the first time in the session to the daily progress of their channel, as
+        the history report counted only active hosts. Must be called before the session hosts are moved to historical.
+        :param id_session: id of the finished session
+        :return: None
+        """
+        query_first_finish = 'INSERT OR IGNORE INTO host_first_finish (id_host, channel_name, day) ' \
+                             'SELECT session_host.id_host, host.channel_name, MIN(session_host.date_finish / 1000000) ' \
+                             'FROM session_host JOIN host ON host.id=session_host.id_host ' \
+                             'WHERE session_host.id_session=:id_session AND session_host.status="OK" ' \
+                             'AND session_host.date_finish > 0 AND host.active=1 ' \
+                             'GROUP BY session_host.id_host, host.channel_name'
+        self.db.exec_query(query_first_finish, {'id_session': id_session})
+
+        # Only the days finished by the session are counted again
+        query_daily = 'INSERT OR REPLACE INTO daily_channel_progress (day, channel_name, finished_hosts) ' \
+                      'SELECT day, channel_name, COUNT(*) FROM host_first_finish WHERE (channel_name, day) IN (' \
+                      'SELECT host.channel_name, session_host.date_finish / 1000000 ' \
+                      'FROM session_host JOIN host ON host.id=session_host.id_host ' \
+                      'WHERE session_host.id_session=:id_session AND session_host.status="OK" ' \
+                      'AND session_host.date_finish > 0) ' \
+                      'GROUP BY day, channel_name'
+        self.db.exec_query(query_daily, {'id_session': id_session})
+
+    def backfill_daily_progress(self) -> int:
+        """
+        Rebuild the daily progress from the current and historical session hosts in one transaction. Needed once for
+        databases created before the rollup existed, it is safe to run again. As in update_daily_progress, hosts
+        without channel are ignored.
+        :return: number of finished hosts
+        """
+        with self.db.transaction():
+            self.db.exec_query('DELETE FROM host_first_finish')
+            self.db.exec_query('DELETE FROM daily_channel_progress')
+
+            query_first_finish = 'INSERT OR IGNORE INTO host_first_finish (id_host, channel_name, day) ' \
+                                 'SELECT sh.id_host, host.channel_name, MIN(sh.date_finish / 1000000) ' \
+                                 'FROM (SELECT id_host, status, date_finish FROM session_host ' \
+                                 'UNION ALL SELECT id_host, status, date_finish FROM hist_session_host) AS sh ' \
+                                 'JOIN host ON host.id=sh.id_host ' \
+                                 'WHERE sh.status="OK" AND sh.date_finish > 0 AND host.active=1 ' \
+                                 'GROUP BY sh.id_host, host.channel_name'
+            self.db.exec_query(query_first_finish)
+
+            self.db.exec_query('INSERT INTO daily_channel_progress (day, channel_name, finished_hosts) '
+                               'SELECT day, channel_name, COUNT(*) FROM host_first_finish GROUP BY day, channel_name')
+
+        return self.db.exec_query('SELECT COUNT(*) AS total FROM host_first_finish')[0]['total']
@@ -0,0 +1,97 @@
+import threading
+import uuid
+
+
+class ImportHostsJob:
+    """
+    Import of hosts from a xlsx file running in background. Keeps the counters of the import and the cancellation flag
+    checked by load_hosts_xlsx between its steps.
+    """
+
+    STATUS_QUEUED = 'queued'
+    STATUS_WORKING = 'working'
+    STATUS_NOTIFYING = 'notifying'
+    STATUS_FINISHED = 'finished'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELLED = 'cancelled'
+
+    def __init__(self, xlsx_params: dict) -> None:
+        """
+        :param xlsx_params: parameters of load_hosts_xlsx
+        """
+        self.id = uuid.uuid4().hex
+        self.xlsx_params = xlsx_params
+        self.status = __class__.STATUS_QUEUED
+        self.parsed = 0
+        self.inserted = 0
+        self.updated = 0
+        self.notify_task = None
+        self.error = None
+        self._cancelled = threading.Event()
+
+    def cancel(self) -> bool:
+        """
+        Ask the job to stop. A queued job never starts, a working job stops at the next step and pending notifications
+        are not sent.
+        :return: False if the job had already ended
+        """
+        if self.is_ended():
+            return False
+
+        self._cancelled.set()
+        if self.notify_task is not None:
+            self.notify_task.cancel()
+        if self.status == __class__.STATUS_QUEUED:
+            self.status = __class__.STATUS_CANCELLED
+        return True
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def is_ended(self) -> bool:
+        """
+        :return: True if the job finished, failed or was cancelled and its notifications are not running
+        """
+        return self.status in (__class__.STATUS_FINISHED, __class__.STATUS_FAILED, __class__.STATUS_CANCELLED) \
+            and (self.notify_task is None or not self.notify_task.is_alive())
+
+    @staticmethod
+    def evict_ended_jobs(jobs: dict, max_jobs: int) -> int:
+        """
+        Drop the oldest ended jobs while there are more than max_jobs. Running and queued jobs are always kept.
+        :param jobs: OrderedDict of jobs by id, in order of submission
+        :param max_jobs: number of jobs to keep
+        :return: number of jobs dropped
+        """
+        evicted = 0
+        for job_id, job in list(jobs.items()):
+            if len(jobs) <= max_jobs:
+                break
+            if job.is_ended():
+                jobs.pop(job_id, None)
+                evicted += 1
+        return evicted
+
+    def to_dict(self) -> dict:
+        """
+        Status and counters of the job
+        :return: dict with the job information
+        """
+        status = self.status
+        notified = 0
+        if self.notify_task is not None:
+            progress = self.notify_task.get_progress()
+            notified = progress['processed']
+            if status == __class__.STATUS_FINISHED and progress['status'] != self.notify_task.STATUS_FINISHED:
+                status = __class__.STATUS_NOTIFYING
+
+        return {
+            'id': self.id,
+            'full_path': self.xlsx_params.get('full_path'),
+            'status': status,
+            'parsed': self.parsed,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'notified': notified,
+            'error': self.error
+        }
@@ -1,7 +1,116 @@
+import logging
 import sqlite3 as sqlite
 
+from common import config
+from common.app_model import AppException
+from sky_modules.hunting_module import MODULE_NAME
+
+
+logger = config.get_log(MODULE_NAME)
+
+# The upserts (ON CONFLICT DO UPDATE) need SQLite 3.24 and the UPDATE ... FROM of the finished session hosts 3.33
+MIN_SQLITE_VERSION = (3, 33, 0)
+
+
+def add_column(table: str, column: str, definition: str):
+    """
+    Migration step that adds a column to a table created by a previous schema, CREATE TABLE IF NOT EXISTS does not
+    change the tables that already exist
+    :param table: name of the table
+    :param column: name of the new column
+    :param definition: type and default of the column
+    :return: function that runs the step over a sqlite3 connection
+    """
+    def step(connection) -> None:
+        columns = [row[1] for row in connection.execute('PRAGMA table_info({})'.format(table))]
+        if column not in columns:
+            connection.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(table, column, definition))
+
+    return step
+
+
+# Indexes of the hunting database by version, the version applied is stored in PRAGMA user_version. Released versions
+# must not change: add a new version with the statements to run over the previous one. A step is a SQL statement or a
+# function that receives the connection.
+INDEX_VERSIONS = [
+    # 1
+    [
+        # Databases created before the status of the processed rows existed
+        add_column('processed_host', 'status', 'TEXT DEFAULT ""'),
+        add_column('processed_evo', 'status', 'TEXT DEFAULT ""'),
+        # Keep one row per key before creating the unique indexes, an OK row wins over the others
+        'DELETE FROM processed_host WHERE id NOT IN (SELECT COALESCE(MIN(CASE WHEN status="OK" THEN id END), MIN(id)) '
+        'FROM processed_host GROUP BY id_host, hunting_type)',
+        'DELETE FROM processed_evo WHERE id NOT IN (SELECT COALESCE(MIN(CASE WHEN status="OK" THEN id END), MIN(id)) '
+        'FROM processed_evo GROUP BY hostname, evoname, hunting_type)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS ux_processed_host ON processed_host(id_host, hunting_type)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS ux_processed_evo ON processed_evo(hostname, evoname, hunting_type)',
+        'CREATE INDEX IF NOT EXISTS ix_host_channel_name ON host(channel_name)',
+        'CREATE INDEX IF NOT EXISTS ix_host_ip_country ON host(ip, country)',
+        'CREATE INDEX IF NOT EXISTS ix_host_hostname ON host(hostname)',
+        'CREATE INDEX IF NOT EXISTS ix_host_date_creation ON host(date_creation)',
+        'CREATE INDEX IF NOT EXISTS ix_session_status_channel_name ON session(status, channel_name)',
+        'CREATE INDEX IF NOT EXISTS ix_session_channel_name ON session(channel_name)',
+        'CREATE INDEX IF NOT EXISTS ix_session_forest_path ON session(forest_path)',
+        'CREATE INDEX IF NOT EXISTS ix_session_host_id_session ON session_host(id_session, id_host)',
+        'CREATE INDEX IF NOT EXISTS ix_session_host_id_host ON session_host(id_host)',
+        'CREATE INDEX IF NOT EXISTS ix_session_evo_id_session ON session_evo(id_session, session_hostname)',
+        'CREATE INDEX IF NOT EXISTS ix_session_hit_date ON session_hit(date)',
+        'CREATE INDEX IF NOT EXISTS ix_hist_session_host_id_host ON hist_session_host(id_host)',
+        'CREATE INDEX IF NOT EXISTS ix_host_first_finish_day ON host_first_finish(channel_name, day)',
+    ],
+    # 2
+    [
+        # Hosts are merged by ip and country, keep the first host of each pair. The rows of the merged hosts are moved
+        # to the kept host before deleting them
+        'CREATE TEMP TABLE host_merge AS SELECT host.id AS id, kept.id AS id_kept FROM host '
+        'JOIN (SELECT MIN(id) AS id, ip, country FROM host GROUP BY ip, country) AS kept '
+        'ON kept.ip=host.ip AND kept.country=host.country WHERE host.id!=kept.id',
+        'UPDATE session_host SET id_host=(SELECT id_kept FROM host_merge WHERE host_merge.id=session_host.id_host) '
+        'WHERE id_host IN (SELECT id FROM host_merge)',
+        'UPDATE hist_session_host SET id_host=(SELECT id_kept FROM host_merge '
+        'WHERE host_merge.id=hist_session_host.id_host) WHERE id_host IN (SELECT id FROM host_merge)',
+        'UPDATE manual_hunting SET id_host=(SELECT id_kept FROM host_merge WHERE host_merge.id=manual_hunting.id_host) '
+        'WHERE id_host IN (SELECT id FROM host_merge)',
+        # One processed row per kept host and hunting type, an OK row wins over the others
+        'INSERT INTO processed_host (id_host, hunting_type, status) '
+        'SELECT host_merge.id_kept, processed_host.hunting_type, '
+        'CASE WHEN MAX(processed_host.status="OK") THEN "OK" ELSE MIN(processed_host.status) END '
+        'FROM processed_host JOIN host_merge ON host_merge.id=processed_host.id_host '
+        'GROUP BY host_merge.id_kept, processed_host.hunting_type '
+        'ON CONFLICT(id_host, hunting_type) DO UPDATE SET status="OK" WHERE excluded.status="OK"',
+        'DELETE FROM processed_host WHERE id_host IN (SELECT id FROM host_merge)',
+        'INSERT INTO host_first_finish (id_host, channel_name, day) '
+        'SELECT host_merge.id_kept, host_first_finish.channel_name, MIN(host_first_finish.day) '
+        'FROM host_first_finish JOIN host_merge ON host_merge.id=host_first_finish.id_host '
+        'GROUP BY host_merge.id_kept, host_first_finish.channel_name '
+        'ON CONFLICT(id_host, channel_name) DO UPDATE SET day=MIN(day, excluded.day)',
+        'DELETE FROM host_first_finish WHERE id_host IN (SELECT id FROM host_merge)',
+        'DELETE FROM daily_channel_progress',
+        'INSERT INTO daily_channel_progress (day, channel_name, finished_hosts) '
+        'SELECT day, channel_name, COUNT(*) FROM host_first_finish GROUP BY day, channel_name',
+        'DELETE FROM host WHERE id IN (SELECT id FROM host_merge)',
+        'DROP TABLE host_merge',
+        'DROP INDEX IF EXISTS ix_host_ip_country',
+        'CREATE UNIQUE INDEX IF NOT EXISTS ux_host_ip_country ON host(ip, country)',
+    ],
+]
+
+
 class HuntingDatabase(object):
 
+    @staticmethod
+    def check_sqlite_version(version: str = None) -> None:
+        """
+        Fail on start if the SQLite library is older than the one needed by the hunting queries.
+        :param version: version of the SQLite library, by default the one linked by sqlite3
+        :return: None
+        """
+        version = version or sqlite.sqlite_version
+        if tuple(int(number) for number in version.split('.')) < MIN_SQLITE_VERSION:
+            raise AppException('SQLite {} or newer is required by the hunting module, found {}'.format(
+                '.'.join(str(number) for number in MIN_SQLITE_VERSION), version), logger, logging.CRITICAL)
+
     @staticmethod
     def create_hunting_database(database, sql_script):
 
@@ -16,8 +125,38 @@ class HuntingDatabase(object):
             cursor.executescript(script)
 
             connection.commit()
+
+            HuntingDatabase.apply_index_versions(connection)
         except Exception as e:
-            pass
+            logger.error('Error creating hunting database {}'.format(database), exc_info=True)
         finally:
             connection.close()
 
+    @staticmethod
+    def apply_index_versions(connection) -> int:
+        """
+        Apply the index versions newer than the database one. Every version runs in its own transaction together with
+        the update of user_version, so a failed version is applied again on next start.
+        :param connection: sqlite3 connection to the hunting database
+        :return: version of the database
+        """
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+
+        for statements in INDEX_VERSIONS[version:]:
+            try:
+                connection.execute('BEGIN')
+                for statement in statements:
+                    if callable(statement):
+                        statement(connection)
+                    else:
+                        connection.execute(statement)
+                connection.execute('PRAGMA user_version = {}'.format(version + 1))
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+
+            version = version + 1
+            logger.info('Hunting database indexes updated to version {}'.format(version))
+
+        return version
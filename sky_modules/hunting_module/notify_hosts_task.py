@@ -0,0 +1,173 @@
+import os
+import signal
+import subprocess
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+
+from common.infra_tools.task_thread import TaskThread
+
+
+class NotifyHostsTask(TaskThread):
+    """
+    Notify the new hosts to forest running the notification script with a pool of workers. The status of the hosts is
+    updated in batches and the notified hosts are appended to the all hosts file once at the end.
+    """
+
+    # Values of agent_available and forest_available for the last line written by the notification script
+    CODES = {
+        'HOST_NO_ACCESIBLE': (0, 0),
+        'HOST_REGISTERED': (1, 1),
+        'HOST_EXISTS_IN_CASE': (1, 1),
+        'DEFAULT': (0, 0)
+    }
+
+    STATUS_WORKING = 'working'
+    STATUS_FINISHED = 'finished'
+
+    def __init__(self, logger, db, hosts: list, script_path: str, all_host_file: str, concurrency: int = 8,
+                 timeout: int = 60, batch_size: int = 500) -> None:
+        """
+        :param logger: logger of the module
+        :param db: database module
+        :param hosts: hosts to notify, dicts with the columns of table host
+        :param script_path: notification script, called with -ip and -host
+        :param all_host_file: file with every host notified
+        :param concurrency: maximum number of scripts running at the same time
+        :param timeout: seconds to wait for the script of a host
+        :param batch_size: number of finished hosts between status updates in database
+        """
+        TaskThread.__init__(self)
+        self.logger = logger
+        self.db = db
+        self.hosts = hosts
+        self.script_path = script_path
+        self.all_host_file = all_host_file
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.batch_size = batch_size
+
+        self._cancelled = threading.Event()
+        self._progress_lock = threading.Lock()
+        self.progress = {
+            'status': __class__.STATUS_WORKING,
+            'total': len(hosts),
+            'processed': 0,
+            'registered': 0,
+            'failed': 0,
+            'timeouts': 0,
+            'cancelled': 0
+        }
+
+    def cancel(self) -> None:
+        """
+        Do not run the scripts of the hosts still pending, the running ones are waited
+        :return: None
+        """
+        self._cancelled.set()
+
+    def get_progress(self) -> dict:
+        """
+        Get a copy of the notification progress
+        :return: dict with status and counters
+        """
+        with self._progress_lock:
+            return dict(self.progress)
+
+    def notify_host(self, host: dict) -> str:
+        """
+        Run the notification script for a host
+        :param host: host to notify
+        :return: code written by the script in its last line, None if the script did not finish in time
+        """
+        if self._cancelled.is_set():
+            raise CancelledError()
+
+        cmd = self.script_path + " -ip=" + host['ip'] + " -host=" + host['hostname']
+
+        # New session to kill the script with its children if it does not finish in time
+        p = subprocess.Popen("exec " + cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             stdin=subprocess.PIPE, start_new_session=True)
+        try:
+            out, err = p.communicate(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(p.pid, signal.SIGKILL)
+            p.communicate()
+            self.logger.warning('[NOTIFY_HOSTS_TASK] Timeout notifying host {}'.format(host['ip']))
+            return None
+
+        lines = out.decode('utf-8', errors='replace').split('\n')
+        return lines[-2] if len(lines) > 1 else ''
+
+    def update_hosts_status(self, ids_by_code: dict) -> None:
+        """
+        Update agent_available and forest_available of the hosts with one batch of the same statement
+        :param ids_by_code: ids of hosts by pair (agent_available, forest_available)
+        :return: None
+        """
+        rows = [{'agent_available': agent_available, 'forest_available': forest_available, 'id': id_host}
+                for (agent_available, forest_available), ids in ids_by_code.items() for id_host in ids]
+        self.db.exec_many('UPDATE host SET agent_available=:agent_available, forest_available=:forest_available '
+                          'WHERE id=:id', rows)
+
+    def task(self):
+        self.logger.info('[NOTIFY_HOSTS_TASK] Notifying {} hosts'.format(len(self.hosts)))
+
+        try:
+            self.notify_hosts()
+        except Exception:
+            self.logger.error('[NOTIFY_HOSTS_TASK] Error notifying hosts', exc_info=True)
+        finally:
+            with self._progress_lock:
+                self.progress['status'] = __class__.STATUS_FINISHED
+
+        self.logger.info('[NOTIFY_HOSTS_TASK] Notified {} hosts'.format(len(self.hosts)))
+
+    def notify_hosts(self) -> None:
+        """
+        Notify all the hosts with the pool of workers, saving the status of the hosts every batch_size hosts
+        :return: None
+        """
+        ids_by_code = dict()
+        notified_hosts = list()
+        pending = 0
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {executor.submit(self.notify_host, host): host for host in self.hosts}
+
+            for future in as_completed(futures):
+                host = futures[future]
+                try:
+                    code_output = future.result()
+                except CancelledError:
+                    with self._progress_lock:
+                        self.progress['cancelled'] += 1
+                    continue
+                except Exception:
+                    self.logger.error('[NOTIFY_HOSTS_TASK] Error notifying host {}'.format(host['ip']), exc_info=True)
+                    code_output = ''
+
+                notified_hosts.append(host)
+                code = __class__.CODES.get(code_output, __class__.CODES['DEFAULT'])
+                ids_by_code.setdefault(code, list()).append(host['id'])
+                pending = pending + 1
+
+                with self._progress_lock:
+                    self.progress['processed'] += 1
+                    if code_output is None:
+                        self.progress['timeouts'] += 1
+                    if code == (1, 1):
+                        self.progress['registered'] += 1
+                    else:
+                        self.progress['failed'] += 1
+
+                if pending >= self.batch_size:
+                    self.update_hosts_status(ids_by_code)
+                    ids_by_code = dict()
+                    pending = 0
+
+        self.update_hosts_status(ids_by_code)
+
+        lines = ['{},{},{},{},{}\n'.format(host['hostname'], host['ip'], host['operating_system'], host['channel_name'],
+                                            host['managed_by']) for host in notified_hosts]
+        with open(self.all_host_file, 'a') as all_host_file:
+            all_host_file.writelines(lines)
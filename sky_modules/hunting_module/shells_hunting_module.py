@@ -8,7 +8,6 @@ logger = config.get_log(MODULE_NAME)
 
 
 class HuntingModuleShell:
-    pass
 
 # All commands must start with "shell_" to be published
 # Arguments of commands are tuple of tuple: ((arg1, arg2, arg3))
@@ -16,22 +15,19 @@ class HuntingModuleShell:
 # Help methods must star with "help_" and command name
 # Category are defined in category method
 
-    # def category_test_module_shell(self) -> dict:
-    #     # Dictionary with commands and category text
-    #     return {
-    #         'test1': sky_modules.module_shell_summary.CAT_TEST,
-    #         'test2': sky_modules.module_shell_summary.CAT_TEST
-    #     }
-    #
-    # def shell_test1(self, args: tuple):
-    #     # arg1, arg2, connection_mode = get_args_from_shell(args)
-    #     # logger.info('test_module test1 arg1: {} arg2: {}'.format(arg1, arg2))
-    #     return 'test1'
-    #
-    # def help_test1(self, args):
-    #     return 'This is a help for test1 command'
-    #
-    # def shell_test2(self, args: tuple):
-    #     arg1, arg2, connection_mode = get_args_from_shell(args)
-    #     logger.info('test_module test2 arg1: {} arg2: {}'.format(arg1, arg2))
-    #     return 'test2'
+    def category_hunting_module_shell(self) -> dict:
+        # Dictionary with commands and category text
+        return {
+            'backfill_daily_progress': sky_modules.module_shell_summary.CAT_HUNTING,
+        }
+
+    def shell_backfill_daily_progress(self, args: tuple):
+        # Shells are loaded while common.module is being imported, so the module manager is imported here
+        from common import module_manager
+
+        total = module_manager.get_module(MODULE_NAME).backfill_daily_progress()
+        logger.info('Daily progress rebuilt with {} finished hosts'.format(total))
+        return 'Daily progress rebuilt with {} finished hosts'.format(total)
+
+    def help_backfill_daily_progress(self, args):
+        return 'Rebuild the daily progress of the channels from current and historical session hosts'
@@ -1,8 +1,28 @@
+import contextlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
 import time
-from nose.tools import assert_equal, assert_true, assert_is_not_none
+from collections import OrderedDict
+from nose.tools import assert_equal, assert_true, assert_is_not_none, assert_raises
 
 from common import config
+from common.app_model import AppException
 from sky_modules.hunting_module.hunting_module import HuntingModule
+from sky_modules.hunting_module.file_tail_reader import FileTailReader
+from sky_modules.hunting_module.hunting_report import HuntingReport
+from sky_modules.hunting_module.load_hunting_database import HuntingDatabase, INDEX_VERSIONS
+from sky_modules.hunting_module.notify_hosts_task import NotifyHostsTask
+from sky_modules.hunting_module.import_hosts_job import ImportHostsJob
+from sky_modules.hunting_module.hosts_loader import HostsLoader
+from sky_modules.hunting_module.views_hunting_module import iter_json_list
+
+
+SQL_SCRIPT = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'etc', 'database.sql')
+# Schema of the databases created before the index versions
+SQL_SCRIPT_V0 = os.path.join(os.path.dirname(__file__), 'files', 'database_v0.sql')
 
 
 class TestHuntingModule(object):
@@ -48,3 +68,565 @@ class TestHuntingModule(object):
         channel1 = 'channel1'
         channel2 = 'channel2'
         self.module.update_machines_channel(channel1, channel2)
+
+
+class SqliteDatabase(object):
+    """
+    Minimal database with the query interface of DatabaseModule over a sqlite3 connection
+    """
+
+    def __init__(self, sql_script):
+        self.statements = dict()
+        self.connection = sqlite3.connect(':memory:', isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        with open(sql_script) as f:
+            self.connection.executescript(f.read())
+        HuntingDatabase.apply_index_versions(self.connection)
+
+    def exec_query(self, query, params=None):
+        cursor = self.connection.execute(query, params if params is not None else dict())
+        return [dict(row) for row in cursor.fetchall()]
+
+    def exec_many(self, query, rows):
+        self.connection.executemany(query, rows)
+        return len(rows)
+
+    def register_statement(self, name, query):
+        self.statements[name] = query
+
+    def exec_statement(self, name, params=None):
+        return self.exec_query(self.statements[name], params)
+
+    def get_shard(self, key):
+        return None
+
+    def invalidate_tables(self, tables):
+        pass
+
+    def fan_out(self, query, params=None, **kwargs):
+        return self.exec_query(query, params)
+
+    def fan_out_aggregate(self, query, params=None, **kwargs):
+        return self.exec_query(query, params)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        if self.connection.in_transaction:
+            yield
+            return
+
+        self.connection.execute('BEGIN')
+        try:
+            yield
+            self.connection.execute('COMMIT')
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+
+
+class TestFileTailReader(object):
+
+    def setup(self):
+        self.db = SqliteDatabase(SQL_SCRIPT)
+        self.folder = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.folder, 'evos-hunting-test')
+
+    def teardown(self):
+        shutil.rmtree(self.folder)
+
+    def test_1_read_only_new_lines(self):
+        with open(self.file_path, 'w') as f:
+            f.write('line1\nline2\n')
+
+        tail = FileTailReader(self.db, 1, self.file_path)
+        assert_equal(list(tail.read_lines()), [(1, 'line1'), (2, 'line2')])
+        tail.commit()
+
+        with open(self.file_path, 'a') as f:
+            f.write('line3\n')
+
+        tail = FileTailReader(self.db, 1, self.file_path)
+        assert_equal(list(tail.read_lines()), [(3, 'line3')])
+
+    def test_2_partial_line(self):
+        with open(self.file_path, 'w') as f:
+            f.write('line1\nline')
+
+        tail = FileTailReader(self.db, 1, self.file_path)
+        assert_equal(list(tail.read_lines()), [(1, 'line1')])
+        tail.commit()
+
+        with open(self.file_path, 'a') as f:
+            f.write('2\n')
+
+        tail = FileTailReader(self.db, 1, self.file_path)
+        assert_equal(list(tail.read_lines()), [(2, 'line2')])
+
+    def test_3_skip_rows_without_checkpoint(self):
+        with open(self.file_path, 'w') as f:
+            f.write('line1\nline2\nline3\n')
+
+        tail = FileTailReader(self.db, 1, self.file_path, skip_rows=2)
+        assert_equal(list(tail.read_lines()), [(3, 'line3')])
+
+
+class TestExecuteChannelTask(object):
+
+    def setup(self):
+        self.db = SqliteDatabase(SQL_SCRIPT)
+        self.task = HuntingModule.ExecuteChannelTask(self.db, None)
+        self.db.exec_query('INSERT INTO channel (name, hunting_type) VALUES ("channel1", "yara")')
+        self.db.exec_query('INSERT INTO session (id, channel_name) VALUES (1, "channel1")')
+
+    def test_1_add_processed_evos(self):
+        self.db.exec_query('INSERT INTO processed_evo (hostname, evoname, hunting_type, status) VALUES '
+                           '("host1", "evo1", "yara", "KO")')
+        self.db.exec_query('INSERT INTO session_evo (id_session, session_hostname, evo, processing_host, status) VALUES '
+                           '(1, "host1", "evo1", "forest", "OK"), (1, "host1", "evo2", "forest", "KO"), '
+                           '(1, "host1", "evo2", "forest", "OK"), (1, "host2", "evo1", "forest", "KO")')
+
+        self.task.add_processed_evos(1)
+        self.task.add_processed_evos(1)
+
+        rows = self.db.exec_query('SELECT hostname, evoname, status FROM processed_evo ORDER BY hostname, evoname')
+        assert_equal(rows, [{'hostname': 'host1', 'evoname': 'evo1', 'status': 'OK'},
+                            {'hostname': 'host1', 'evoname': 'evo2', 'status': 'OK'},
+                            {'hostname': 'host2', 'evoname': 'evo1', 'status': 'KO'}])
+
+    def test_2_get_hosts_not_executed_from_channel(self):
+        self.db.exec_query('INSERT INTO host (id, hostname, ip, channel_name, agent_available, forest_available) VALUES '
+                           '(1, "host1", "10.0.0.1", "channel1", 1, 1), (2, "host2", "10.0.0.2", "channel1", 1, 1), '
+                           '(3, "host3", "10.0.0.3", "channel1", 0, 1)')
+        self.task.add_processed_host(1, 'yara', 'KO')
+        self.task.add_processed_host(1, 'yara', 'OK')
+        self.task.add_processed_host(2, 'other', 'OK')
+
+        hosts = self.task.get_hosts_not_executed_from_channel('channel1')
+        assert_equal([host['id'] for host in hosts], [2])
+
+        rows = self.db.exec_query('SELECT id_host, hunting_type, status FROM processed_host ORDER BY id_host')
+        assert_equal(rows, [{'id_host': 1, 'hunting_type': 'yara', 'status': 'OK'},
+                            {'id_host': 2, 'hunting_type': 'other', 'status': 'OK'}])
+
+    def test_3_finish_session_hosts(self):
+        self.db.exec_query('UPDATE session SET date_start=100, date_finish=900 WHERE id=1')
+        self.db.exec_query('INSERT INTO host (id, hostname, ip) VALUES (1, "host1", "10.0.0.1"), '
+                           '(2, "host2", "10.0.0.2"), (3, "host3", "10.0.0.3"), (4, "host4", "10.0.0.4")')
+        self.db.exec_query('INSERT INTO session_host (id_session, id_host, status) VALUES '
+                           '(1, 1, ""), (1, 2, ""), (1, 3, ""), (1, 4, "NOT_AVAILABLE")')
+        self.db.exec_query('INSERT INTO session_evo (id_session, session_hostname, evo, date_start, date_finish, '
+                           'processing_host, status) VALUES '
+                           '(1, "HOST1", "evo1", 200, 300, "forest", "OK"), (1, "host1", "evo2", 150, 250, "forest", "SKIP"), '
+                           '(1, "host2", "evo1", 400, 500, "forest", "OK"), (1, "host2", "evo2", 450, 600, "forest", "KO")')
+
+        assert_equal(self.task.finish_session_hosts(1), 2)
+        self.task.add_processed_hosts(1)
+
+        rows = self.db.exec_query('SELECT id_host, date_start, date_finish, status FROM session_host ORDER BY id_host')
+        assert_equal(rows, [{'id_host': 1, 'date_start': 150, 'date_finish': 300, 'status': 'OK'},
+                            {'id_host': 2, 'date_start': 400, 'date_finish': 600, 'status': 'KO'},
+                            {'id_host': 3, 'date_start': 100, 'date_finish': 900, 'status': 'NO_EVOS'},
+                            {'id_host': 4, 'date_start': 0, 'date_finish': 0, 'status': 'NOT_AVAILABLE'}])
+
+        rows = self.db.exec_query('SELECT id_host, hunting_type, status FROM processed_host ORDER BY id_host')
+        assert_equal(rows, [{'id_host': 1, 'hunting_type': 'yara', 'status': 'OK'},
+                            {'id_host': 2, 'hunting_type': 'yara', 'status': 'KO'}])
+
+    def test_4_store_historical_data(self):
+        self.db.exec_query('INSERT INTO session_host (id_session, id_host, date_finish, status) VALUES '
+                           '(1, 1, 500, "OK"), (1, 2, 600, "KO"), (2, 3, 700, "OK")')
+        self.db.exec_query('INSERT INTO session_evo (id_session, session_hostname, evo, processing_host, status) VALUES '
+                           '(1, "host1", "evo1", "forest", "OK")')
+
+        self.task.store_historical_data(1)
+
+        rows = self.db.exec_query('SELECT id_session, id_host, date_finish, status FROM hist_session_host '
+                                  'ORDER BY id_host')
+        assert_equal(rows, [{'id_session': 1, 'id_host': 1, 'date_finish': 500, 'status': 'OK'},
+                            {'id_session': 1, 'id_host': 2, 'date_finish': 600, 'status': 'KO'}])
+        assert_equal(self.db.exec_query('SELECT COUNT(*) AS total FROM hist_session_evo')[0]['total'], 1)
+        assert_equal(self.db.exec_query('SELECT id_session FROM session_host'), [{'id_session': 2}])
+        assert_equal(self.db.exec_query('SELECT COUNT(*) AS total FROM session_evo')[0]['total'], 0)
+
+    def test_5_finish_session(self):
+        self.db.exec_query('INSERT INTO host (id, hostname, ip) VALUES (1, "host1", "10.0.0.1")')
+        self.db.exec_query('INSERT INTO session_host (id_session, id_host) VALUES (1, 1)')
+        self.db.exec_query('INSERT INTO session_evo (id_session, session_hostname, evo, processing_host, status) VALUES '
+                           '(1, "host1", "evo1", "forest", "OK")')
+        session = self.db.exec_query('SELECT * FROM session WHERE id=1')[0]
+        # The offsets are deleted from the shard only after the bookkeeping is committed
+        deleted = []
+
+        class Shard(object):
+            def exec_query(shard, query, params=None):
+                deleted.append(self.db.connection.in_transaction)
+
+        self.db.get_shard = lambda key: Shard()
+
+        # A failed step rolls back the status too, the session is finished again on next execution
+        def fail(id_session):
+            raise sqlite3.OperationalError('disk I/O error')
+
+        self.task.add_processed_hosts = fail
+        assert_raises(sqlite3.OperationalError, self.task.finish_session, session)
+        assert_equal(self.db.exec_query('SELECT status FROM session'), [{'status': 'working'}])
+        assert_equal(self.db.exec_query('SELECT COUNT(*) AS total FROM session_host')[0]['total'], 1)
+        assert_equal(deleted, [])
+
+        del self.task.add_processed_hosts
+        self.task.finish_session(session)
+        assert_equal(self.db.exec_query('SELECT status FROM session'), [{'status': 'finished'}])
+        assert_equal(self.db.exec_query('SELECT status FROM hist_session_host'), [{'status': 'OK'}])
+        assert_equal(self.db.exec_query('SELECT hostname, evoname, status FROM processed_evo'),
+                     [{'hostname': 'host1', 'evoname': 'evo1', 'status': 'OK'}])
+        assert_equal(deleted, [False])
+
+
+class TestHuntingReport(object):
+
+    def setup(self):
+        self.db = SqliteDatabase(SQL_SCRIPT)
+        self.report = HuntingReport(self.db)
+        self.db.exec_query('INSERT INTO channel (name) VALUES ("channel1"), ("channel2"), ("manual")')
+        self.db.exec_query('INSERT INTO host (id, hostname, ip, channel_name, agent_available, forest_available) VALUES '
+                           '(1, "host1", "10.0.0.1", "channel1", 1, 1), (2, "host2", "10.0.0.2", "channel1", 1, 1), '
+                           '(3, "host3", "10.0.0.3", "channel1", 0, 1)')
+        self.db.exec_query('INSERT INTO session (id, channel_name, date_finish) VALUES (1, "channel1", 20190101000000), '
+                           '(2, "channel1", 20190102000000)')
+        self.db.exec_query('INSERT INTO session_host (id_session, id_host, status) VALUES (1, 1, "KO"), (2, 1, "OK"), '
+                           '(2, 2, "KO")')
+        self.db.exec_query('INSERT INTO session_evo (id_session, session_hostname, evo, processing_host, status) VALUES '
+                           '(1, "host1", "evo1", "forest", "KO"), (2, "host1", "evo1", "forest", "OK"), '
+                           '(2, "host2", "evo2", "forest", "SKIP")')
+
+    def test_1_report_total_by_channel(self):
+        result = self.report.get_report_total_by_channel()
+
+        assert_equal([channel['channel_name'] for channel in result], ['channel1', 'channel2'])
+        assert_equal(result[0], {'total_scope': 3, 'total_availables_hosts': 2, 'total_finished_hosts': 1,
+                                 'total_failed_hosts': 1, 'total_finished_evos': 1, 'total_evos_skipped': 1,
+                                 'total_evos': 2, 'total_agents_up': 2, 'total_agents_down': 1,
+                                 'last_update': 20190102000000, 'channel_name': 'channel1'})
+        assert_equal(result[1]['total_scope'], 0)
+        assert_equal(result[1]['last_update'], 0)
+
+    def test_2_report_total(self):
+        self.db.exec_query('INSERT INTO processed_host (id_host, hunting_type, status) VALUES (1, "yara", "OK")')
+
+        result = self.report.get_report_total()
+
+        assert_equal(len(result), 1)
+        assert_equal(result[0]['total_scope'], 3)
+        assert_equal(result[0]['total_finished_hosts'], 1)
+        assert_equal(result[0]['current_progress'], '33.33%')
+        assert_equal(result[0]['last_hit'], 0)
+        assert_equal(result[0]['last_update'], 20190102000000)
+
+    def test_3_history_report_from_daily_progress(self):
+        self.db.exec_query('UPDATE session_host SET date_finish=20190102103000')
+        self.report.update_daily_progress(1)
+        self.report.update_daily_progress(2)
+
+        self.db.exec_query('INSERT INTO session_host (id_session, id_host, status, date_finish) VALUES '
+                           '(3, 1, "OK", 20190103103000), (3, 2, "OK", 20190103103000)')
+        self.report.update_daily_progress(3)
+
+        rows = self.db.exec_query('SELECT day, channel_name, finished_hosts FROM daily_channel_progress ORDER BY day')
+        assert_equal(rows, [{'day': 20190102, 'channel_name': 'channel1', 'finished_hosts': 1},
+                            {'day': 20190103, 'channel_name': 'channel1', 'finished_hosts': 1}])
+
+        self.db.exec_query('UPDATE session SET date_start=20190101000000')
+        result = self.report.get_history_report()
+        assert_equal(result[0], {'hosts_channel_channel1': '0 (0%)', 'hosts_channel_channel2': '0 (0%)',
+                                 'date': '20190101'})
+        assert_equal(result[1]['hosts_channel_channel1'], '1 (33.33%)')
+        assert_equal(result[2]['hosts_channel_channel1'], '2 (66.67%)')
+        assert_equal(result[-1]['hosts_channel_channel1'], '2 (66.67%)')
+
+    def test_4_backfill_daily_progress(self):
+        self.db.exec_query('UPDATE session_host SET date_finish=20190102103000')
+        self.db.exec_query('INSERT INTO hist_session_host (id_session, id_host, status, date_finish) VALUES '
+                           '(3, 1, "OK", 20190101103000), (3, 2, "OK", 20190103103000), (3, 3, "OK", 20190103103000)')
+        # As in the history report, inactive hosts are not counted
+        self.db.exec_query('UPDATE host SET active=0 WHERE id=3')
+        # Hosts without channel are ignored and do not abort the rebuild
+        self.db.exec_query('INSERT INTO host (id, hostname, ip, channel_name) VALUES (4, "host4", "10.0.0.4", NULL)')
+        self.db.exec_query('INSERT INTO hist_session_host (id_session, id_host, status, date_finish) VALUES '
+                           '(3, 4, "OK", 20190103103000)')
+
+        assert_equal(self.report.backfill_daily_progress(), 2)
+        assert_equal(self.report.backfill_daily_progress(), 2)
+
+        rows = self.db.exec_query('SELECT day, channel_name, finished_hosts FROM daily_channel_progress ORDER BY day')
+        assert_equal(rows, [{'day': 20190101, 'channel_name': 'channel1', 'finished_hosts': 1},
+                            {'day': 20190103, 'channel_name': 'channel1', 'finished_hosts': 1}])
+
+
+class TestHuntingDatabase(object):
+
+    def setup(self):
+        self.folder = tempfile.mkdtemp()
+        self.database = os.path.join(self.folder, 'hunting.db')
+
+    def teardown(self):
+        shutil.rmtree(self.folder)
+
+    def create_v0_database(self, *statements):
+        connection = sqlite3.connect(self.database)
+        with open(SQL_SCRIPT_V0) as f:
+            connection.executescript(f.read())
+        for statement in statements:
+            connection.execute(statement)
+        connection.commit()
+        connection.close()
+
+    def test_1_index_versions(self):
+        HuntingDatabase.create_hunting_database(self.database, SQL_SCRIPT)
+        HuntingDatabase.create_hunting_database(self.database, SQL_SCRIPT)
+
+        connection = sqlite3.connect(self.database)
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        plan = connection.execute('EXPLAIN QUERY PLAN SELECT * FROM session_evo WHERE id_session=1').fetchall()
+        connection.close()
+
+        assert_equal(version, len(INDEX_VERSIONS))
+        assert_true('ix_session_evo_id_session' in plan[0][-1])
+
+    def test_2_upgrade_status_columns(self):
+        self.create_v0_database('INSERT INTO processed_host (id_host, hunting_type) VALUES (1, "yara")',
+                                'INSERT INTO processed_evo (hostname, evoname, hunting_type) '
+                                'VALUES ("host1", "evo1", "yara")')
+
+        HuntingDatabase.create_hunting_database(self.database, SQL_SCRIPT)
+
+        connection = sqlite3.connect(self.database)
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        connection.execute('INSERT INTO processed_host (id_host, hunting_type, status) VALUES (1, "yara", "OK") '
+                           'ON CONFLICT(id_host, hunting_type) DO UPDATE SET status=excluded.status')
+        connection.execute('INSERT INTO processed_evo (hostname, evoname, hunting_type, status) '
+                           'VALUES ("host1", "evo1", "yara", "OK") '
+                           'ON CONFLICT(hostname, evoname, hunting_type) DO UPDATE SET status=excluded.status')
+        processed_host = connection.execute('SELECT id_host, hunting_type, status FROM processed_host').fetchall()
+        processed_evo = connection.execute('SELECT hostname, evoname, hunting_type, status '
+                                           'FROM processed_evo').fetchall()
+        connection.close()
+
+        assert_equal(version, len(INDEX_VERSIONS))
+        assert_equal(processed_host, [(1, 'yara', 'OK')])
+        assert_equal(processed_evo, [('host1', 'evo1', 'yara', 'OK')])
+
+    def test_3_upgrade_duplicated_rows(self):
+        self.create_v0_database('INSERT INTO host (id, ip, country) VALUES (1, "10.0.0.1", "es"), '
+                                '(2, "10.0.0.1", "es"), (3, "10.0.0.1", "fr")',
+                                'INSERT INTO processed_host (id, id_host, hunting_type) VALUES (1, 1, "yara"), '
+                                '(2, 1, "yara"), (3, 3, "yara"), (4, 2, "yara"), (5, 2, "sigma")',
+                                'INSERT INTO session_host (id_session, id_host) VALUES (1, 1), (1, 2), (1, 3)',
+                                'INSERT INTO hist_session_host (id_session, id_host) VALUES (2, 2)',
+                                'INSERT INTO processed_evo (id, hostname, evoname, hunting_type) VALUES '
+                                '(1, "host1", "evo1", "yara"), (2, "host1", "evo1", "yara")')
+
+        HuntingDatabase.create_hunting_database(self.database, SQL_SCRIPT)
+
+        connection = sqlite3.connect(self.database)
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        indexes = {row[0] for row in connection.execute('SELECT name FROM sqlite_master WHERE type="index"')}
+        hosts = connection.execute('SELECT id FROM host ORDER BY id').fetchall()
+        processed_host = connection.execute('SELECT id_host, hunting_type FROM processed_host '
+                                            'ORDER BY id_host, hunting_type').fetchall()
+        session_host = connection.execute('SELECT id_host FROM session_host ORDER BY id_host').fetchall()
+        hist_session_host = connection.execute('SELECT id_host FROM hist_session_host').fetchall()
+        processed_evo = connection.execute('SELECT id FROM processed_evo ORDER BY id').fetchall()
+        connection.close()
+
+        assert_equal(version, len(INDEX_VERSIONS))
+        assert_true({'ux_processed_host', 'ux_processed_evo', 'ux_host_ip_country', 'ix_host_channel_name',
+                     'ix_session_evo_id_session', 'ix_host_first_finish_day'} <= indexes)
+        assert_true('ix_host_ip_country' not in indexes)
+        assert_equal(hosts, [(1,), (3,)])
+        # The rows of the merged host 2 belong to host 1
+        assert_equal(processed_host, [(1, 'sigma'), (1, 'yara'), (3, 'yara')])
+        assert_equal(session_host, [(1,), (1,), (3,)])
+        assert_equal(hist_session_host, [(1,)])
+        assert_equal(processed_evo, [(1,)])
+
+    def test_4_check_sqlite_version(self):
+        HuntingDatabase.check_sqlite_version()
+        HuntingDatabase.check_sqlite_version('3.33.0')
+        assert_raises(AppException, HuntingDatabase.check_sqlite_version, '3.32.3')
+        assert_raises(AppException, HuntingDatabase.check_sqlite_version, '3.24.0')
+
+
+class TestNotifyHostsTask(object):
+
+    def setup(self):
+        self.db = SqliteDatabase(SQL_SCRIPT)
+        self.folder = tempfile.mkdtemp()
+        self.all_host_file = os.path.join(self.folder, 'host_ip.txt')
+        self.script_path = os.path.join(self.folder, 'notify.sh')
+        with open(self.script_path, 'w') as f:
+            f.write('#!/bin/sh\n'
+                    'case "$1" in\n'
+                    '  -ip=10.0.0.1) echo HOST_REGISTERED ;;\n'
+                    '  -ip=10.0.0.2) echo HOST_NO_ACCESIBLE ;;\n'
+                    '  *) sleep 5 ;;\n'
+                    'esac\n')
+        os.chmod(self.script_path, 0o755)
+
+    def teardown(self):
+        shutil.rmtree(self.folder)
+
+    def test_1_notify_hosts(self):
+        self.db.exec_query('INSERT INTO host (id, hostname, ip) VALUES (1, "host1", "10.0.0.1"), '
+                           '(2, "host2", "10.0.0.2"), (3, "host3", "10.0.0.3")')
+        hosts = self.db.exec_query('SELECT * FROM host')
+
+        task = NotifyHostsTask(config.get_log('hunting_module'), self.db, hosts, self.script_path, self.all_host_file,
+                               concurrency=3, timeout=1, batch_size=2)
+        task.task()
+
+        assert_equal(task.get_progress(), {'status': 'finished', 'total': 3, 'processed': 3, 'registered': 1,
+                                           'failed': 2, 'timeouts': 1, 'cancelled': 0})
+        rows = self.db.exec_query('SELECT id, agent_available, forest_available FROM host ORDER BY id')
+        assert_equal(rows, [{'id': 1, 'agent_available': 1, 'forest_available': 1},
+                            {'id': 2, 'agent_available': 0, 'forest_available': 0},
+                            {'id': 3, 'agent_available': 0, 'forest_available': 0}])
+        with open(self.all_host_file) as f:
+            assert_equal(len(f.readlines()), 3)
+
+    def test_2_cancel(self):
+        self.db.exec_query('INSERT INTO host (id, hostname, ip) VALUES (1, "host1", "10.0.0.1"), '
+                           '(2, "host2", "10.0.0.2"), (3, "host3", "10.0.0.3")')
+        hosts = self.db.exec_query('SELECT * FROM host ORDER BY id')
+
+        task = NotifyHostsTask(config.get_log('hunting_module'), self.db, hosts, self.script_path, self.all_host_file,
+                               concurrency=1, timeout=1)
+        task.cancel()
+        task.task()
+
+        progress = task.get_progress()
+        assert_equal(progress['processed'], 0)
+        assert_equal(progress['cancelled'], 3)
+        with open(self.all_host_file) as f:
+            assert_equal(f.readlines(), [])
+
+
+class TestImportHostsJob(object):
+
+    def test_1_cancel_queued_job(self):
+        job = ImportHostsJob({'full_path': '/tmp/hosts.xlsx'})
+        assert_equal(job.to_dict()['status'], ImportHostsJob.STATUS_QUEUED)
+
+        assert_true(job.cancel())
+        assert_true(job.is_cancelled())
+        assert_equal(job.to_dict(), {'id': job.id, 'full_path': '/tmp/hosts.xlsx', 'status': 'cancelled', 'parsed': 0,
+                                     'inserted': 0, 'updated': 0, 'notified': 0, 'error': None})
+        assert_equal(job.cancel(), False)
+
+    def test_2_evict_ended_jobs(self):
+        jobs = OrderedDict()
+        for n in range(4):
+            job = ImportHostsJob({'full_path': '/tmp/hosts{}.xlsx'.format(n)})
+            jobs[job.id] = job
+        ids = list(jobs)
+        jobs[ids[0]].status = ImportHostsJob.STATUS_WORKING
+        jobs[ids[1]].status = ImportHostsJob.STATUS_FINISHED
+        jobs[ids[2]].status = ImportHostsJob.STATUS_FAILED
+
+        # The oldest ended job is dropped, the working one is kept
+        assert_equal(ImportHostsJob.evict_ended_jobs(jobs, 3), 1)
+        assert_equal(list(jobs), [ids[0], ids[2], ids[3]])
+        # Queued and working jobs are never dropped
+        assert_equal(ImportHostsJob.evict_ended_jobs(jobs, 1), 1)
+        assert_equal(list(jobs), [ids[0], ids[3]])
+
+
+class TestHostsLoader(object):
+    hosts_columns = ['hostname', 'ip', 'operating_system', 'channel_name']
+
+    def setup(self):
+        self.folder = tempfile.mkdtemp()
+        database = os.path.join(self.folder, 'hunting.db')
+        HuntingDatabase.create_hunting_database(database, SQL_SCRIPT)
+        self.connection = sqlite3.connect(database)
+        self.connection.row_factory = sqlite3.Row
+
+    def teardown(self):
+        self.connection.close()
+        shutil.rmtree(self.folder)
+
+    def get_hosts(self):
+        rows = self.connection.execute('SELECT hostname, ip, operating_system, channel_name, country, date_creation '
+                                       'FROM host ORDER BY ip, country')
+        return [dict(row) for row in rows]
+
+    def test_1_upsert_hosts(self):
+        self.connection.execute('INSERT INTO host (hostname, ip, channel_name, country, date_creation) VALUES '
+                                '("old1", "10.0.0.1", "channel1", "es", 1), ("other", "10.0.0.1", "channel1", "fr", 1)')
+        self.connection.commit()
+
+        rows = [('host1', '10.0.0.1', 'linux', 'channel2'), ('host2', '10.0.0.2', None, None),
+                ('repeated', '10.0.0.2', 'linux', 'channel2'), ('host3', 'not an ip', 'linux', 'channel2'),
+                ('host4', None, 'linux', 'channel2')]
+        loader = HostsLoader(self.connection, self.hosts_columns, country='es')
+
+        assert_equal(loader.load(iter(rows), 2), 2)
+        assert_equal(loader.parsed, 5)
+        assert_equal(self.get_hosts(), [
+            {'hostname': 'host1', 'ip': '10.0.0.1', 'operating_system': 'linux', 'channel_name': 'channel2',
+             'country': 'es', 'date_creation': 1},
+            {'hostname': 'other', 'ip': '10.0.0.1', 'operating_system': '', 'channel_name': 'channel1',
+             'country': 'fr', 'date_creation': 1},
+            {'hostname': 'host2', 'ip': '10.0.0.2', 'operating_system': '', 'channel_name': 'unknown',
+             'country': 'es', 'date_creation': 2}])
+
+    def test_2_cancelled_job(self):
+        job = ImportHostsJob({'full_path': 'hosts.xlsx'})
+        rows = [('host1', '10.0.0.1', 'linux', 'channel1'), ('host2', '10.0.0.2', 'linux', 'channel1')]
+
+        def cancel_after_first_row():
+            yield rows[0]
+            job.cancel()
+            yield rows[1]
+
+        loader = HostsLoader(self.connection, self.hosts_columns, country='es', job=job)
+
+        assert_equal(loader.load(cancel_after_first_row(), 1), 0)
+        assert_equal(self.get_hosts(), [])
+
+
+class TestJsonStream(object):
+
+    def test_1_iter_json_list(self):
+        batches = [[{'id': 1, 'hostname': 'host1'}, {'id': 2, 'hostname': 'hóst2'}], [], [{'id': 3, 'hostname': None}]]
+        rows = [row for batch in batches for row in batch]
+
+        assert_equal(''.join(iter_json_list(batches)), json.dumps(rows))
+        assert_equal(''.join(iter_json_list([])), json.dumps([]))
+
+
+class TestUpdateHostsChannel(object):
+
+    def setup(self):
+        self.database_module = HuntingModule.database_module
+        HuntingModule.database_module = SqliteDatabase(SQL_SCRIPT)
+        # Only the database of the module is needed
+        self.module = HuntingModule.__new__(HuntingModule)
+
+    def teardown(self):
+        HuntingModule.database_module = self.database_module
+
+    def test_1_update_hosts_channel(self):
+        db = HuntingModule.database_module
+        db.exec_query('INSERT INTO channel (name) VALUES ("channel1"), ("channel2")')
+        db.exec_query('INSERT INTO host (id, hostname, ip, channel_name) VALUES (1, "host1", "10.0.0.1", "channel1"), '
+                      '(2, "host2", "10.0.0.2", "channel2")')
+
+        self.module.update_hosts_channel('channel1', 'channel3')
+
+        assert_equal(db.exec_query('SELECT hostname, channel_name FROM host ORDER BY id'),
+                     [{'hostname': 'host1', 'channel_name': 'channel3'},
+                      {'hostname': 'host2', 'channel_name': 'channel2'}])
+        assert_equal(db.exec_query('SELECT host_name, channel_name, status FROM historical_host'),
+                     [{'host_name': 'host1', 'channel_name': 'channel1', 'status': 'CHANGE_CHANNEL'}])
+        assert_equal(db.exec_query('SELECT name FROM channel ORDER BY name'),
+                     [{'name': 'channel1'}, {'name': 'channel2'}, {'name': 'channel3'}])
@@ -1,7 +1,8 @@
 import logging
 import json
 
-from flask import jsonify, request
+from flask import Response, jsonify, request, stream_with_context
+from flask_classful import route
 
 from common.module import ViewModule, authenticate
 from common.infra_tools.decorators import log_function
@@ -14,6 +15,31 @@ from sky_modules.hunting_module import MODULE_NAME
 logger = logging.getLogger(MODULE_NAME)
 
 
+def iter_json_list(batches):
+    """
+    Serialize batches of rows as one json list, chunk by chunk. The result is the same text as json.dumps of the list
+    of all the rows.
+    :param batches: iterable of lists of rows
+    :return: generator of strings
+    """
+    yield '['
+    separator = ''
+    for batch in batches:
+        if len(batch) > 0:
+            yield separator + ', '.join(json.dumps(row) for row in batch)
+            separator = ', '
+    yield ']'
+
+
+def json_stream_response(batches) -> Response:
+    """
+    Response with the json list of the rows sent while they are read from database.
+    :param batches: iterable of lists of rows
+    :return: streamed response
+    """
+    return Response(stream_with_context(iter_json_list(batches)), mimetype='application/json')
+
+
 # @authenticate()
 class HuntingModuleChannelView(ViewModule):
     excluded_methods = ["return200"]
@@ -74,31 +100,60 @@ class HuntingModuleChannelView(ViewModule):
 class HuntingModuleHostView(ViewModule):
     excluded_methods = ["return200"]
 
-    # get all hosts info
+    # get all hosts info, streamed in batches
     @log_function(logger)
     def hosts(self):
-        hosts = self.app_module.get_host_data()
-
-        return json.dumps(hosts, ensure_ascii=True)
+        return json_stream_response(self.app_module.iter_host_data())
 
 
-    # read csv with hosts from file path and store in database
+    # queue the import of the xlsx with hosts from file path, the job id is returned to follow it
     @log_function(logger)
     def post(self):
-        loaded = False
+        job_id = None
 
         try:
             xlsx_params = request.json
-            loaded = self.app_module.load_hosts_xlsx(xlsx_params)
-        except Exception as e:
-            pass
+            job = self.app_module.submit_hosts_import(xlsx_params)
+            job_id = job.id
+        except Exception:
+            logger.error('Error queuing the import of hosts', exc_info=True)
 
         # success = self.return200(loaded, errors_file_path=errors_full_path)
-        success = self.return200(loaded)
+        success = self.return200(job_id is not None, job_id=job_id)
 
         return success
 
 
+    # status and counters of an import job
+    @log_function(logger)
+    def jobs(self, job_id):
+        job = self.app_module.get_import_job(job_id)
+
+        if job is None:
+            resp = jsonify(success=False, job_id=job_id)
+            resp.status_code = 404
+            return resp
+
+        return json.dumps(job)
+
+
+    # cancel an import job
+    @route('/jobs/<job_id>/', methods=['DELETE'])
+    @log_function(logger)
+    def cancel_job(self, job_id):
+        cancelled = self.app_module.cancel_import_job(job_id)
+
+        return self.return200(cancelled, job_id=job_id)
+
+
+    # progress of the notification to forest of the last imported hosts
+    @log_function(logger)
+    def notification(self):
+        progress = self.app_module.get_notification_progress()
+
+        return json.dumps(progress)
+
+
     # change host channels from channel1 to channel2
     @log_function(logger)
     def put(self):
@@ -116,8 +171,8 @@ class HuntingModuleHostView(ViewModule):
 
 
     @log_function(logger)
-    def return200(self, success: bool, errors_file_path=None):
-        resp = jsonify(success=success, errors_file_path=errors_file_path)
+    def return200(self, success: bool, errors_file_path=None, job_id=None):
+        resp = jsonify(success=success, errors_file_path=errors_file_path, job_id=job_id)
         resp.status_code = 200
 
         return resp
@@ -200,8 +255,7 @@ class HuntingModuleReportView(ViewModule):
         return json.dumps(result)
 
     def hits(self):
-        result = self.app_module.get_report_hits()
-        return json.dumps(result)
+        return json_stream_response(self.app_module.iter_report_hits())
 
     def progress(self):
         result = self.app_module.get_report_session_working()
@@ -14,6 +14,7 @@ module_shell_names = {
 # Categories
 CAT_TEST = 'Test'
 CAT_FORENSIC = 'Forensic tools'
+CAT_HUNTING = 'Hunting'
 
 
 def get_product_shells() -> list:
@@ -0,0 +1,71 @@
+"""
+Benchmark of read throughput of DatabaseSqlAlchemy with 1, 4 and 16 concurrent clients. The pool of one connection
+serializes the clients as the connection shared by all the threads did; the pool of 16 connections checks out one for
+each client. sqlite releases the GIL while it runs a query, so the clients of different connections read in parallel
+when there are cores for them.
+
+Run from the root of the project:
+    python -m test_standalone.bench_database_pool 2000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from common.infra_modules.database_module.impl.database_sqlalchemy import DatabaseSqlAlchemy
+
+
+CLIENTS = [1, 4, 16]
+POOLS = [('shared', 1), ('pooled', 16)]
+ROWS = 100000
+CATEGORIES = 100
+
+
+def create_database(path: str) -> None:
+    db = DatabaseSqlAlchemy('sqlite:///' + path)
+    db.exec_query('CREATE TABLE item (id INTEGER PRIMARY KEY, category INTEGER, value INTEGER)')
+    db.insert_many('item', ({'category': n % CATEGORIES, 'value': n} for n in range(ROWS)))
+    db.engine.dispose()
+
+
+def client(db, queries: int, offset: int) -> None:
+    for n in range(queries):
+        db.exec_query('SELECT COUNT(*) AS total, SUM(value) AS value FROM item WHERE category=:category',
+                      {'category': (offset + n) % CATEGORIES})
+
+
+def timed_reads(db, clients: int, queries: int) -> float:
+    threads = [threading.Thread(target=client, args=(db, queries // clients, n)) for n in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return (queries // clients) * clients / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the pool of connections of DatabaseSqlAlchemy')
+    parser.add_argument('queries', nargs='?', type=int, default=2000)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, 'bench.db')
+        create_database(path)
+
+        print('{:>8} {:>8} {:>16}'.format('pool', 'clients', 'queries/s'))
+        for name, pool_size in POOLS:
+            db = DatabaseSqlAlchemy('sqlite:///' + path, pool_size)
+            for clients in CLIENTS:
+                print('{:>8} {:>8} {:>16.1f}'.format(name, clients, timed_reads(db, clients, args.queries)))
+            db.engine.dispose()
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
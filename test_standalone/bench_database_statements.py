@@ -0,0 +1,107 @@
+"""
+Benchmark of DatabaseSqlAlchemy with values formatted in the query against bound parameters and registered statements.
+The driver keeps a cache of prepared statements by query text (sqlite3 caches 128 per connection), so the hit rate is
+measured replaying the executed queries over a LRU cache of that size. Sync to disk is disabled, so the latency is the
+cost of preparing and running the statements.
+
+Run from the root of the project:
+    python -m test_standalone.bench_database_statements 20000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+
+import sqlalchemy
+
+from common.infra_modules.database_module.impl.database_sqlalchemy import DatabaseSqlAlchemy
+
+
+CACHED_STATEMENTS = 128
+
+
+class StatementCacheStats:
+    """
+    LRU cache of query texts fed by the engine events, equivalent to the statement cache of the driver
+    """
+
+    def __init__(self, engine, size: int = CACHED_STATEMENTS) -> None:
+        self.size = size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        sqlalchemy.event.listen(engine, 'before_cursor_execute', self.on_execute)
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if statement in self.cache:
+            self.cache.move_to_end(statement)
+            self.hits = self.hits + 1
+        else:
+            self.cache[statement] = True
+            self.misses = self.misses + 1
+            if len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+
+    def reset(self) -> None:
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return 100.0 * self.hits / total if total > 0 else 0.0
+
+
+def formatted(db, n: int) -> None:
+    db.exec_query('SELECT * FROM session WHERE channel_name="channel{}" AND status="working"'.format(n % 500))
+    db.exec_query('UPDATE session SET current_evos={} WHERE id={}'.format(n, n % 500 + 1))
+
+
+def bound(db, n: int) -> None:
+    db.exec_query('SELECT * FROM session WHERE channel_name=:channel_name AND status=:status',
+                  {'channel_name': 'channel{}'.format(n % 500), 'status': 'working'})
+    db.exec_query('UPDATE session SET current_evos=:current_evos WHERE id=:id', {'current_evos': n, 'id': n % 500 + 1})
+
+
+def registered(db, n: int) -> None:
+    db.exec_statement('select_session', {'channel_name': 'channel{}'.format(n % 500), 'status': 'working'})
+    db.exec_statement('update_session', {'current_evos': n, 'id': n % 500 + 1})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of bound parameters in DatabaseSqlAlchemy')
+    parser.add_argument('iterations', nargs='?', type=int, default=20000)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    try:
+        db = DatabaseSqlAlchemy('sqlite:///' + os.path.join(folder, 'bench.db'))
+        db.exec_query('PRAGMA synchronous=OFF')
+        db.exec_query('CREATE TABLE session (id INTEGER PRIMARY KEY, channel_name TEXT, status TEXT, '
+                      'current_evos INTEGER DEFAULT 0)')
+        db.exec_query('CREATE INDEX ix_session_channel_name ON session(channel_name)')
+        db.exec_many('INSERT INTO session (channel_name, status) VALUES (:channel_name, :status)',
+                     [{'channel_name': 'channel{}'.format(n), 'status': 'working'} for n in range(500)])
+        db.register_statement('select_session',
+                              'SELECT * FROM session WHERE channel_name=:channel_name AND status=:status')
+        db.register_statement('update_session', 'UPDATE session SET current_evos=:current_evos WHERE id=:id')
+
+        stats = StatementCacheStats(db.engine)
+        print('{:>12} {:>16} {:>14}'.format('mode', 'latency (us)', 'cache hits %'))
+        for name, run in (('formatted', formatted), ('bound', bound), ('registered', registered)):
+            stats.reset()
+            start = time.perf_counter()
+            for n in range(args.iterations):
+                run(db, n)
+            elapsed = time.perf_counter() - start
+
+            latency = elapsed / (args.iterations * 2) * 1000000
+            print('{:>12} {:>16.1f} {:>14.1f}'.format(name, latency, stats.hit_rate()))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
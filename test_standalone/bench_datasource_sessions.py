@@ -0,0 +1,98 @@
+"""
+Benchmark of the throughput of the /ds list methods of DatasourceModule with 1, 8 and 32 concurrent clients. In the
+serialized mode every call holds one lock, as the session shared by all the threads allowed at best; in the scoped
+mode each client works with its own session and a connection of the pool.
+
+Run from the root of the project:
+    python -m test_standalone.bench_datasource_sessions 2000
+"""
+import argparse
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from common.app_model import AppException
+from sky_modules.datasource_module import MODULE_NAME
+from sky_modules.datasource_module.datasource_module import DatasourceModule
+
+
+CLIENTS = [1, 8, 32]
+MODES = ['serialized', 'scoped']
+UPLOADS = 20
+FILES = 50
+
+
+class BenchConfig:
+    """
+    Configuration of the module for the benchmark, with its database in a temporary folder
+    """
+
+    def __init__(self, values: dict) -> None:
+        self.values = values
+
+    def get_value(self, section: str, key: str) -> str:
+        if key not in self.values:
+            raise AppException('No value for {} in {}'.format(key, section))
+        return self.values[key]
+
+
+def create_data(module: DatasourceModule) -> None:
+    permission = module.create_permission('read', 'read evidences')[0]
+    role = module.create_role('analyst', 'analyst', [permission])[0]
+    user = module.create_user('analyst', 'password', 'first', 'family', 'mail', [role])[0]
+    evidence = module.create_evidence('evidence', 1.0, user)[0]
+    for n in range(UPLOADS):
+        upload = module.create_upload('upload {}'.format(n), 1.0, 'type', evidence)[0]
+        for m in range(FILES):
+            module.create_file('path {}'.format(m), 1.0, 'file {}'.format(m), 'md5', 'sha256', upload)
+
+
+def client(module: DatasourceModule, calls: int, offset: int, lock) -> None:
+    for n in range(calls):
+        upload_id = (offset + n) % UPLOADS + 1
+        if lock is None:
+            module.get_all_files(upload_id, limit=FILES)
+        else:
+            with lock:
+                module.get_all_files(upload_id, limit=FILES)
+
+
+def timed_calls(module: DatasourceModule, clients: int, calls: int, lock) -> float:
+    threads = [threading.Thread(target=client, args=(module, calls // clients, n, lock)) for n in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return (calls // clients) * clients / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the sessions of DatasourceModule')
+    parser.add_argument('calls', nargs='?', type=int, default=2000)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    try:
+        url = 'sqlite:///{}?check_same_thread=False'.format(os.path.join(folder, 'bench.db'))
+        module = DatasourceModule(BenchConfig({'connection_database': url, 'pool_size': '32'}), MODULE_NAME)
+        start = datetime.datetime.now()
+        create_data(module)
+        print('{} files created in {}'.format(UPLOADS * FILES, datetime.datetime.now() - start))
+
+        print('{:>12} {:>8} {:>16}'.format('mode', 'clients', 'calls/s'))
+        for mode in MODES:
+            lock = threading.Lock() if mode == 'serialized' else None
+            for clients in CLIENTS:
+                print('{:>12} {:>8} {:>16.1f}'.format(mode, clients, timed_calls(module, clients, args.calls, lock)))
+        module.engine.dispose()
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark of the import of hosts from xlsx: streaming read of the spreadsheet and upsert by (ip, country) in table host.
+For each size it times a first import (all hosts are new) and a second import of the same file (all hosts exist).
+
+Run from the root of the project:
+    python -m test_standalone.bench_hosts_upsert 10000 100000 1000000
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import openpyxl
+
+from sky_modules.hunting_module.hosts_loader import HostsLoader
+from sky_modules.hunting_module.load_hunting_database import HuntingDatabase
+
+
+SQL_SCRIPT = os.path.join(os.path.dirname(__file__), '..', 'etc', 'database.sql')
+XLSX_COLUMNS = ['Hostname', 'IP', 'S.O.', 'Canal']
+HOSTS_COLUMNS = ['hostname', 'ip', 'operating_system', 'channel_name']
+
+
+def create_xlsx(path: str, size: int) -> None:
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(XLSX_COLUMNS)
+    for n in range(size):
+        ip = '10.{}.{}.{}'.format((n >> 16) & 255, (n >> 8) & 255, n & 255)
+        sheet.append(['host{}'.format(n), ip, 'linux', 'channel{}'.format(n % 50)])
+    workbook.save(path)
+
+
+def iter_xlsx(path: str):
+    # Same read as ParsingModule.iter_xlsx, without loading the module
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    rows = workbook.worksheets[0].iter_rows(values_only=True)
+    next(rows)
+    for row in rows:
+        yield row
+    workbook.close()
+
+
+def timed_import(database: str, xlsx_path: str) -> (float, int):
+    connection = sqlite3.connect(database)
+    start = time.perf_counter()
+    upserted = HostsLoader(connection, HOSTS_COLUMNS, country='es').load(iter_xlsx(xlsx_path), 20190101000000)
+    elapsed = time.perf_counter() - start
+    connection.close()
+    return elapsed, upserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the xlsx hosts upsert')
+    parser.add_argument('sizes', nargs='*', type=int, default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    try:
+        print('{:>10} {:>12} {:>12} {:>12}'.format('hosts', 'xlsx (s)', 'insert (s)', 'update (s)'))
+        for size in args.sizes:
+            xlsx_path = os.path.join(folder, 'hosts_{}.xlsx'.format(size))
+            database = os.path.join(folder, 'hunting_{}.db'.format(size))
+
+            start = time.perf_counter()
+            create_xlsx(xlsx_path, size)
+            xlsx_time = time.perf_counter() - start
+
+            HuntingDatabase.create_hunting_database(database, SQL_SCRIPT)
+            insert_time, inserted = timed_import(database, xlsx_path)
+            update_time, updated = timed_import(database, xlsx_path)
+            assert inserted == updated == size
+
+            print('{:>10} {:>12.2f} {:>12.2f} {:>12.2f}'.format(size, xlsx_time, insert_time, update_time))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()